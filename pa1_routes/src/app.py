@@ -1,55 +1,352 @@
+import base64
+import functools
 import json
-import re
+import os
+import time
+from itertools import islice
 
 from flask import Flask
+from flask import Response
 from flask import jsonify
+from flask import make_response
 from flask import request
 
+import archive
+import search
+import sqlite_store
+import store
+import validators
+import wal
+
 app = Flask(__name__)
 
-# all stored posts.
-posts = {
-    0: {
+"""
+open the write-ahead log if durability is enabled, i.e. PA1_WAL_DIR is set.
+    PA1_WAL_DIR -- directory of the log and snapshots.
+    PA1_WAL_SYNC_EVERY -- fsync once per this many mutations, 0 to never fsync (default 1).
+    PA1_SNAPSHOT_EVERY -- take a snapshot every this many mutations, 0 to disable (default 100000).
+"""
+def open_wal():
+    directory = os.environ.get("PA1_WAL_DIR")
+    if directory is None:
+        return None
+    return wal.WriteAheadLog(
+        directory,
+        sync_every=int(os.environ.get("PA1_WAL_SYNC_EVERY", 1)),
+        snapshot_every=int(os.environ.get("PA1_SNAPSHOT_EVERY", 100_000))
+    )
+
+# all stored posts and comments.
+"""
+structure of a post:
+{
+    "id": 0 (post_id),
+    "upvotes": 1,
+    "title": "My cat is the cutest!",
+    "link": "https://i.imgur.com/jseZqNK.jpg",
+    "username": "alicia98",
+    "created": 1700000000.0 (seconds since the epoch),
+    "expires": null (or the time the post expires at),
+}
+structure of a comment:
+{
+    "id": 0 (comment_id),
+    "upvotes": 8,
+    "text": "Wow, my first Reddit gold!",
+    "username": "alicia98",
+    "parent_id": null (or the id of the comment it replies to),
+}
+"""
+"""
+open the store selected by PA1_STORE:
+    memory (default) -- in-memory store, private to this process, see open_wal for durability.
+    sqlite -- SQLite database at PA1_SQLITE_PATH (default "pa1.db"), shared by every worker.
+the initial posts are only used when the store is empty.
+posts expire after their "ttl", or PA1_RETENTION_SECONDS after their creation
+if set, and are then appended to the NDJSON file PA1_ARCHIVE_PATH (default "pa1_archive.ndjson").
+"""
+def open_store(posts):
+    backend = os.environ.get("PA1_STORE", "memory")
+    retention = os.environ.get("PA1_RETENTION_SECONDS")
+    retention = None if retention is None else float(retention)
+    sink = archive.NdjsonArchive(os.environ.get("PA1_ARCHIVE_PATH", "pa1_archive.ndjson"))
+    if backend == "sqlite":
+        return sqlite_store.SqliteStore(
+            os.environ.get("PA1_SQLITE_PATH", "pa1.db"), posts=posts, retention=retention, archive=sink
+        )
+    if backend == "memory":
+        return store.PostStore(
+            wal=open_wal(),
+            posts=posts,
+            # sharded upvote counters, 0 to apply every vote at once.
+            upvote_shards=int(os.environ.get("PA1_UPVOTE_SHARDS", "0")),
+            flush_interval=float(os.environ.get("PA1_UPVOTE_FLUSH_INTERVAL", "0.05")),
+            retention=retention,
+            archive=sink,
+        )
+    raise ValueError(f"unknown PA1_STORE: {backend}")
+
+STORE = open_store(posts=[
+    {
         "id": 0,
         "upvotes": 1,
         "title": "My cat is the cutest!",
         "link": "https://i.imgur.com/jseZqNK.jpg",
         "username": "alicia98",
     },
-    1: {
+    {
         "id": 1,
         "upvotes": 3,
         "title": "Cat loaf",
         "link": "https://i.imgur.com/TJ46wX4.jpg",
         "username": "alicia98",
     }
-}
-# all stored comments.
-"""
-structure:
-comments_allposts = {
-    0 (post_id): {
-        0 (comment_id): {
-            "id": 0 (comment_id),
-            "upvotes": 8,
-            "text": "Wow, my first Reddit gold!",
-            "username": "alicia98",
-        },
-        1: {
-            ...
-        }
-    },
-    1: {
-        ...
-    }
-}
+])
+
+# reject new posts whose link was posted already, instead of only reporting them.
+REJECT_REPOSTS = os.environ.get("PA1_REJECT_REPOSTS") == "1"
+
+# number of posts encoded per chunk of a streamed response.
+STREAM_BATCH_SIZE = 100
+# deepest comment thread returned by one request.
+MAX_THREAD_DEPTH = 50
+
+"""
+encode the key of the last returned post into an opaque cursor.
+"kind" records which listing the cursor belongs to.
+"""
+def encode_cursor(kind, key):
+    raw = json.dumps([kind, key]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+"""
+decode a cursor created by encode_cursor for the listing "kind".
+return the key of the last returned post, or None if the cursor is invalid.
+"""
+def decode_cursor(kind, cursor):
+    try:
+        # restore the base64 padding stripped by encode_cursor.
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_kind, key = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if cursor_kind != kind:
+        return None
+    # ids are plain integers, sorted feed keys are (upvotes, post_id) or (hot score, post_id) pairs.
+    if type(key) is int:
+        return key
+    if type(key) is list and len(key) == 2 and type(key[0]) in (int, float) and type(key[1]) is int:
+        return tuple(key)
+    return None
+
+"""
+build the JSON object {key: [fragments...], **fields} from already encoded records.
+the output is the same as json.dumps would produce.
 """
-comments_allposts = {}
+def encode_list(key, fragments, **fields):
+    parts = [json.dumps(key) + ": [" + ", ".join(fragments) + "]"]
+    parts += [json.dumps(name) + ": " + json.dumps(value) for name, value in fields.items()]
+    return "{" + ", ".join(parts) + "}"
 
-# record next post's id.
-post_id_count = 2
-# record next comment's id.
-comment_id_count = 0
+"""
+check the query parameters of a GET route before it runs.
+    query_error() -- returns the error response of invalid query parameters, None if they are valid.
+the route itself can then rely on its parameters being valid.
+"""
+def checked(query_error):
+    def decorate(route):
+        @functools.wraps(route)
+        def checked_route(*args, **kwargs):
+            error = query_error()
+            if error is not None:
+                return error
+            return route(*args, **kwargs)
+        return checked_route
+    return decorate
+
+"""
+make a GET route conditional on a version of the store, see Store.version.
+    version(*route arguments) -- returns the version the response depends on,
+                                 None to run the route unconditionally.
+    query_error() -- checks the query parameters, see checked.
+successful responses carry the version as their ETag, and a request whose
+"If-None-Match" header holds the current ETag is answered with 304 before
+the route runs, so no record is read or encoded. the query parameters are
+checked first: a request the route would reject is never answered with 304.
+the version is read before the route runs: if a write lands in between,
+the response is newer than its ETag, so it is only sent once more.
+"""
+def conditional(version, query_error=None):
+    def decorate(route):
+        @functools.wraps(route)
+        def conditional_route(*args, **kwargs):
+            etag = version(*args, **kwargs)
+            if etag is None:
+                return route(*args, **kwargs)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            response = make_response(route(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        if query_error is not None:
+            return checked(query_error)(conditional_route)
+        return conditional_route
+    return decorate
+
+"""
+stream a JSON object {name: [...]} chunk by chunk.
+each batch of keys is looked up again from the last returned key,
+so the whole payload is never held in memory.
+"""
+def stream_posts(keys_after, to_json, cursor_key, name="posts"):
+    def generate():
+        key = cursor_key
+        separator = ""
+        yield "{" + json.dumps(name) + ": ["
+        while True:
+            keys = list(islice(keys_after(key), STREAM_BATCH_SIZE))
+            if not keys:
+                break
+            key = keys[-1]
+            # skip posts deleted since their key was read.
+            fragments = [fragment for fragment in map(to_json, keys) if fragment is not None]
+            if not fragments:
+                continue
+            yield separator + ", ".join(fragments)
+            separator = ", "
+        yield "]}"
+    return Response(generate(), status=200, mimetype="application/json")
+
+"""
+list posts in order, honoring the pagination query parameters.
+    keys_after(key) -- yields the keys of the posts after "key" in order (from the beginning if None).
+    kind -- name of the listing, recorded in cursors.
+    to_json(key) -- returns the JSON encoding of a post, None if it was deleted.
+    name -- key of the list in the response, to list comments the same way.
+query parameters:
+    limit -- maximum number of posts to return, a "next_cursor" is added to the response.
+    cursor -- resume after the last post of a previous page.
+    stream -- if "true", stream every post instead of returning a page.
+the route checks them beforehand with listing_error(kind), see checked.
+"""
+def list_posts(keys_after, kind, to_json, name="posts"):
+    # get the optional maximum number of posts to return.
+    limit = request.args.get("limit", default=None, type=int)
+    # get the optional cursor of the previous page.
+    cursor = request.args.get("cursor")
+    cursor_key = None if cursor is None else decode_cursor(kind, cursor)
+    # stream every post after the cursor.
+    if request.args.get("stream") == "true":
+        return stream_posts(keys_after, to_json, cursor_key, name)
+    keys = keys_after(cursor_key)
+    # without a limit, return every post after the cursor.
+    if limit is None:
+        res = [fragment for fragment in map(to_json, keys) if fragment is not None]
+        return encode_list(name, res), 200
+    # fetch one extra key to know whether there is a next page.
+    keys = list(islice(keys, limit + 1))
+    next_cursor = None
+    if len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_cursor(kind, keys[-1])
+    res = [fragment for fragment in map(to_json, keys) if fragment is not None]
+    return encode_list(name, res, next_cursor=next_cursor), 200
+
+"""
+check the pagination query parameters of list_posts for the listing "kind".
+return the error response of the first invalid one, None if they are valid.
+"""
+def listing_error(kind):
+    limit = request.args.get("limit", default=None, type=int)
+    if "limit" in request.args and (limit is None or limit < 1):
+        return json.dumps({"error": "bad request: limit must be a positive integer"}), 400
+    cursor = request.args.get("cursor")
+    if cursor is not None and decode_cursor(kind, cursor) is None:
+        return json.dumps({"error": "bad request: invalid cursor"}), 400
+    if request.args.get("stream") == "true" and limit is not None:
+        return json.dumps({"error": "bad request: stream can't be combined with limit"}), 400
+    return None
+
+"""
+encode the replies to a comment as a JSON list, or the top-level comments
+of the post if parent_id is None, most upvoted first.
+every comment gets its own "replies", down to "depth" levels, and at most
+"limit" comments are returned per level (all of them if limit is None).
+"more_replies" is true if some replies of a comment were left out.
+only the comments in that window are read, whatever the size of the thread.
+return the list of encoded comments, and whether comments were left out.
+"""
+def encode_thread(post_id, parent_id, depth, limit):
+    # fetch one extra key to know whether comments were left out.
+    keys = list(STORE.reply_keys(post_id, parent_id, None if limit is None else limit + 1))
+    more = limit is not None and len(keys) > limit
+    fragments = []
+    for _, comment_id in keys[:limit]:
+        comment = STORE.get_comment_json(post_id, comment_id)
+        # skip comments deleted with their post since their key was read.
+        if comment is None:
+            continue
+        if depth > 1:
+            replies, more_replies = encode_thread(post_id, comment_id, depth - 1, limit)
+        else:
+            # below the last level, only look whether there are replies at all.
+            replies, more_replies = [], any(True for _ in STORE.reply_keys(post_id, comment_id, 1))
+        fragments.append(
+            comment[:-1] + ', "replies": [' + ", ".join(replies) + '], "more_replies": '
+            + json.dumps(more_replies) + "}"
+        )
+    return fragments, more
+
+"""
+store a new post and return the response of the create routes.
+a post whose link normalises like the link of earlier posts is a repost:
+the response lists the earlier post ids in "repost_of", or, if
+PA1_REJECT_REPOSTS is set, the post is rejected with the status code 409.
+"ttl" is the optional number of seconds after which the post expires.
+"""
+def store_post(title, link, username, ttl=None):
+    # usernames are interned by the records, so they must be strings.
+    if type(username) is not str:
+        return json.dumps({"error": "bad request: username must be a string"}), 400
+    # titles are tokenized for search, so they must be strings, and so must links.
+    if type(title) is not str or type(link) is not str:
+        return json.dumps({"error": "bad request: title and link must be strings"}), 400
+    # the time to live must be a positive number of seconds.
+    if ttl is not None and (type(ttl) not in (int, float) or not 0 < ttl < float("inf")):
+        return json.dumps({"error": "bad request: ttl must be a positive number of seconds"}), 400
+    earlier = STORE.link_post_ids(link)
+    post = STORE.create_post(title, link, username, reject_repost=REJECT_REPOSTS, ttl=ttl)
+    if post is None:
+        return json.dumps({"error": "conflict: link already posted", "repost_of": STORE.link_post_ids(link)}), 409
+    if earlier:
+        post = dict(post, repost_of=earlier)
+    return json.dumps(post), 201
+
+"""
+store a new comment, or a reply to the comment "parent_id" of the same post,
+and return the response of the create routes.
+"""
+def store_comment(post_id, text, username, parent_id):
+    # usernames are interned by the records, so they must be strings.
+    if type(username) is not str:
+        return json.dumps({"error": "bad request error: username must be a string"}), 400
+    # texts are tokenized for search, so they must be strings.
+    if type(text) is not str:
+        return json.dumps({"error": "bad request error: text must be a string"}), 400
+    # the parent must be a comment id, null for a top-level comment.
+    if parent_id is not None and type(parent_id) is not int:
+        return json.dumps({"error": "bad request error: parent_id must be a comment id"}), 400
+    if parent_id is not None and STORE.get_comment_json(post_id, parent_id) is None:
+        return json.dumps({"error": "not found error: the parent comment doesn't exist"}), 404
+    comment = STORE.create_comment(post_id, text, username, parent_id)
+    # the post may have been deleted in the meantime.
+    if comment is None:
+        return json.dumps({"error": "post not found"}), 404
+    # return the comment with the status code of 201.
+    return json.dumps(comment), 201
 
 """
 greeting.
@@ -63,18 +360,33 @@ def hello_world():
 
 """
 get all posts.
+supports "limit" / "cursor" pagination and "stream=true" for full exports,
+and "link" to get only the posts of a link, compared in normalised form.
+conditional on the version of the store.
 """
+def posts_query_error():
+    # the posts of a link aren't paginated.
+    if "link" in request.args:
+        return None
+    return listing_error("id")
+
 @app.route("/api/posts/")
+@conditional(lambda: STORE.version(), posts_query_error)
 def get_posts():
-    # return all posts.
-    return json.dumps({"posts": list(posts.values())}), 200
+    # look the link up in the normalised link index.
+    link = request.args.get("link")
+    if link is not None:
+        post_ids = STORE.link_post_ids(link)
+        posts = [post for post in map(STORE.get_post_json, post_ids) if post is not None]
+        return encode_list("posts", posts), 200
+    # return all posts, or one page of them.
+    return list_posts(STORE.post_keys, "id", STORE.get_post_json)
 
 """
-create a post and update "posts" dictionary.
+create a post and add it to the store.
 """
 @app.route("/api/posts/", methods = ["POST"])
 def create_post():
-    global post_id_count
     # retrieve the new post.
     body = json.loads(request.data)
     # Check to ensure body is not None.
@@ -88,65 +400,93 @@ def create_post():
     if title is None or link is None or username is None:
         # report the bad request error with the status code of 400.
         return json.dumps({"error": "bad request: messages are incomplete"}), 400
-    # initialize a new task.
-    post = {
-        "id": post_id_count,
-        "upvotes": 1, # default the upvotes of the new post to 1.
-        "title": title,
-        "link": link,
-        "username": username
-    }
-    # update the posts dictionary.
-    posts[post_id_count] = post
-    # increment the id_count.
-    post_id_count += 1
-    return json.dumps(post), 201
+    # store a new post with a freshly allocated id.
+    return store_post(title, link, username, body.get("ttl"))
 
 """
 get one post by its id.
+conditional on the version of the post.
 """
 @app.route("/api/posts/<int:post_id>/")
+@conditional(lambda post_id: STORE.post_version(post_id))
 def get_post(post_id):
-    # get the post by post_id.
-    post = posts.get(post_id)
+    # get the (already encoded) post by post_id.
+    post = STORE.get_post_json(post_id)
     # if the post doesn't exist.
     # report the not found error message with the status code of 404.
     if post is None:
         return json.dumps({"error": "post not found"}), 404
     # if the post exists, return the post and the status code of 200.
-    return json.dumps(post), 200
+    return post, 200
 
 """
 delete a post by its id.
 """
 @app.route("/api/posts/<int:post_id>/", methods = ["DELETE"])
 def delete_post(post_id):
-    # get the post from posts dictionary by id.
-    post = posts.get(post_id)
+    # delete the post from the store by id.
+    post = STORE.delete_post(post_id)
     # if the post doesn't exist.
     # report the not found error message with the status code of 404.
     if post is None:
         return json.dumps({"error": "post not found"}), 404
-    # if the post exists.
-    # delete it from the posts dictionary.
-    # and return the post and the status code of 200.
-    del posts[post_id]
+    # if the post existed, return the post and the status code of 200.
     return json.dumps(post), 200
 
 """
 get comments for a specific post.
+supports "sort=top|new" ordering and "limit" / "cursor" pagination,
+so that a page of a post with many comments only reads that page.
+with "depth", return the threads of replies instead, see encode_thread:
+"limit" is then the number of comments per level.
+conditional on the version of the post, which covers its comments.
 """
+def comments_query_error():
+    # get the optional ordering: most upvoted or newest first.
+    sort = request.args.get("sort")
+    if sort not in (None, "top", "new"):
+        return json.dumps({"error": "bad request: sort must be top or new"}), 400
+    if "depth" not in request.args:
+        return listing_error(f"comments-{sort or 'id'}")
+    depth = request.args.get("depth", type=int)
+    if depth is None or not 1 <= depth <= MAX_THREAD_DEPTH:
+        return json.dumps({"error": f"bad request: depth must be an integer from 1 to {MAX_THREAD_DEPTH}"}), 400
+    limit = request.args.get("limit", type=int)
+    if "limit" in request.args and (limit is None or limit < 1):
+        return json.dumps({"error": "bad request: limit must be a positive integer"}), 400
+    if sort == "new" or "cursor" in request.args or "stream" in request.args:
+        return json.dumps({"error": "bad request: depth can't be combined with sort=new, cursor or stream"}), 400
+    return None
+
 @app.route("/api/posts/<int:post_id>/comments/")
+@conditional(lambda post_id: STORE.post_version(post_id), comments_query_error)
 def get_comments(post_id):
-    # retrieve comments by the post id.
-    comments_onepost = comments_allposts.get(post_id)
+    sort = request.args.get("sort")
     # if comments of that post doesn't exist,
     # report the not found error with the status code of 404.
-    if comments_onepost is None:
+    if not STORE.has_comments(post_id):
         return json.dumps({"error": "comments not found"}), 404
-    # if comments exist,
-    # return comments with the status code of 200.
-    return json.dumps({"comments": list(comments_onepost.values())}), 200
+    # return the threads of the post, each level most upvoted first.
+    if "depth" in request.args:
+        depth = request.args.get("depth", type=int)
+        limit = request.args.get("limit", type=int)
+        comments, more_comments = encode_thread(post_id, None, depth, limit)
+        return encode_list("comments", comments, more_comments=more_comments), 200
+    # without any listing parameter, return every comment in creation order.
+    if not request.args:
+        # retrieve the (already encoded) comments by the post id.
+        comments_onepost = STORE.get_comments_json(post_id)
+        if comments_onepost is None:
+            return json.dumps({"error": "comments not found"}), 404
+        return encode_list("comments", comments_onepost), 200
+    # otherwise, return the requested page of comments with the status code of 200.
+    return list_posts(
+        lambda key: STORE.comment_keys(post_id, key, sort),
+        f"comments-{sort or 'id'}",
+        # "top" keys are (upvotes, comment_id) pairs.
+        lambda key: STORE.get_comment_json(post_id, key[1] if sort == "top" else key),
+        name="comments",
+    )
 
 """
 Post a comment for a specific post.
@@ -154,11 +494,9 @@ Post a comment for a specific post.
 @app.route("/api/posts/<int:post_id>/comments/", methods = ["POST"])
 def create_comment(post_id):
     # check whether the post exists.
-    post = posts.get(post_id)
+    post = STORE.get_post(post_id)
     if post is None:
         return {"error": "post not found"}, 404
-    # get the global variable comment_id_count.
-    global comment_id_count
     # get the comment messages from the POST request.
     body = json.loads(request.data)
     # Check to ensure body is not None.
@@ -171,25 +509,8 @@ def create_comment(post_id):
     # report the bad request error with the status code of 400.
     if text is None or username is None:
         return json.dumps({"error": "bad request error: comment messages are incomplete"}), 400
-    # if messages are complete, create a dictionary of this comment info.
-    comment = {
-        "id":  comment_id_count,
-        "upvotes": 1, # default the upvotes of new comments to 1.
-        "text": text,
-        "username": username
-    }
-    # retrieve existing comments.
-    comments_onepost = comments_allposts.get(post_id)
-    # if there're no existing comments yet, initialize an empty dictionary.
-    if comments_onepost is None:
-        comments_onepost = {}
-    # add current comment to the dictionary.
-    comments_onepost[comment_id_count] = comment
-    comments_allposts[post_id] = comments_onepost
-    # increment the comment id count by 1.
-    comment_id_count += 1
-    # return the comment with the status code of 201.
-    return json.dumps(comment), 201
+    # if messages are complete, store the comment with a freshly allocated id.
+    return store_comment(post_id, text, username, body.get("parent_id"))
 
 """
 Edit a comment for a specific post.
@@ -207,24 +528,145 @@ def edit_comment(post_id, comment_id):
     # if the text is missing, report the bad request error with the status code of 400.
     if text is None:
         return json.dumps({"error": "bad request error: text is missing"}), 400
-    # get all comments by the post id.
-    comments_onepost = comments_allposts.get(post_id)
+    # texts are tokenized for search, so they must be strings.
+    if type(text) is not str:
+        return json.dumps({"error": "bad request error: text must be a string"}), 400
+    # check the post has comments.
     # if there're no comments for this post, report not found error with the status code of 404.
-    if comments_onepost is None:
+    if not STORE.has_comments(post_id):
         return json.dumps({"error": "not found error: no comments for the post"}), 404
-    # if comments exist, get the specific comment by the comment_id.
-    comment = comments_onepost.get(comment_id)
+    # if comments exist, change the text of the specific comment.
+    comment = STORE.edit_comment(post_id, comment_id, text)
     # if this comment doesn't exist, report not found error with the status code of 404.
     if comment is None:
         return json.dumps({"error": "not found error: this comment doesn't exist"}), 404
-    # if the comment exists, change the text.
-    comment["text"] = text
-    # update the comment.
-    comments_onepost[comment_id] = comment
-    comments_allposts[post_id] = comments_onepost
     # return the updated comment with the status code of 200.
     return json.dumps(comment), 200
 
+"""
+get a comment by its id alone, without knowing its post.
+the comment has a "post_id" field with the post it belongs to.
+"""
+@app.route("/api/comments/<int:comment_id>/")
+def get_comment_by_id(comment_id):
+    # resolve the comment through the comment id -> post id index.
+    comment = STORE.get_comment_with_post_json(comment_id)
+    # if the comment doesn't exist, report not found error with the status code of 404.
+    if comment is None:
+        return json.dumps({"error": "comment not found"}), 404
+    return comment, 200
+
+"""
+edit a comment by its id alone, without knowing its post.
+"""
+@app.route("/api/comments/<int:comment_id>/", methods = ["POST"])
+def edit_comment_by_id(comment_id):
+    # get the comment messages from the request.
+    body = json.loads(request.data)
+    # Check to ensure body is not None.
+    if body is None:
+        return json.dumps({"error": "No comment found!"}), 404
+    # if the text is missing, report the bad request error with the status code of 400.
+    text = body.get("text")
+    if text is None:
+        return json.dumps({"error": "bad request error: text is missing"}), 400
+    if type(text) is not str:
+        return json.dumps({"error": "bad request error: text must be a string"}), 400
+    # find the post of the comment, then edit it like edit_comment.
+    post_id = STORE.get_comment_post_id(comment_id)
+    comment = None if post_id is None else STORE.edit_comment(post_id, comment_id, text)
+    # the comment doesn't exist, or its post was deleted in the meantime.
+    if comment is None:
+        return json.dumps({"error": "comment not found"}), 404
+    return json.dumps({"post_id": post_id, **comment}), 200
+
+"""
+get the posts created by a user, in creation order.
+supports "limit" / "cursor" pagination and "stream=true", like get_posts.
+"""
+@app.route("/api/users/<username>/posts/")
+@checked(lambda: listing_error("user-posts"))
+def get_user_posts(username):
+    # read the posts straight from the user's index, no scan of the store.
+    return list_posts(lambda key: STORE.user_post_keys(username, key), "user-posts", STORE.get_post_json)
+
+"""
+get the comments created by a user, in creation order.
+every comment has a "post_id" field with the post it belongs to.
+supports "limit" / "cursor" pagination and "stream=true", like get_posts.
+"""
+@app.route("/api/users/<username>/comments/")
+@checked(lambda: listing_error("user-comments"))
+def get_user_comments(username):
+    # read the comments straight from the user's index, no scan of the store.
+    return list_posts(
+        lambda key: STORE.user_comment_keys(username, key),
+        "user-comments",
+        STORE.get_comment_with_post_json,
+        name="comments",
+    )
+
+"""
+search post titles and comment texts.
+returns the posts and comments containing every word of "q", best match first,
+with the same "limit" / "cursor" pagination as get_posts.
+"""
+def search_query_error():
+    # the query must contain at least one word.
+    query = request.args.get("q")
+    if query is None or not search.tokenize(query):
+        return json.dumps({"error": "bad request: q must contain a word"}), 400
+    return listing_error("search")
+
+@app.route("/api/search/", strict_slashes=False)
+@checked(search_query_error)
+def search_posts():
+    query = request.args.get("q")
+    return list_posts(
+        lambda key: STORE.search_keys(query, key),
+        "search",
+        lambda key: STORE.get_search_result_json(*key),
+        name="results",
+    )
+
+"""
+export the whole store as NDJSON, one record per line, see Store.export_lines:
+the counters first, then every post followed by its comments and voters.
+the records are read and sent in batches, never held in memory all at once.
+"""
+@app.route("/api/export/")
+def export_store():
+    def generate():
+        lines = map(json.dumps, STORE.export_lines())
+        while True:
+            batch = list(islice(lines, STREAM_BATCH_SIZE))
+            if not batch:
+                return
+            yield "\n".join(batch) + "\n"
+    return Response(generate(), status=200, mimetype="application/x-ndjson")
+
+"""
+import the NDJSON lines of an export in one pass, keeping the ids of the records.
+the body is read and parsed a batch of lines at a time, outside of the store's
+locks, and each batch is then stored at once, see Store.import_lines. the
+response reports the number of imported records, and the records imported per second.
+"""
+@app.route("/api/import/", methods = ["POST"])
+def import_store():
+    start = time.perf_counter()
+    lines = (json.loads(raw) for raw in iter(request.stream.readline, b"") if raw.strip())
+    try:
+        counts = STORE.import_lines(lines)
+    # malformed lines, taken ids and records of missing posts.
+    except (ValueError, KeyError, TypeError) as error:
+        return json.dumps({"error": f"bad request: invalid export line: {error}"}), 400
+    seconds = time.perf_counter() - start
+    return json.dumps({
+        "imported": counts,
+        "seconds": seconds,
+        "records_per_second": sum(counts.values()) / seconds,
+    }), 200
+
 """
 Belows are extra routes for challenge credits.
 """
@@ -233,12 +675,11 @@ Belows are extra routes for challenge credits.
 # Tier I.
 
 """
-create a post and update "posts" dictionary.
+create a post and add it to the store.
 check the type preconditions and logical preconditions.
 """
 @app.route("/api/extra/posts/", methods = ["POST"])
 def extra_create_post():
-    global post_id_count
     # retrieve the new post.
     body = json.loads(request.data)
     # Check to ensure body is not None.
@@ -257,23 +698,11 @@ def extra_create_post():
         # report the bad request error with the status code of 400 if the input type is wrong.
         return json.dumps({"error": "bad request error: input types are incorrect"}), 401 # This should be 400?
     # check logical precondition. (invalid URL)
-    pat = re.compile(r"(http(s)?://)?([\w-]+\.)+?[\w-]+[.com]+(/[/?%&=]*)?")
-    if (not re.fullmatch(pat, link)):
+    if not validators.is_valid_link(link):
         # report the bad request error with the status code of 400 if the link is invalid.
         return json.dumps({"error": "bad request error: invalid url"}), 400
-    # initialize a new task.
-    post = {
-        "id": post_id_count,
-        "upvotes": 1, # default the upvotes of the new post to 1.
-        "title": title,
-        "link": link,
-        "username": username
-    }
-    # update the posts dictionary.
-    posts[post_id_count] = post
-    # increment the id_count.
-    post_id_count += 1
-    return json.dumps(post), 201
+    # store a new post with a freshly allocated id.
+    return store_post(title, link, username, body.get("ttl"))
 
 """
 Post a comment for a specific post.
@@ -282,11 +711,9 @@ check the type preconditions and logical preconditions.
 @app.route("/api/extra/posts/<int:post_id>/comments/", methods = ["POST"])
 def extra_create_comment(post_id):
     # check whether the post exists.
-    post = posts.get(post_id)
+    post = STORE.get_post(post_id)
     if post is None:
         return {"error": "post not found"}, 404
-    # get the global variable comment_id_count.
-    global comment_id_count
     # get the comment messages from the POST request.
     body = json.loads(request.data)
     # Check to ensure body is not None.
@@ -303,25 +730,8 @@ def extra_create_comment(post_id):
     if (type(text) is not str or type(username) is not str):
         # if types are incorrect, report the bad request error with the status code of 400.
         return json.dumps({"error": "bad request error: incorrect input types"}), 401
-    # if messages are complete, create a dictionary of this comment info.
-    comment = {
-        "id":  comment_id_count,
-        "upvotes": 1, # default the upvotes of new comments to 1.
-        "text": text,
-        "username": username
-    }
-    # retrieve existing comments.
-    comments_onepost = comments_allposts.get(post_id)
-    # if there're no existing comments yet, initialize an empty dictionary.
-    if comments_onepost is None:
-        comments_onepost = {}
-    # add current comment to the dictionary.
-    comments_onepost[comment_id_count] = comment
-    comments_allposts[post_id] = comments_onepost
-    # increment the comment id count by 1.
-    comment_id_count += 1
-    # return the comment with the status code of 201.
-    return json.dumps(comment), 201
+    # if messages are complete, store the comment with a freshly allocated id.
+    return store_comment(post_id, text, username, body.get("parent_id"))
 
 """
 Edit a comment for a specific post.
@@ -344,21 +754,15 @@ def extra_edit_comment(post_id, comment_id):
     if type(text) is not str:
         # if the type is not str, report the bad request error with the status code of 400.
         return json.dumps({"error": "bad request error: invalid input type"}), 401
-    # get all comments by the post id.
-    comments_onepost = comments_allposts.get(post_id)
+    # check the post has comments.
     # if there're no comments for this post, report not found error with the status code of 404.
-    if comments_onepost is None:
+    if not STORE.has_comments(post_id):
         return json.dumps({"error": "not found error: no comments for the post"}), 404
-    # if comments exist, get the specific comment by the comment_id.
-    comment = comments_onepost.get(comment_id)
+    # if comments exist, change the text of the specific comment.
+    comment = STORE.edit_comment(post_id, comment_id, text)
     # if this comment doesn't exist, report not found error with the status code of 404.
     if comment is None:
         return json.dumps({"error": "not found error: this comment doesn't exist"}), 404
-    # if the comment exists, change the text.
-    comment["text"] = text
-    # update the comment.
-    comments_onepost[comment_id] = comment
-    comments_allposts[post_id] = comments_onepost
     # return the updated comment with the status code of 200.
     return json.dumps(comment), 200
 
@@ -367,53 +771,123 @@ def extra_edit_comment(post_id, comment_id):
 """
 increment the upvotes value of a post.
 check the type preconditions - must be int.
+with a "voter" in the body, the post gets one upvote per voter:
+a second vote by the same voter is rejected with 409.
 """
 @app.route("/api/extra/posts/<int:post_id>/", methods = ["POST"])
 def increment_post_upvotes(post_id):
     # get the post by id.
-    post = posts.get(post_id)
+    post = STORE.get_post(post_id)
     # if the post doesn't exist, report not found error (404).
     if post is None:
         return json.dumps({"error": "post not found"}), 404
     # get the request body.
     body = json.loads(request.data)
-    # if the requst body is None, increment the upvote by 1.
-    if body is None:
-        post["upvotes"] += 1
-        return json.dumps(post), 200
-    # if the upvote is not specified, increment by 1.
-    increment = body.get("upvotes")
+    # a vote by a known voter counts once.
+    voter = None if body is None else body.get("voter")
+    if voter is not None:
+        return vote_post(post_id, voter, body.get("upvotes", 1))
+    # if the requst body is None or the upvote is not specified, increment by 1.
+    increment = 1 if body is None else body.get("upvotes", 1)
     if increment is None:
-        post["upvotes"] += 1
-        return json.dumps(post), 200
+        increment = 1
     # check the type of upvotes - must be int.
     if type(increment) is not int:
         return json.dumps({"error": "input type incorrect"}), 400
-    # increment the upvote.
-    post["upvotes"] += increment
+    # increment the upvote atomically.
+    post = STORE.upvote_post(post_id, increment)
+    # the post may have been deleted in the meantime.
+    if post is None:
+        return json.dumps({"error": "post not found"}), 404
     # return the updated post with the status code 200.
     return json.dumps(post), 200
 
 """
-sort through URL parameters.
+record the vote of a voter on a post, at most once per voter.
 """
-@app.route("/api/extra/posts/")
-def get_sorted_posts():
+def vote_post(post_id, voter, upvotes):
+    # check the types - the voter must be a non-empty str, and votes count for 1.
+    if type(voter) is not str or not voter:
+        return json.dumps({"error": "input type incorrect"}), 400
+    if upvotes != 1:
+        return json.dumps({"error": "bad request: a voter adds exactly one upvote"}), 400
+    result = STORE.vote_post(post_id, voter)
+    # the post may have been deleted in the meantime.
+    if result is None:
+        return json.dumps({"error": "post not found"}), 404
+    post, voted = result
+    # report a duplicate vote with the status code 409.
+    if not voted:
+        return json.dumps({"error": "already voted", "post": post}), 409
+    return json.dumps(post), 200
+
+"""
+undo the vote of a voter on a post.
+"""
+@app.route("/api/extra/posts/<int:post_id>/votes/<voter>/", methods = ["DELETE"])
+def unvote_post(post_id, voter):
+    result = STORE.unvote_post(post_id, voter)
+    # if the post doesn't exist, report not found error (404).
+    if result is None:
+        return json.dumps({"error": "post not found"}), 404
+    post, unvoted = result
+    # if the voter hadn't voted, report not found error (404).
+    if not unvoted:
+        return json.dumps({"error": "vote not found"}), 404
+    # return the updated post with the status code 200.
+    return json.dumps(post), 200
+
+"""
+sort through URL parameters: "increasing" or "decreasing" upvotes,
+or "hot" for upvotes decayed by the age of the posts.
+conditional on the version of the store.
+"""
+def sorted_posts_query_error():
     # get the sorting instruction.
     sort = request.args.get("sort", default="*")
-    # check the type and content - must be str and one of the "increasing" and "decreasing".
-    if (type(sort) is not str or (sort!="increasing" and sort!="decreasing")):
+    # check the type and content - must be str and one of the "increasing", "decreasing" and "hot".
+    if (type(sort) is not str or (sort!="increasing" and sort!="decreasing" and sort!="hot")):
         return json.dumps({"error": "bad request"}), 400
-    # sort posts increasingly.
-    if sort == "increasing":
-        res = list(sorted(posts.values(), key = lambda value: value["upvotes"]))
-    # sort posts decreasingly.
-    else:
-        res = list(sorted(posts.values(), key = lambda value: value["upvotes"], reverse = True))
-    # return sorted posts.
-    return json.dumps({"posts": res}), 200
+    return listing_error(sort)
+
+@app.route("/api/extra/posts/")
+@conditional(lambda: STORE.version(), sorted_posts_query_error)
+def get_sorted_posts():
+    sort = request.args.get("sort")
+    # read the hottest posts first from the hot index, kept up to date on every vote.
+    if sort == "hot":
+        return list_posts(STORE.hot_keys, sort, lambda key: STORE.get_post_json(key[1]))
+    # read the posts straight from the upvotes index, no sorting needed.
+    # supports the same pagination parameters as get_posts.
+    return list_posts(
+        lambda key: STORE.upvote_keys(key, reverse=(sort == "decreasing")),
+        sort,
+        lambda key: STORE.get_post_json(key[1])
+    )
 
 # extra routes end.
 
+"""
+report the hit rate and the encoding time saved by the JSON fragment cache.
+"""
+@app.route("/debug/cache/")
+def get_cache_stats():
+    # only the in-memory store caches encoded records.
+    if STORE.cache_stats is None:
+        return json.dumps({"error": "the store has no JSON cache"}), 404
+    return json.dumps(STORE.cache_stats.to_dict()), 200
+
+"""
+report the live count and approximate bytes of every in-memory structure of the store.
+"""
+@app.route("/debug/memory/")
+def get_memory_stats():
+    # only the in-memory store keeps its data in this process.
+    stats = STORE.memory_stats()
+    if stats is None:
+        return json.dumps({"error": "the store keeps no data in memory"}), 404
+    total = sum(structure["bytes"] for structure in stats.values())
+    return json.dumps({"structures": stats, "total_bytes": total}), 200
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000, debug=True)
@@ -0,0 +1,36 @@
+import json
+import threading
+
+
+class NdjsonArchive(object):
+    """
+    Archival sink for expired posts: one JSON object per line,
+        {"post": {...}, "comments": [{...}, ...]}
+    appended to a file, which is opened on the first archived post.
+
+    Each post is written with a single write() in append mode, so several
+    workers can archive to the same file without interleaving their lines.
+    """
+
+    # Constructor.
+    # path -- file the posts are appended to, created if needed.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    # Append an expired post and its comments, as dicts.
+    def archive(self, post, comments):
+        line = (json.dumps({"post": post, "comments": comments}) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                # unbuffered, so that every line goes out in one write().
+                self._file = open(self.path, "ab", buffering=0)
+            self._file.write(line)
+
+    # Close the file, if it was opened.
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,69 @@
+"""
+Benchmark: latency of GET /api/posts/<post_id>/comments/ on one post as its
+number of comments grows, comparing
+    full -- every comment in creation order,
+    new -- the first page of the newest comments,
+    top -- the first page of the most upvoted comments,
+    top+1 -- the second page of the most upvoted comments, resumed from a cursor.
+
+Usage: python benchmarks/bench_comment_pages.py [page size]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import records
+import store
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+POST_ID = 0
+REPEAT = 20
+
+
+# Replace the app's store with one post holding n comments with random upvotes.
+def populate(n):
+    rng = random.Random(0)
+    app.STORE = store.PostStore(posts=[
+        {"id": POST_ID, "upvotes": 1, "title": "Hello, World!", "link": "cornellappdev.com", "username": "appdev"}
+    ])
+    for comment_id in range(n):
+        comment = records.Comment(comment_id, rng.randrange(1000), "First comment", "appdev")
+        app.STORE._insert_comment(POST_ID, comment)
+
+
+# Call the get_comments route for "url" and return (median seconds, response body).
+def measure(url):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        with app.app.test_request_context(url):
+            body = app.app.make_response(app.get_comments(POST_ID)).get_data(as_text=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2], body
+
+
+def main():
+    page = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    route = f"/api/posts/{POST_ID}/comments/"
+    print(f"{'comments':>10} {'mode':>7} {'latency (ms)':>13}")
+    for n in SIZES:
+        populate(n)
+        _, first_page = measure(f"{route}?sort=top&limit={page}")
+        cursor = json.loads(first_page)["next_cursor"]
+        for mode, url in [
+            ("full", route),
+            ("new", f"{route}?sort=new&limit={page}"),
+            ("top", f"{route}?sort=top&limit={page}"),
+            ("top+1", f"{route}?sort=top&limit={page}&cursor={cursor}"),
+        ]:
+            seconds, _ = measure(url)
+            print(f"{n:>10} {mode:>7} {seconds * 1e3:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
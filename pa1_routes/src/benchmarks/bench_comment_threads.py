@@ -0,0 +1,73 @@
+"""
+Benchmark: latency of GET /api/posts/<post_id>/comments/?depth=3&limit=20
+on one post as its number of comments grows. Comments form random threads:
+each comment replies to a random earlier comment, or is a top-level comment.
+The thread window is compared with the full listing of every comment.
+
+Usage: python benchmarks/bench_comment_threads.py [depth] [limit]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import records
+import store
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+POST_ID = 0
+REPEAT = 20
+# share of the comments that start a new thread.
+TOP_LEVEL_SHARE = 0.1
+
+
+# Replace the app's store with one post holding n threaded comments with random upvotes.
+def populate(n):
+    rng = random.Random(0)
+    app.STORE = store.PostStore(posts=[
+        {"id": POST_ID, "upvotes": 1, "title": "Hello, World!", "link": "cornellappdev.com", "username": "appdev"}
+    ])
+    for comment_id in range(n):
+        parent_id = None if comment_id == 0 or rng.random() < TOP_LEVEL_SHARE else rng.randrange(comment_id)
+        comment = records.Comment(comment_id, rng.randrange(1000), "First comment", "appdev", parent_id)
+        app.STORE._insert_comment(POST_ID, comment)
+
+
+# Call the get_comments route for "url" and return (median seconds, response body).
+def measure(url):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        with app.app.test_request_context(url):
+            body = app.app.make_response(app.get_comments(POST_ID)).get_data(as_text=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2], body
+
+
+# Number of comments in an encoded thread.
+def count(comments):
+    return sum(1 + count(comment.get("replies", [])) for comment in comments)
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    route = f"/api/posts/{POST_ID}/comments/"
+    print(f"{'comments':>10} {'mode':>7} {'returned':>9} {'latency (ms)':>13}")
+    for n in SIZES:
+        populate(n)
+        for mode, url in [
+            ("full", route),
+            ("thread", f"{route}?depth={depth}&limit={limit}"),
+        ]:
+            seconds, body = measure(url)
+            returned = count(json.loads(body)["comments"])
+            print(f"{n:>10} {mode:>7} {returned:>9} {seconds * 1e3:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: clients polling the list endpoints of an unchanged store, with
+and without the ETag of their previous response. Reports the bytes sent
+and the CPU time per request:
+    full -- every poll re-reads, re-encodes and re-sends the whole payload,
+    304 -- the poll sends If-None-Match and is answered from the version counters.
+
+Usage: python benchmarks/bench_conditional_get.py [posts]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import records
+import store
+
+POSTS = 10_000
+COMMENTS = 1_000
+POST_ID = 0
+REPEAT = 50
+
+
+# Replace the app's store with n posts with random upvotes, the first one with COMMENTS comments.
+def populate(n):
+    rng = random.Random(0)
+    app.STORE = store.PostStore()
+    for post_id in range(n):
+        app.STORE._insert_post(
+            records.Post(post_id, rng.randrange(1000), "Hello, World!", "cornellappdev.com", "appdev")
+        )
+    for comment_id in range(COMMENTS):
+        app.STORE._insert_comment(POST_ID, records.Comment(comment_id, 1, "First comment", "appdev"))
+
+
+# Poll "url" REPEAT times, conditionally or not.
+# Returns (bytes sent per request, CPU milliseconds per request, status code).
+def poll(client, url, conditional):
+    etag = client.get(url).headers["ETag"]
+    headers = {"If-None-Match": etag} if conditional else {}
+    sent = 0
+    start = time.process_time()
+    for _ in range(REPEAT):
+        res = client.get(url, headers=headers)
+        sent += len(res.data)
+    cpu = time.process_time() - start
+    return sent / REPEAT, cpu / REPEAT * 1e3, res.status_code
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else POSTS
+    populate(n)
+    client = app.app.test_client()
+    print(f"{'endpoint':>40} {'mode':>5} {'status':>6} {'bytes/req':>10} {'cpu ms/req':>11}")
+    for url in [
+        "/api/posts/",
+        "/api/extra/posts/?sort=decreasing",
+        f"/api/posts/{POST_ID}/comments/",
+    ]:
+        for mode in ("full", "304"):
+            sent, cpu, status = poll(client, url, mode == "304")
+            print(f"{url:>40} {mode:>5} {status:>6} {sent:>10.0f} {cpu:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
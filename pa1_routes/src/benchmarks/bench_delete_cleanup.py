@@ -0,0 +1,75 @@
+"""
+Benchmark: memory of a long-running store under churn, and latency of
+deleting posts with many comments.
+
+    churn -- every round creates posts with comments, then deletes them all.
+             The bytes reported by memory_stats() must come back to the
+             same level after every round instead of growing.
+    delete -- latency of delete_post for a post with n comments: the
+              comments are released in the background past the threshold,
+              so the delete returns before the cleanup is done.
+
+Usage: python benchmarks/bench_delete_cleanup.py [rounds]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+
+POSTS_PER_ROUND = 1_000
+COMMENTS_PER_POST = 20
+DELETE_SIZES = [100, 1_000, 10_000, 100_000]
+
+
+# Total bytes reported by memory_stats(), once the pending cleanups are done.
+def total_bytes(post_store):
+    post_store.wait_for_cleanup()
+    return sum(structure["bytes"] for structure in post_store.memory_stats().values())
+
+
+def churn(rounds):
+    post_store = store.PostStore()
+    print(f"{'round':>6} {'live bytes':>12}")
+    for i in range(rounds):
+        post_ids = []
+        for _ in range(POSTS_PER_ROUND):
+            post_id = post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"]
+            for _ in range(COMMENTS_PER_POST):
+                post_store.create_comment(post_id, "First comment", "appdev")
+            post_ids.append(post_id)
+        for post_id in post_ids:
+            post_store.delete_post(post_id)
+        stats = post_store.memory_stats()
+        assert stats["posts"]["count"] == 0 and stats["comments"]["count"] == 0, "deleted records leaked"
+        print(f"{i:>6} {total_bytes(post_store):>12}")
+    post_store.close()
+
+
+def delete_latency():
+    print(f"{'comments':>9} {'delete (ms)':>12} {'cleanup (ms)':>13}")
+    for n in DELETE_SIZES:
+        post_store = store.PostStore()
+        post_id = post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"]
+        for _ in range(n):
+            post_store.create_comment(post_id, "First comment", "appdev")
+        start = time.perf_counter()
+        post_store.delete_post(post_id)
+        deleted = time.perf_counter()
+        post_store.wait_for_cleanup()
+        cleaned = time.perf_counter()
+        assert post_store.memory_stats()["comment_posts"]["count"] == 0, "comment index leaked"
+        print(f"{n:>9} {(deleted - start) * 1e3:>12.3f} {(cleaned - start) * 1e3:>13.3f}")
+        post_store.close()
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    churn(rounds)
+    delete_latency()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: cost of expiring posts as the store grows. Every store holds n
+posts, of which EXPIRED posts are past their deadline, and the rest expire
+later or never. Compares
+    wheel -- PostStore.expire_posts, which takes the expired posts from its timing wheel,
+    scan -- a sweep looking at the deadline of every post, what expiry would cost without the wheel.
+Both delete the same posts; the wheel's cost should not grow with n.
+
+Usage: python benchmarks/bench_expiry.py [expired posts]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records
+import store
+
+SIZES = [10_000, 100_000, 1_000_000]
+EXPIRED = 1_000
+START = 1_700_000_000.0
+
+
+# Build a store of n posts: the first "expired" posts expire at START + 10,
+# every other post expires at START + 1000, and the rest never do.
+def populate(n, expired):
+    post_store = store.PostStore(expiry_tick=1.0)
+    # stop the background expiry, the benchmark turns the wheel itself.
+    post_store._closed.set()
+    post_store._expiry = store.TimingWheel(START, 1.0)
+    for post_id in range(n):
+        if post_id < expired:
+            expires = START + 10
+        else:
+            expires = START + 1000 if post_id % 2 else None
+        post = records.Post(post_id, 1, "Hello, World!", "cornellappdev.com", "appdev", START, expires)
+        post_store._insert_post(post)
+    return post_store
+
+
+# Delete every post whose deadline passed, looking at all of them.
+def scan(post_store, now):
+    expired = [post.id for post in list(post_store._posts.values()) if post.expires is not None and post.expires <= now]
+    for post_id in expired:
+        post_store.delete_post(post_id)
+    return len(expired)
+
+
+def main():
+    expired = int(sys.argv[1]) if len(sys.argv) > 1 else EXPIRED
+    print(f"{'posts':>10} {'mode':>6} {'expired':>8} {'latency (ms)':>13}")
+    for n in SIZES:
+        for mode in ("wheel", "scan"):
+            post_store = populate(n, expired)
+            start = time.perf_counter()
+            if mode == "wheel":
+                count = post_store.expire_posts(START + 20)
+            else:
+                count = scan(post_store, START + 20)
+            seconds = time.perf_counter() - start
+            print(f"{n:>10} {mode:>6} {count:>8} {seconds * 1e3:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
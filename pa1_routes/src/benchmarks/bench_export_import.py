@@ -0,0 +1,87 @@
+"""
+Benchmark: records per second of the NDJSON export and bulk import, for
+both stores. A memory store of n posts with COMMENTS_PER_POST comments each
+is exported to an NDJSON file, which is then imported into an empty store
+of each kind. Lines are encoded and decoded like the /api/export/ and
+/api/import/ routes do, and the peak memory of the export is reported to
+show that it doesn't grow with the store.
+
+Usage: python benchmarks/bench_export_import.py [posts]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records
+import sqlite_store
+import store
+
+POSTS = 100_000
+COMMENTS_PER_POST = 5
+
+
+# Build a memory store of n posts with their comments.
+def populate(n):
+    post_store = store.PostStore()
+    comment_id = 0
+    for post_id in range(n):
+        post_store._insert_post(records.Post(post_id, 1, "Hello, World!", f"cornellappdev.com/{post_id}", "appdev"))
+        for _ in range(COMMENTS_PER_POST):
+            post_store._insert_comment(post_id, records.Comment(comment_id, 1, "First comment", "appdev"))
+            comment_id += 1
+    return post_store
+
+
+# Export a store to "path". Returns (records, seconds, peak bytes allocated).
+# The peak is measured by a second export, since tracing allocations slows it down.
+def export(post_store, path):
+    start = time.perf_counter()
+    count = 0
+    with open(path, "w", encoding="utf-8") as out:
+        for line in post_store.export_lines():
+            out.write(json.dumps(line) + "\n")
+            count += 1
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    for line in post_store.export_lines():
+        json.dumps(line)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, seconds, peak
+
+
+# Import "path" into a store. Returns (records, seconds).
+def load(post_store, path):
+    start = time.perf_counter()
+    with open(path, encoding="utf-8") as lines:
+        counts = post_store.import_lines(json.loads(line) for line in lines)
+    return sum(counts.values()), time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else POSTS
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "export.ndjson")
+    print(f"{'store':>7} {'direction':>10} {'records':>9} {'records/s':>11} {'peak MiB':>9}")
+    memory_store = populate(n)
+    count, seconds, peak = export(memory_store, path)
+    print(f"{'memory':>7} {'export':>10} {count:>9} {count / seconds:>11.0f} {peak / 2**20:>9.1f}")
+    count, seconds = load(store.PostStore(), path)
+    print(f"{'memory':>7} {'import':>10} {count:>9} {count / seconds:>11.0f} {'':>9}")
+    sqlite = sqlite_store.SqliteStore(os.path.join(directory, "bench.db"))
+    count, seconds = load(sqlite, path)
+    print(f"{'sqlite':>7} {'import':>10} {count:>9} {count / seconds:>11.0f} {'':>9}")
+    count, seconds, peak = export(sqlite, os.path.join(directory, "sqlite.ndjson"))
+    print(f"{'sqlite':>7} {'export':>10} {count:>9} {count / seconds:>11.0f} {peak / 2**20:>9.1f}")
+    sqlite.close()
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
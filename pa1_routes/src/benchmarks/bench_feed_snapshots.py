@@ -0,0 +1,118 @@
+"""
+Benchmark: feed readers listing the posts by upvotes while writers create,
+delete and upvote posts. Every listing is checked: it must be sorted, list
+no post twice, and include every post that is never deleted, even while
+votes move it. Compares
+    cow -- readers iterate a copy-on-write version of the index without any lock,
+    locked -- readers hold the index lock for the whole listing, what a consistent read would cost without snapshots.
+Reports throughput, latency and the number of torn listings of both.
+
+Usage: python benchmarks/bench_feed_snapshots.py [posts]
+"""
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records
+import store
+
+POSTS = 10_000
+READERS = 4
+DURATION = 3.0
+
+
+# Build a store of n posts with random upvotes. These posts are never deleted.
+def populate(n):
+    rng = random.Random(0)
+    post_store = store.PostStore()
+    for post_id in range(n):
+        post_store._insert_post(
+            records.Post(post_id, rng.randrange(1000), "Hello, World!", "cornellappdev.com", "appdev")
+        )
+    return post_store
+
+
+# List the whole feed by decreasing upvotes. Returns the listed keys.
+def read_feed(post_store, locked):
+    if locked:
+        with post_store._index_lock:
+            return list(post_store.upvote_keys(reverse=True))
+    return list(post_store.upvote_keys(reverse=True))
+
+
+# True if a listing is sorted, without duplicates, and has all the "stable" first n posts.
+def consistent(keys, n):
+    if any(a < b for a, b in zip(keys, keys[1:])):
+        return False
+    ids = [post_id for _, post_id in keys]
+    return len(set(ids)) == len(ids) and sum(post_id < n for post_id in ids) == n
+
+
+def reader(post_store, n, locked, stop, latencies, results):
+    reads = torn = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        keys = read_feed(post_store, locked)
+        latencies.append(time.perf_counter() - start)
+        reads += 1
+        torn += not consistent(keys, n)
+    results.append((reads, torn))
+
+
+# Alternately create and delete a post, and upvote a stable post.
+def writer(post_store, n, stop, latencies):
+    rng = random.Random(1)
+    while not stop.is_set():
+        start = time.perf_counter()
+        post = post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")
+        post_store.upvote_post(rng.randrange(n), rng.choice((-50, 50)))
+        post_store.delete_post(post["id"])
+        latencies.append((time.perf_counter() - start) / 3)
+        # let the readers run, like writes spread between requests.
+        time.sleep(0)
+
+
+def run(post_store, n, locked):
+    stop = threading.Event()
+    read_latencies, write_latencies, results = [], [], []
+    threads = [
+        threading.Thread(target=reader, args=(post_store, n, locked, stop, read_latencies, results))
+        for _ in range(READERS)
+    ]
+    threads.append(threading.Thread(target=writer, args=(post_store, n, stop, write_latencies)))
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    reads = sum(reads for reads, _ in results)
+    torn = sum(torn for _, torn in results)
+    return reads, torn, read_latencies, write_latencies
+
+
+# 99th percentile of a list of seconds, in milliseconds.
+def p99(latencies):
+    return statistics.quantiles(latencies, n=100)[98] * 1e3
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else POSTS
+    print(f"{'mode':>7} {'reads/s':>8} {'read p99 ms':>12} {'writes/s':>9} {'write p99 ms':>13} {'torn':>5}")
+    for mode in ("cow", "locked"):
+        post_store = populate(n)
+        reads, torn, read_latencies, write_latencies = run(post_store, n, mode == "locked")
+        print(
+            f"{mode:>7} {reads / DURATION:>8.0f} {p99(read_latencies):>12.2f} "
+            f"{len(write_latencies) * 3 / DURATION:>9.0f} {p99(write_latencies):>13.3f} {torn:>5}"
+        )
+        post_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: the "hot" feed under a mixed workload of 10% new posts, 70%
+upvotes and 20% reads of the first page of the feed, comparing
+    index -- reading the page from the incrementally updated hot index,
+    rescan -- scoring every post on every read and selecting the top page.
+
+Both modes must return the same pages, which is checked on every read.
+
+Usage: python benchmarks/bench_hot_feed.py [operations]
+"""
+import heapq
+import os
+import random
+import sys
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+from ranking import hot_score
+
+SIZES = [1_000, 10_000, 100_000]
+PAGE = 50
+
+
+# Build a store with n posts created over the last week.
+def populate(n, rng):
+    now = time.time()
+    return store.PostStore(posts=(
+        {
+            "id": post_id,
+            "upvotes": rng.randrange(1, 1000),
+            "title": "Hello, World!",
+            "link": "cornellappdev.com",
+            "username": "appdev",
+            "created": now - rng.randrange(7 * 24 * 3600),
+        }
+        for post_id in range(n)
+    ))
+
+
+# The first page of the feed, read from the hot index.
+def page_index(post_store):
+    return [post_id for _, post_id in islice(post_store.hot_keys(), PAGE)]
+
+
+# The first page of the feed, scoring every post.
+def page_rescan(post_store):
+    scored = (
+        (hot_score(post["upvotes"], post["created"]), post["id"])
+        for post in map(post_store.get_post, list(post_store.post_ids))
+    )
+    return [post_id for _, post_id in heapq.nlargest(PAGE, scored)]
+
+
+# Run the mixed workload, return the operations per second of each mode.
+def run(n, operations):
+    rng = random.Random(n)
+    post_store = populate(n, rng)
+    elapsed = {"index": 0.0, "rescan": 0.0}
+    start = time.perf_counter()
+    for _ in range(operations):
+        roll = rng.random()
+        if roll < 0.1:
+            post_store.create_post("title", "cornellappdev.com", "appdev")
+        elif roll < 0.8:
+            post_store.upvote_post(rng.randrange(n), rng.randrange(1, 10))
+        else:
+            pages = {}
+            for mode, page in [("index", page_index), ("rescan", page_rescan)]:
+                read_start = time.perf_counter()
+                pages[mode] = page(post_store)
+                elapsed[mode] += time.perf_counter() - read_start
+            assert pages["index"] == pages["rescan"], "hot index out of sync"
+    # time spent on writes, shared by both modes.
+    writes = time.perf_counter() - start - elapsed["index"] - elapsed["rescan"]
+    return {mode: operations / (writes + seconds) for mode, seconds in elapsed.items()}
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    print(f"{'posts':>8} {'index ops/s':>12} {'rescan ops/s':>13}")
+    for n in SIZES:
+        result = run(n, operations)
+        print(f"{n:>8} {result['index']:>12.0f} {result['rescan']:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Benchmark: GET /api/posts/ with a cold and a warm JSON fragment cache,
+and the counters reported by the cache stats hook (/debug/cache/).
+
+Usage: python benchmarks/bench_json_cache.py [number of posts]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import store
+
+READS = 5
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    app.STORE = store.PostStore(posts=(
+        {"id": i, "upvotes": 1, "title": "Hello, World!", "link": "cornellappdev.com", "username": "appdev"}
+        for i in range(n)
+    ))
+    client = app.app.test_client()
+    print(f"{'read':>5} {'GET /api/posts/ (ms)':>21}")
+    for read in range(READS):
+        start = time.perf_counter()
+        client.get("/api/posts/")
+        label = "cold" if read == 0 else "warm"
+        print(f"{label:>5} {(time.perf_counter() - start) * 1e3:>21.1f}")
+    print(json.dumps(json.loads(client.get("/debug/cache/").data), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark: worst-case latency of link validation in extra_create_post on
+adversarial links up to 10k characters, comparing the old backtracking
+regular expression with validators.is_valid_link.
+
+Usage: python benchmarks/bench_link_validator.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validators import is_valid_link
+
+LENGTHS = [1_000, 2_500, 5_000, 10_000]
+OLD_PATTERN = re.compile(r"(http(s)?://)?([\w-]+\.)+?[\w-]+[.com]+(/[/?%&=]*)?")
+
+# Adversarial links of about n characters. All of them are invalid, so
+# every split of the host between [\w-]+ and [.com]+ has to be tried.
+ADVERSARIAL = {
+    "long suffix": lambda n: "a." + "c" * n + "!",
+    "dotted suffix": lambda n: "a.a" + ".m" * (n // 2) + "!",
+    "many labels": lambda n: "a." * (n // 2) + "com/!",
+    "long label": lambda n: "http://" + "a" * n + "!",
+}
+
+
+# Seconds taken by the slowest of "repeat" calls to check(link).
+def worst_time(check, link, repeat=3):
+    worst = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        check(link)
+        worst = max(worst, time.perf_counter() - start)
+    return worst
+
+
+def main():
+    print(f"{'input':>14} {'length':>7} {'regex (ms)':>11} {'validator (ms)':>15}")
+    for name, build in ADVERSARIAL.items():
+        for n in LENGTHS:
+            link = build(n)
+            assert bool(OLD_PATTERN.fullmatch(link)) == is_valid_link(link)
+            regex = worst_time(OLD_PATTERN.fullmatch, link)
+            validator = worst_time(is_valid_link, link)
+            print(f"{name:>14} {len(link):>7} {regex * 1e3:>11.2f} {validator * 1e3:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
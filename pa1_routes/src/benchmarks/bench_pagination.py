@@ -0,0 +1,81 @@
+"""
+Benchmark: time-to-first-byte and peak memory of GET /api/posts/ as the
+number of stored posts grows, comparing
+    full -- the whole list encoded into one JSON string,
+    page -- the first page of "limit" posts,
+    stream -- a streamed export (first chunk latency, then the whole stream).
+
+Usage: python benchmarks/bench_pagination.py [page size]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import store
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+# Replace the app's store with n posts.
+def populate(n):
+    app.STORE = store.PostStore(posts=(
+        {
+            "id": post_id,
+            "upvotes": 1,
+            "title": "Hello, World!",
+            "link": "cornellappdev.com",
+            "username": "appdev",
+        }
+        for post_id in range(n)
+    ))
+
+
+# Call the get_posts route for "url" and consume the whole response.
+# Returns (seconds to the first byte, seconds to the last byte).
+def measure_time(url):
+    start = time.perf_counter()
+    with app.app.test_request_context(url):
+        res = app.get_posts()
+        if isinstance(res, tuple):
+            first = last = time.perf_counter()
+        else:
+            chunks = iter(res.response)
+            next(chunks)
+            first = time.perf_counter()
+            for _ in chunks:
+                pass
+            last = time.perf_counter()
+    return first - start, last - start
+
+
+# Returns the peak bytes allocated while serving "url".
+# Measured separately since tracing allocations slows everything down.
+def measure_memory(url):
+    tracemalloc.start()
+    measure_time(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    page = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"{'posts':>10} {'mode':>7} {'first byte (ms)':>16} {'last byte (ms)':>15} {'peak (KiB)':>12}")
+    for n in SIZES:
+        populate(n)
+        for mode, url in [
+            ("full", "/api/posts/"),
+            ("page", f"/api/posts/?limit={page}"),
+            ("stream", "/api/posts/?stream=true"),
+        ]:
+            first, last = measure_time(url)
+            peak = measure_memory(url)
+            print(f"{n:>10} {mode:>7} {first * 1e3:>16.3f} {last * 1e3:>15.3f} {peak / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
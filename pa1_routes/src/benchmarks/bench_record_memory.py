@@ -0,0 +1,74 @@
+"""
+Benchmark: memory used per post and per comment, plain dicts (the old
+representation) against the slotted Post / Comment records, at 100k and
+1M items.
+
+Every record gets its own username string built at runtime, as it would be
+when decoded from a request body, so the effect of interning is included.
+
+Usage: python benchmarks/bench_record_memory.py
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import Comment
+from records import Post
+
+SIZES = [100_000, 1_000_000]
+USERS = 1_000
+TITLE = "Hello, World!"
+LINK = "cornellappdev.com"
+TEXT = "First comment"
+
+
+# Build a fresh username string, as json.loads would.
+def username(i):
+    return "".join(["user", str(i % USERS)])
+
+
+def post_dict(i):
+    return {"id": i, "upvotes": 1, "title": TITLE, "link": LINK, "username": username(i)}
+
+
+def post_record(i):
+    return Post(i, 1, TITLE, LINK, username(i))
+
+
+def comment_dict(i):
+    return {"id": i, "upvotes": 1, "text": TEXT, "username": username(i)}
+
+
+def comment_record(i):
+    return Comment(i, 1, TEXT, username(i))
+
+
+# Bytes allocated per item to keep n items built by "factory" in a dict keyed by id.
+def bytes_per_item(factory, n):
+    gc.collect()
+    tracemalloc.start()
+    items = {i: factory(i) for i in range(n)}
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return current / n
+
+
+def main():
+    print(f"{'items':>10} {'kind':>8} {'dict (B)':>10} {'slots (B)':>10} {'saved':>7}")
+    for n in SIZES:
+        for kind, as_dict, as_record in [
+            ("post", post_dict, post_record),
+            ("comment", comment_dict, comment_record),
+        ]:
+            dict_bytes = bytes_per_item(as_dict, n)
+            record_bytes = bytes_per_item(as_record, n)
+            saved = 1 - record_bytes / dict_bytes
+            print(f"{n:>10} {kind:>8} {dict_bytes:>10.1f} {record_bytes:>10.1f} {saved:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
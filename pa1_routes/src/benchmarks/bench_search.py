@@ -0,0 +1,87 @@
+"""
+Benchmark: the full-text search index as the number of documents grows,
+reporting the time to index every document, the memory held by the index,
+the median and p99 latency of the first page of results of one- and
+two-word queries, and the p99 latency of their second page.
+
+Documents are random sentences over a Zipf-distributed vocabulary, so
+queries hit both very common and rare words.
+
+Usage: python benchmarks/bench_search.py [queries]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from itertools import accumulate
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchIndex
+
+SIZES = [10_000, 100_000, 1_000_000]
+VOCABULARY = [f"word{i}" for i in range(50_000)]
+# Zipf weights: the i-th word of the vocabulary is drawn with weight 1 / (i + 1).
+CUM_WEIGHTS = list(accumulate(1 / (i + 1) for i in range(len(VOCABULARY))))
+WORDS_PER_DOC = 10
+PAGE = 20
+
+
+# Draw n random words of the vocabulary.
+def words(rng, n):
+    return rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=n)
+
+
+# Build an index of n documents.
+# Returns (index, seconds to build it, bytes held by it).
+def build(n):
+    rng = random.Random(n)
+    texts = [" ".join(words(rng, WORDS_PER_DOC)) for _ in range(n)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = SearchIndex()
+    for doc, text in enumerate(texts):
+        index.add(doc, text)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return index, elapsed, size
+
+
+# Latencies of the first and second pages of results of random one- and two-word queries.
+def query_latencies(index, queries):
+    rng = random.Random(0)
+    latencies, next_latencies = [], []
+    for _ in range(queries):
+        query = " ".join(words(rng, rng.choice((1, 2))))
+        start = time.perf_counter()
+        page = list(islice(index.search(query), PAGE))
+        latencies.append(time.perf_counter() - start)
+        if page:
+            start = time.perf_counter()
+            list(islice(index.search(query, page[-1]), PAGE))
+            next_latencies.append(time.perf_counter() - start)
+    return sorted(latencies), sorted(next_latencies)
+
+
+def main():
+    queries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    print(
+        f"{'docs':>10} {'build (s)':>10} {'memory (MiB)':>13} {'p50 (ms)':>9} {'p99 (ms)':>9} {'next p99 (ms)':>14}"
+    )
+    for n in SIZES:
+        index, elapsed, size = build(n)
+        latencies, next_latencies = query_latencies(index, queries)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99)]
+        next_p99 = next_latencies[int(len(next_latencies) * 0.99)]
+        print(
+            f"{n:>10} {elapsed:>10.2f} {size / 2**20:>13.1f} {p50 * 1e3:>9.3f} {p99 * 1e3:>9.3f} "
+            f"{next_p99 * 1e3:>14.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: read latency of the sorted feed (/api/extra/posts/?sort=) as the
+number of stored posts grows from 1k to 1M.
+
+Compares re-sorting every post on each read (the old implementation) with
+reading the first page straight from the upvotes index.
+
+Usage: python benchmarks/bench_sorted_feed.py [page size]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import store
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+READS = 200
+
+
+# Replace the app's store with n posts with random upvotes.
+def populate(n):
+    app.STORE = store.PostStore(posts=(
+        {
+            "id": post_id,
+            "upvotes": random.randint(0, 10_000),
+            "title": "title",
+            "link": "cornellappdev.com",
+            "username": "appdev",
+        }
+        for post_id in range(n)
+    ))
+
+
+def main():
+    page = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    client = app.app.test_client()
+    print(f"{'posts':>10} {'full sort (ms)':>15} {'index page (ms)':>16} {'route page (ms)':>16}")
+    for n in SIZES:
+        populate(n)
+        # the old implementation: sort all posts, then take the page.
+        sort_reads = max(1, READS * 1_000 // n)
+        full_sort = timeit.timeit(
+            lambda: sorted(app.STORE._posts.values(), key=lambda value: value.upvotes, reverse=True)[:page],
+            number=sort_reads,
+        ) / sort_reads
+        index_page = timeit.timeit(
+            lambda: [app.STORE.get_post(post_id) for _, post_id in app.STORE.posts_by_upvotes.islice(limit=page, reverse=True)],
+            number=READS,
+        ) / READS
+        route_page = timeit.timeit(
+            lambda: client.get(f"/api/extra/posts/?sort=decreasing&limit={page}"),
+            number=READS,
+        ) / READS
+        print(f"{n:>10} {full_sort * 1e3:>15.3f} {index_page * 1e3:>16.4f} {route_page * 1e3:>16.4f}")
+
+
+if __name__ == "__main__":
+    main()
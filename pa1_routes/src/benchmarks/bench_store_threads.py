@@ -0,0 +1,86 @@
+"""
+Stress benchmark: many threads creating posts, upvoting and commenting on a
+shared PostStore at once.
+
+After every run the counters are checked exactly:
+    - the sum of all upvotes equals the initial upvotes plus every increment,
+    - every allocated post id and comment id is unique,
+    - every created comment is stored.
+Throughput is reported as the number of threads rises.
+
+Usage: python benchmarks/bench_store_threads.py [operations per thread]
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+
+THREAD_COUNTS = [1, 2, 4, 8, 16, 32]
+INITIAL_POSTS = 1_000
+
+
+# One worker: a mix of 70% upvotes, 20% comments and 10% new posts.
+# Records what it did in "result" so the totals can be checked afterwards.
+def worker(post_store, operations, seed, result):
+    rng = random.Random(seed)
+    upvotes = 0
+    post_ids = []
+    comment_ids = []
+    for _ in range(operations):
+        roll = rng.random()
+        post_id = rng.randrange(INITIAL_POSTS)
+        if roll < 0.7:
+            post_store.upvote_post(post_id)
+            upvotes += 1
+        elif roll < 0.9:
+            comment_ids.append(post_store.create_comment(post_id, "text", "appdev")["id"])
+        else:
+            post_ids.append(post_store.create_post("title", "cornellappdev.com", "appdev")["id"])
+    result.append((upvotes, post_ids, comment_ids))
+
+
+def run(threads, operations):
+    post_store = store.PostStore(posts=(
+        {"id": i, "upvotes": 1, "title": "title", "link": "cornellappdev.com", "username": "appdev"}
+        for i in range(INITIAL_POSTS)
+    ))
+    results = []
+    workers = [
+        threading.Thread(target=worker, args=(post_store, operations, seed, results))
+        for seed in range(threads)
+    ]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # check every counter exactly.
+    upvotes = sum(r[0] for r in results)
+    post_ids = [i for r in results for i in r[1]]
+    comment_ids = [i for r in results for i in r[2]]
+    total_upvotes = sum(post_store.get_post(i)["upvotes"] for i in range(INITIAL_POSTS))
+    assert total_upvotes == INITIAL_POSTS + upvotes, "lost upvotes"
+    assert len(set(post_ids)) == len(post_ids), "duplicate post ids"
+    assert len(set(comment_ids)) == len(comment_ids), "duplicate comment ids"
+    stored_comments = sum(len(post_store.get_comments(i) or []) for i in range(INITIAL_POSTS))
+    assert stored_comments == len(comment_ids), "lost comments"
+    assert len(post_store.posts_by_upvotes) == INITIAL_POSTS + len(post_ids), "upvotes index out of sync"
+    return threads * operations / elapsed
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"{'threads':>8} {'ops/s':>12}")
+    for threads in THREAD_COUNTS:
+        print(f"{threads:>8} {run(threads, operations):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Contention benchmark: 32 threads upvoting the same post at once, with every
+vote applied under the post's lock versus buffered in a sharded counter.
+
+After every run the upvotes are flushed and checked exactly:
+    - the post's upvotes equal the initial upvotes plus every vote,
+    - the upvotes index holds the post under its final upvotes, and only once.
+
+Usage: python benchmarks/bench_upvote_contention.py [votes per thread]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+
+THREADS = 32
+SHARD_COUNTS = [0, 8, 32]
+POST_ID = 0
+
+
+# One worker: upvote the hot post "votes" times.
+def worker(post_store, votes):
+    for _ in range(votes):
+        post_store.upvote_post(POST_ID)
+
+
+def run(shards, votes):
+    post_store = store.PostStore(
+        posts=[{"id": POST_ID, "upvotes": 1, "title": "title", "link": "cornellappdev.com", "username": "appdev"}],
+        upvote_shards=shards,
+    )
+    workers = [threading.Thread(target=worker, args=(post_store, votes)) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    post_store.close()
+
+    # check the total and the index exactly.
+    total = 1 + THREADS * votes
+    assert post_store.get_post(POST_ID)["upvotes"] == total, "lost upvotes"
+    assert (total, POST_ID) in post_store.posts_by_upvotes, "upvotes index out of sync"
+    assert len(post_store.posts_by_upvotes) == 1, "stale upvotes index entry"
+    return THREADS * votes / elapsed
+
+
+def main():
+    votes = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"{'shards':>8} {'votes/s':>12}")
+    for shards in SHARD_COUNTS:
+        print(f"{shards:>8} {run(shards, votes):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
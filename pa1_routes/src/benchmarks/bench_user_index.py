@@ -0,0 +1,76 @@
+"""
+Benchmark: listing everything one user posted and commented as the store
+grows, comparing
+    index -- reading the per-user indexes,
+    scan -- scanning every post and every comment of every post.
+The user always has the same 20 posts and 20 comments, so the index
+latency should stay flat while the scan grows with the store.
+
+Usage: python benchmarks/bench_user_index.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+
+SIZES = [10_000, 100_000, 1_000_000]
+USERNAME = "needle"
+USER_RECORDS = 20
+
+
+# Build a store with n posts by other users, one comment each, plus the user's records.
+def populate(n):
+    post_store = store.PostStore(posts=(
+        {"id": post_id, "upvotes": 1, "title": "Hello, World!", "link": "cornellappdev.com", "username": "appdev"}
+        for post_id in range(n)
+    ))
+    for post_id in range(n):
+        post_store.create_comment(post_id, "First comment", "appdev")
+    for i in range(USER_RECORDS):
+        post_store.create_post("Hello, World!", "cornellappdev.com", USERNAME)
+        post_store.create_comment(i * (n // USER_RECORDS), "First comment", USERNAME)
+    return post_store
+
+
+def lookup_index(post_store):
+    posts = [post_store.get_post_json(post_id) for post_id in post_store.user_post_keys(USERNAME)]
+    comments = [post_store.get_comment_with_post_json(i) for i in post_store.user_comment_keys(USERNAME)]
+    return len(posts), len(comments)
+
+
+def lookup_scan(post_store):
+    posts = []
+    comments = []
+    for post_id in list(post_store.post_ids):
+        post = post_store.get_post(post_id)
+        if post["username"] == USERNAME:
+            posts.append(post)
+        for comment in post_store.get_comments(post_id) or ():
+            if comment["username"] == USERNAME:
+                comments.append(comment)
+    return len(posts), len(comments)
+
+
+# Returns the seconds taken by lookup(post_store), and checks the number of records found.
+def measure(lookup, post_store):
+    start = time.perf_counter()
+    found = lookup(post_store)
+    elapsed = time.perf_counter() - start
+    assert found == (USER_RECORDS, USER_RECORDS), "user index out of sync"
+    return elapsed
+
+
+def main():
+    print(f"{'posts':>10} {'index (ms)':>11} {'scan (ms)':>10}")
+    for n in SIZES:
+        post_store = populate(n)
+        index = measure(lookup_index, post_store)
+        scan = measure(lookup_scan, post_store)
+        print(f"{n:>10} {index * 1e3:>11.3f} {scan * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
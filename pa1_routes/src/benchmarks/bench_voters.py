@@ -0,0 +1,74 @@
+"""
+Benchmark: one-vote-per-user deduplication with 1M voters on one post.
+
+    memory -- bytes held by the post's voters as a VoterSet (bitmap),
+              a set of voter ids, and a set of voter names.
+    throughput -- votes per second through PostStore.vote_post for new
+                  votes, duplicate votes (rejected), and undos.
+
+After the run the post's upvotes must equal 1 plus the number of voters.
+
+Usage: python benchmarks/bench_voters.py [voters]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+from voters import VoterSet
+
+POST_ID = 0
+
+
+# Approximate bytes of a set and of the objects it holds.
+def set_bytes(values):
+    return sys.getsizeof(values) + sum(map(sys.getsizeof, values))
+
+
+def memory(voters):
+    names = {f"voter{i}" for i in range(voters)}
+    ids = set(range(voters))
+    voter_set = VoterSet(range(voters))
+    print(f"{'form':>10} {'MiB':>9}")
+    for form, size in [
+        ("VoterSet", sys.getsizeof(voter_set)),
+        ("id set", set_bytes(ids)),
+        ("name set", set_bytes(names)),
+    ]:
+        print(f"{form:>10} {size / 2**20:>9.2f}")
+
+
+# Call "vote(post_id, name)" for every voter, return the calls per second.
+def run(vote, names):
+    start = time.perf_counter()
+    for name in names:
+        vote(POST_ID, name)
+    return len(names) / (time.perf_counter() - start)
+
+
+def throughput(voters):
+    post_store = store.PostStore(posts=[
+        {"id": POST_ID, "upvotes": 1, "title": "title", "link": "cornellappdev.com", "username": "appdev"}
+    ])
+    names = [f"voter{i}" for i in range(voters)]
+    print(f"{'operation':>10} {'ops/s':>12}")
+    print(f"{'new':>10} {run(post_store.vote_post, names):>12.0f}")
+    assert post_store.get_post(POST_ID)["upvotes"] == 1 + voters, "lost votes"
+    print(f"{'duplicate':>10} {run(post_store.vote_post, names):>12.0f}")
+    assert post_store.get_post(POST_ID)["upvotes"] == 1 + voters, "duplicate votes counted"
+    print(f"{'undo':>10} {run(post_store.unvote_post, names):>12.0f}")
+    assert post_store.get_post(POST_ID)["upvotes"] == 1, "undo failed"
+    stats = post_store.memory_stats()["voters"]
+    print(f"voters structure after undo: {stats['count']} votes, {stats['bytes'] / 2**20:.2f} MiB")
+
+
+def main():
+    voters = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    memory(voters)
+    throughput(voters)
+
+
+if __name__ == "__main__":
+    main()
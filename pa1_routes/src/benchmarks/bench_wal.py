@@ -0,0 +1,79 @@
+"""
+Benchmark of the write-ahead log:
+    - write throughput of PostStore mutations for each fsync policy,
+    - recovery time of a store from a 1M-entry log, and from a snapshot.
+
+Usage: python benchmarks/bench_wal.py [number of log entries to recover]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+import wal
+
+# (sync_every, number of writes): fsync-heavy policies get fewer writes.
+SYNC_POLICIES = [(1, 2_000), (10, 20_000), (100, 100_000), (1_000, 100_000), (0, 100_000)]
+
+
+# Writes per second of a mix of new posts, upvotes and comments.
+def write_throughput(directory, sync_every, writes):
+    post_store = store.PostStore(wal=wal.WriteAheadLog(directory, sync_every=sync_every, snapshot_every=0))
+    start = time.perf_counter()
+    for i in range(writes):
+        if i % 4 == 0:
+            post_id = post_store.create_post("title", "cornellappdev.com", "appdev")["id"]
+        elif i % 4 == 3:
+            post_store.create_comment(post_id, "text", "appdev")
+        else:
+            post_store.upvote_post(post_id)
+    post_store.close()
+    return writes / (time.perf_counter() - start)
+
+
+# Write "entries" log entries: one post created per four entries, then upvoted twice and commented.
+def build_log(directory, entries):
+    log = wal.WriteAheadLog(directory, sync_every=0, snapshot_every=0)
+    for i in range(entries):
+        post_id = i // 4
+        if i % 4 == 0:
+            post = {"id": post_id, "upvotes": 1, "title": "title", "link": "cornellappdev.com", "username": "appdev"}
+            log.append({"op": "create_post", "post": post})
+        elif i % 4 == 3:
+            comment = {"id": post_id, "upvotes": 1, "text": "text", "username": "appdev"}
+            log.append({"op": "create_comment", "post_id": post_id, "comment": comment})
+        else:
+            log.append({"op": "upvote_post", "post_id": post_id, "upvotes": i % 4 + 1})
+    log.close()
+
+
+# Seconds taken to rebuild a store from "directory".
+def recovery_time(directory):
+    start = time.perf_counter()
+    post_store = store.PostStore(wal=wal.WriteAheadLog(directory, sync_every=0, snapshot_every=0))
+    elapsed = time.perf_counter() - start
+    return elapsed, post_store
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{'sync_every':>10} {'writes/s':>10}")
+    for sync_every, writes in SYNC_POLICIES:
+        with tempfile.TemporaryDirectory() as directory:
+            print(f"{sync_every:>10} {write_throughput(directory, sync_every, writes):>10.0f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        build_log(directory, entries)
+        elapsed, post_store = recovery_time(directory)
+        print(f"recovery from a {entries}-entry log: {elapsed:.2f} s")
+        post_store.snapshot()
+        post_store.close()
+        elapsed, _ = recovery_time(directory)
+        print(f"recovery from the snapshot of the same store: {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
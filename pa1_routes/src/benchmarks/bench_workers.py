@@ -0,0 +1,103 @@
+"""
+Benchmark: the same request mix served by 1, 2, 4 and 8 worker processes,
+for each storage backend (PA1_STORE=memory and PA1_STORE=sqlite).
+
+Each worker runs the Flask app in its own process, like a gunicorn worker,
+and sends requests through the test client so that only the app and its
+store are measured. After each run, the number of posts seen by one worker
+is compared with the number of posts created by all of them: the shared
+SQLite backend sees every post, the in-memory backend only its own.
+
+Usage: python benchmarks/bench_workers.py [requests per worker]
+"""
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC)
+
+WORKER_COUNTS = [1, 2, 4, 8]
+INITIAL_POSTS = 1_000
+POST = {"title": "Hello, World!", "link": "cornellappdev.com", "username": "appdev"}
+COMMENT = {"text": "First comment", "username": "appdev"}
+
+
+def initial_posts():
+    return [dict(POST, id=i, upvotes=1) for i in range(INITIAL_POSTS)]
+
+
+# One worker process: 50% post reads, 10% sorted feed pages, 20% upvotes,
+# 10% new posts and 10% new comments.
+def worker(backend, db_path, requests, seed, barrier, results):
+    os.environ["PA1_STORE"] = backend
+    os.environ["PA1_SQLITE_PATH"] = db_path
+    import app
+    import store
+    if backend == "memory":
+        app.STORE = store.PostStore(posts=initial_posts())
+    client = app.app.test_client()
+    rng = random.Random(seed)
+    created = 0
+    barrier.wait()
+    start = time.perf_counter()
+    for _ in range(requests):
+        roll = rng.random()
+        post_id = rng.randrange(INITIAL_POSTS)
+        if roll < 0.5:
+            client.get(f"/api/posts/{post_id}/")
+        elif roll < 0.6:
+            client.get("/api/extra/posts/?sort=decreasing&limit=20")
+        elif roll < 0.8:
+            client.post(f"/api/extra/posts/{post_id}/", data=json.dumps({"upvotes": 1}))
+        elif roll < 0.9:
+            client.post("/api/posts/", data=json.dumps(POST))
+            created += 1
+        else:
+            client.post(f"/api/posts/{post_id}/comments/", data=json.dumps(COMMENT))
+    elapsed = time.perf_counter() - start
+    barrier.wait()
+    # count the posts this worker can see once every worker is done.
+    visible = sum(1 for _ in app.STORE.post_keys())
+    results.put((elapsed, created, visible))
+
+
+def run(backend, workers, requests):
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "pa1.db")
+        if backend == "sqlite":
+            import sqlite_store
+            sqlite_store.SqliteStore(db_path, posts=initial_posts()).close()
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(backend, db_path, requests, seed, barrier, results))
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    elapsed = max(outcome[0] for outcome in outcomes)
+    created = sum(outcome[1] for outcome in outcomes)
+    visible = outcomes[0][2]
+    return workers * requests / elapsed, INITIAL_POSTS + created, visible
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    print(f"{'backend':>8} {'workers':>8} {'req/s':>10} {'posts created':>14} {'posts seen':>11}")
+    for backend in ["memory", "sqlite"]:
+        for workers in WORKER_COUNTS:
+            throughput, total, visible = run(backend, workers, requests)
+            print(f"{backend:>8} {workers:>8} {throughput:>10.0f} {total:>14} {visible:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import itertools
+import threading
+
+# every thread is given its own shard number the first time it counts.
+_shard_numbers = itertools.count()
+_local = threading.local()
+
+
+# Get the shard number of the current thread.
+def _shard_number():
+    number = getattr(_local, "shard", None)
+    if number is None:
+        number = _local.shard = next(_shard_numbers)
+    return number
+
+
+class ShardedCounter(object):
+    """
+    Counter split into cells, one cell per group of threads, each with its
+    own lock. Threads counting at the same time usually hit different cells,
+    so they don't wait for each other. The total is folded back by drain().
+
+    A counter can be closed, after which add() refuses new counts; the caller
+    then has to count somewhere else. This lets idle counters be dropped
+    without losing counts that race with the drop.
+    """
+
+    __slots__ = ("_cells", "_locks", "closed")
+
+    # Constructor.
+    # shards -- number of cells.
+    def __init__(self, shards):
+        self._cells = [0] * shards
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self.closed = False
+
+    # Add "n" to the cell of the current thread.
+    # Returns False if the counter is closed and nothing was added.
+    def add(self, n=1):
+        i = _shard_number() % len(self._cells)
+        with self._locks[i]:
+            if self.closed:
+                return False
+            self._cells[i] += n
+        return True
+
+    # Current total of the cells, without resetting them.
+    def value(self):
+        return sum(self._cells)
+
+    # Reset every cell and return the total taken out.
+    def drain(self):
+        total = 0
+        for i, lock in enumerate(self._locks):
+            with lock:
+                total += self._cells[i]
+                self._cells[i] = 0
+        return total
+
+    # Close the counter, reset every cell and return the total taken out.
+    def close(self):
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            total = sum(self._cells)
+            self._cells = [0] * len(self._cells)
+            self.closed = True
+        finally:
+            for lock in self._locks:
+                lock.release()
+        return total
@@ -0,0 +1,54 @@
+"""
+Canonical form of post links, used to detect reposts.
+"""
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+# query parameters that only track where a click came from.
+TRACKING_PARAMETERS = frozenset((
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src", "si",
+))
+# prefix of the Google Analytics tracking parameters, utm_source etc.
+TRACKING_PREFIX = "utm_"
+# ports implied by the schemes.
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+"""
+Normalise a link so that links to the same page compare equal:
+    - http and https, and a missing scheme, are the same,
+    - the host is case-insensitive, and "www." and default ports are dropped,
+    - a trailing slash and the fragment are dropped,
+    - tracking parameters are dropped and the other parameters are sorted.
+The path and parameter values keep their case, since servers may not ignore it.
+Returns None if the link isn't a str, or has no host.
+"""
+def normalize_link(link):
+    if type(link) is not str:
+        return None
+    link = link.strip()
+    # links without a scheme, e.g. "cornellappdev.com/about", are parsed as if they had one.
+    if "://" not in link:
+        link = "http://" + link
+    try:
+        parts = urlsplit(link)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return None
+    if not host:
+        return None
+    if host.startswith("www."):
+        host = host[4:]
+    if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/")
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMETERS and not name.lower().startswith(TRACKING_PREFIX)
+    )
+    normalized = host + path
+    if query:
+        normalized += "?" + urlencode(query)
+    return normalized
@@ -1,5 +1,11 @@
 import sys
 import json
+import os
+import sqlite3
+import tempfile
+import time
+from itertools import islice
+from threading import Event
 from threading import Thread
 from time import sleep
 import unittest
@@ -8,6 +14,9 @@ from requests.api import post
 
 from app import app
 import requests
+import sqlite_store
+import store
+import wal
 
 unittest.TestLoader.sortTestMethodsUsing = None
 
@@ -240,6 +249,93 @@ class TestRoutes(unittest.TestCase):
             status_code_error(req_type, route, res.status_code, 200),
         )
 
+    def test_delete_post_deletes_comments(self):
+        username = "cascade-test"
+        res = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        post_id = res.json().get("id")
+        comment = dict(SAMPLE_COMMENT, username=username)
+        requests.post(gen_comments_path(post_id), data=json.dumps(comment))
+        requests.delete(gen_posts_path(post_id))
+        req_type = "GET"
+
+        route = gen_comments_route(post_id)
+        res = requests.get(gen_comments_path(post_id))
+        self.jsonable_test(res, req_type, route, 404)
+
+        route = f"/api/users/{username}/comments/"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        comments = res.json().get("comments")
+        self.assertEqual(
+            comments,
+            [],
+            wrong_value_error(req_type, route, comments, [], "user comments"),
+        )
+
+    def test_post_ttl_expires(self):
+        req_type = "POST"
+        route = gen_posts_route()
+        post = dict(SAMPLE_POST, ttl=0.5)
+        res = requests.post(gen_posts_path(), data=json.dumps(post))
+        self.jsonable_test(res, req_type, route, 201, post)
+        post_id = res.json().get("id")
+        requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+        bad_post = dict(SAMPLE_POST, ttl=-1)
+        res = requests.post(gen_posts_path(), data=json.dumps(bad_post))
+        self.jsonable_test(res, req_type, route, 400, bad_post)
+
+        # expiry runs once per second, give it a few turns.
+        req_type = "GET"
+        route = gen_posts_route(post_id)
+        for _ in range(20):
+            res = requests.get(gen_posts_path(post_id))
+            if res.status_code == 404:
+                break
+            sleep(0.25)
+        self.jsonable_test(res, req_type, route, 404)
+        route = gen_comments_route(post_id)
+        res = requests.get(gen_comments_path(post_id))
+        self.jsonable_test(res, req_type, route, 404)
+
+    def test_create_with_invalid_username(self):
+        req_type = "POST"
+        route = gen_posts_route()
+        post = dict(SAMPLE_POST, username=123)
+        res = requests.post(gen_posts_path(), data=json.dumps(post))
+        self.jsonable_test(res, req_type, route, 400, post)
+
+        post_id = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST)).json().get("id")
+        route = gen_comments_route(post_id)
+        comment = dict(SAMPLE_COMMENT, username=["appdev"])
+        res = requests.post(gen_comments_path(post_id), data=json.dumps(comment))
+        self.jsonable_test(res, req_type, route, 400, comment)
+
+    def test_create_with_non_string_fields(self):
+        all_posts = requests.get(gen_posts_path()).json().get("posts")
+        req_type = "POST"
+        route = gen_posts_route()
+        for field in ("title", "link"):
+            post = dict(SAMPLE_POST, **{field: 1})
+            res = requests.post(gen_posts_path(), data=json.dumps(post))
+            self.jsonable_test(res, req_type, route, 400, post)
+        # nothing was stored.
+        posts = requests.get(gen_posts_path()).json().get("posts")
+        self.assertEqual(posts, all_posts, wrong_value_error("GET", route, posts, all_posts, "posts"))
+
+        post_id = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST)).json().get("id")
+        route = gen_comments_route(post_id)
+        comment = dict(SAMPLE_COMMENT, text={"text": "First comment"})
+        res = requests.post(gen_comments_path(post_id), data=json.dumps(comment))
+        self.jsonable_test(res, req_type, route, 400, comment)
+        comment_id = requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT)).json().get("id")
+        body = {"text": 1}
+        route = gen_comments_route(post_id, comment_id)
+        res = requests.post(gen_comments_path(post_id, comment_id), data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 400, body)
+        route = f"/api/comments/{comment_id}/"
+        res = requests.post(LOCAL_URL + route, data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 400, body)
+
     def test_post_id_increments(self):
         post_create_err = error_str(
             "\nCreation of a post failed. See `test_create_post` results."
@@ -317,6 +413,48 @@ class TestRoutes(unittest.TestCase):
             ),
         )
 
+    def test_get_posts_pagination(self):
+        for _ in range(3):
+            requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        req_type = "GET"
+        all_posts = requests.get(gen_posts_path()).json().get("posts")
+
+        pages = []
+        params = {"limit": 2}
+        while True:
+            route = gen_posts_route(params=params)
+            res = requests.get(gen_posts_path(params=params))
+            self.jsonable_test(res, req_type, route, 200)
+            pages += res.json().get("posts")
+            next_cursor = res.json().get("next_cursor")
+            if next_cursor is None:
+                break
+            params = {"limit": 2, "cursor": next_cursor}
+        self.assertEqual(
+            [post["id"] for post in pages],
+            [post["id"] for post in all_posts],
+            wrong_value_error(
+                req_type, route, pages, all_posts, "paginated posts"
+            ),
+        )
+
+        params = {"stream": "true"}
+        route = gen_posts_route(params=params)
+        res = requests.get(gen_posts_path(params=params))
+        self.jsonable_test(res, req_type, route, 200)
+        self.assertEqual(
+            res.json().get("posts"),
+            all_posts,
+            wrong_value_error(
+                req_type, route, res.json().get("posts"), all_posts, "posts"
+            ),
+        )
+
+        params = {"limit": 2, "cursor": "not-a-cursor"}
+        route = gen_posts_route(params=params)
+        res = requests.get(gen_posts_path(params=params))
+        self.jsonable_test(res, req_type, route, 400)
+
     # -- COMMENTS ------------------------------------------
 
     def test_post_comment(self):
@@ -433,6 +571,27 @@ class TestRoutes(unittest.TestCase):
             wrong_value_error(req_type, route, text, "New text", "text", body),
         )
 
+    def test_edit_comment_not_found(self):
+        post_id = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST)).json().get("id")
+        other_id = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST)).json().get("id")
+        comment_id = requests.post(gen_comments_path(other_id), data=json.dumps(SAMPLE_COMMENT)).json().get("id")
+        req_type = "POST"
+        body = {"text": "New text"}
+
+        # a post without comments, even if the comment exists on another post.
+        route = gen_comments_route(post_id, comment_id)
+        res = requests.post(gen_comments_path(post_id, comment_id), data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 404, body)
+        # a post with comments, but not this one.
+        requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+        res = requests.post(gen_comments_path(post_id, comment_id), data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 404, body)
+        # a deleted post has no comments left to edit.
+        requests.delete(gen_posts_path(other_id))
+        route = gen_comments_route(other_id, comment_id)
+        res = requests.post(gen_comments_path(other_id, comment_id), data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 404, body)
+
     def test_get_comments_invalid_post(self):
         req_type = "GET"
         route = gen_comments_route(10000)
@@ -458,6 +617,307 @@ class TestRoutes(unittest.TestCase):
             ),
         )
 
+    def test_get_comments_sorted_pagination(self):
+        res = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        post_id = res.json().get("id")
+        comment_ids = []
+        for _ in range(3):
+            res = requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+            comment_ids.append(res.json().get("id"))
+        req_type = "GET"
+
+        pages = []
+        query = "?sort=new&limit=2"
+        while True:
+            route = gen_comments_route(post_id) + query
+            res = requests.get(LOCAL_URL + route)
+            self.jsonable_test(res, req_type, route, 200)
+            pages += res.json().get("comments")
+            next_cursor = res.json().get("next_cursor")
+            if next_cursor is None:
+                break
+            query = f"?sort=new&limit=2&cursor={next_cursor}"
+        self.assertEqual(
+            [comment["id"] for comment in pages],
+            comment_ids[::-1],
+            wrong_value_error(
+                req_type, route, pages, comment_ids[::-1], "newest comments"
+            ),
+        )
+
+        route = gen_comments_route(post_id) + "?sort=oldest"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 400)
+
+    def test_get_user_posts_and_comments(self):
+        username = "user-index-test"
+        post = dict(SAMPLE_POST, username=username)
+        post_ids = []
+        for _ in range(3):
+            res = requests.post(gen_posts_path(), data=json.dumps(post))
+            post_ids.append(res.json().get("id"))
+        comment = dict(SAMPLE_COMMENT, username=username)
+        res = requests.post(gen_comments_path(post_ids[0]), data=json.dumps(comment))
+        comment_id = res.json().get("id")
+        req_type = "GET"
+
+        pages = []
+        route = f"/api/users/{username}/posts/?limit=2"
+        while True:
+            res = requests.get(LOCAL_URL + route)
+            self.jsonable_test(res, req_type, route, 200)
+            pages += res.json().get("posts")
+            next_cursor = res.json().get("next_cursor")
+            if next_cursor is None:
+                break
+            route = f"/api/users/{username}/posts/?limit=2&cursor={next_cursor}"
+        self.assertEqual(
+            [post["id"] for post in pages],
+            post_ids,
+            wrong_value_error(req_type, route, pages, post_ids, "user posts"),
+        )
+
+        route = f"/api/users/{username}/comments/"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        comments = [(c["post_id"], c["id"]) for c in res.json().get("comments")]
+        expected = [(post_ids[0], comment_id)]
+        self.assertEqual(
+            comments,
+            expected,
+            wrong_value_error(req_type, route, comments, expected, "user comments"),
+        )
+
+    def test_comment_by_id(self):
+        res = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        post_id = res.json().get("id")
+        res = requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+        comment_id = res.json().get("id")
+
+        req_type = "GET"
+        route = f"/api/comments/{comment_id}/"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        self.assertEqual(
+            res.json().get("post_id"),
+            post_id,
+            wrong_value_error(req_type, route, res.json().get("post_id"), post_id, "post_id"),
+        )
+
+        req_type = "POST"
+        body = {"text": "Moderated"}
+        res = requests.post(LOCAL_URL + route, data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 200, body)
+        comments = requests.get(gen_comments_path(post_id)).json().get("comments")
+        self.assertEqual(
+            comments[0].get("text"),
+            "Moderated",
+            wrong_value_error(req_type, route, comments[0].get("text"), "Moderated", "text", body),
+        )
+
+        requests.delete(gen_posts_path(post_id))
+        req_type = "GET"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 404)
+
+    def test_comment_replies(self):
+        res = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        post_id = res.json().get("id")
+        res = requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+        first_id = res.json().get("id")
+        reply = dict(SAMPLE_COMMENT, parent_id=first_id)
+        req_type = "POST"
+        route = gen_comments_route(post_id)
+        res = requests.post(gen_comments_path(post_id), data=json.dumps(reply))
+        self.jsonable_test(res, req_type, route, 201, reply)
+        reply_id = res.json().get("id")
+        requests.post(gen_comments_path(post_id), data=json.dumps(dict(SAMPLE_COMMENT, parent_id=reply_id)))
+        res = requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+        second_id = res.json().get("id")
+        missing = dict(SAMPLE_COMMENT, parent_id=10000)
+        res = requests.post(gen_comments_path(post_id), data=json.dumps(missing))
+        self.jsonable_test(res, req_type, route, 404, missing)
+
+        # equal upvotes: the newest top-level comment comes first.
+        req_type = "GET"
+        route = gen_comments_route(post_id) + "?depth=2"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        comments = res.json().get("comments")
+        self.assertEqual(
+            [comment["id"] for comment in comments],
+            [second_id, first_id],
+            wrong_value_error(req_type, route, comments, [second_id, first_id], "top-level comment ids"),
+        )
+        replies = comments[1]["replies"]
+        self.assertEqual(
+            [(r["id"], r["parent_id"], r["replies"], r["more_replies"]) for r in replies],
+            [(reply_id, first_id, [], True)],
+            wrong_value_error(req_type, route, replies, "the reply, with replies below the depth", "replies"),
+        )
+
+        route = gen_comments_route(post_id) + "?depth=1&limit=1"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        self.assertEqual(
+            (len(res.json().get("comments")), res.json().get("more_comments")),
+            (1, True),
+            wrong_value_error(req_type, route, res.json(), "one comment and more_comments", "comments"),
+        )
+
+        route = gen_comments_route(post_id) + "?depth=0"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 400)
+
+    def test_repost_lookup(self):
+        post = dict(SAMPLE_POST, link="https://www.Example.org/repost/?utm_source=feed")
+        res = requests.post(gen_posts_path(), data=json.dumps(post))
+        post_id = res.json().get("id")
+        repost = dict(SAMPLE_POST, link="http://example.org/repost")
+        res = requests.post(gen_posts_path(), data=json.dumps(repost))
+        repost_id = res.json().get("id")
+        req_type = "POST"
+        route = gen_posts_route()
+        self.jsonable_test(res, req_type, route, 201, repost)
+        self.assertIn(
+            post_id,
+            res.json().get("repost_of", []),
+            wrong_value_error(req_type, route, res.json().get("repost_of"), [post_id], "repost_of", repost),
+        )
+
+        req_type = "GET"
+        params = {"link": "example.org/repost/"}
+        route = gen_posts_route(params=params)
+        res = requests.get(gen_posts_path(), params=params)
+        self.jsonable_test(res, req_type, route, 200)
+        post_ids = [post["id"] for post in res.json().get("posts")]
+        self.assertEqual(
+            post_ids[-2:],
+            [post_id, repost_id],
+            wrong_value_error(req_type, route, post_ids, [post_id, repost_id], "post ids"),
+        )
+
+    def test_conditional_get(self):
+        req_type = "GET"
+        route = gen_posts_route()
+        res = requests.get(gen_posts_path())
+        etag = res.headers.get("ETag")
+        self.assertIsNotNone(etag, wrong_value_error(req_type, route, res.headers, "an ETag", "headers"))
+        res = requests.get(gen_posts_path(), headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 304, status_code_error(req_type, route, res.status_code, 304))
+        res = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        post_id = res.json().get("id")
+        res = requests.get(gen_posts_path(), headers={"If-None-Match": etag})
+        self.jsonable_test(res, req_type, route, 200)
+
+        # comments are versioned per post.
+        route = gen_comments_route(post_id)
+        requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+        res = requests.get(gen_comments_path(post_id))
+        etag = res.headers.get("ETag")
+        other = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST)).json().get("id")
+        requests.post(gen_comments_path(other), data=json.dumps(SAMPLE_COMMENT))
+        res = requests.get(gen_comments_path(post_id), headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 304, status_code_error(req_type, route, res.status_code, 304))
+        requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+        res = requests.get(gen_comments_path(post_id), headers={"If-None-Match": etag})
+        self.jsonable_test(res, req_type, route, 200)
+        self.assertEqual(
+            len(res.json().get("comments")),
+            2,
+            wrong_value_error(req_type, route, res.json(), "both comments", "comments"),
+        )
+
+        # invalid query parameters are rejected even if the ETag matches.
+        route = gen_posts_route()
+        etag = requests.get(gen_posts_path()).headers.get("ETag")
+        for params in ({"limit": -1}, {"cursor": "bad"}, {"stream": "true", "limit": 1}):
+            res = requests.get(gen_posts_path(params=params), headers={"If-None-Match": etag})
+            self.jsonable_test(res, req_type, gen_posts_route(params=params), 400)
+        res = requests.get(gen_comments_path(post_id) + "?sort=old", headers={"If-None-Match": "*"})
+        self.jsonable_test(res, req_type, gen_comments_route(post_id), 400)
+
+    def test_export_import(self):
+        res = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        post_id = res.json().get("id")
+        requests.post(gen_comments_path(post_id), data=json.dumps(SAMPLE_COMMENT))
+
+        req_type = "GET"
+        route = "/api/export/"
+        res = requests.get(LOCAL_URL + route)
+        self.assertEqual(res.status_code, 200, status_code_error(req_type, route, res.status_code, 200))
+        lines = [json.loads(line) for line in res.text.splitlines()]
+        counters = lines[0].get("counters")
+        post_ids = [line["post"]["id"] for line in lines if "post" in line]
+        self.assertIn(post_id, post_ids, wrong_value_error(req_type, route, post_ids, post_id, "exported post ids"))
+
+        # import a post and a comment past the current ids.
+        new_post = dict(SAMPLE_POST, id=counters["next_post_id"] + 100, upvotes=7)
+        new_comment = dict(SAMPLE_COMMENT, id=counters["next_comment_id"] + 100, upvotes=2)
+        body = "\n".join(json.dumps(line) for line in [
+            {"counters": {"next_post_id": new_post["id"] + 50, "next_comment_id": new_comment["id"] + 1}},
+            {"post": new_post},
+            {"post_id": new_post["id"], "comment": new_comment},
+            {"post_id": new_post["id"], "voters": ["importer"]},
+        ])
+        req_type = "POST"
+        route = "/api/import/"
+        res = requests.post(LOCAL_URL + route, data=body)
+        self.jsonable_test(res, req_type, route, 200, body)
+        self.assertEqual(
+            res.json().get("imported"),
+            {"posts": 1, "comments": 1, "voters": 1},
+            wrong_value_error(req_type, route, res.json(), "one post, comment and voter", "imported", body),
+        )
+        res = requests.get(gen_posts_path(new_post["id"]))
+        self.assertEqual(
+            res.json().get("upvotes"),
+            7,
+            wrong_value_error("GET", gen_posts_route(new_post["id"]), res.json(), new_post, "imported post"),
+        )
+        # the id counter is restored past the imported counters.
+        res = requests.post(gen_posts_path(), data=json.dumps(SAMPLE_POST))
+        self.assertEqual(
+            res.json().get("id"),
+            new_post["id"] + 50,
+            wrong_value_error(req_type, gen_posts_route(), res.json(), new_post["id"] + 50, "id"),
+        )
+        # importing the same post again is refused.
+        res = requests.post(LOCAL_URL + route, data=json.dumps({"post": new_post}))
+        self.jsonable_test(res, req_type, route, 400)
+
+    def test_search(self):
+        post = dict(SAMPLE_POST, title="Search for zanzibar")
+        res = requests.post(gen_posts_path(), data=json.dumps(post))
+        post_id = res.json().get("id")
+        comment = dict(SAMPLE_COMMENT, text="Zanzibar again")
+        requests.post(gen_comments_path(post_id), data=json.dumps(comment))
+        req_type = "GET"
+
+        route = "/api/search/?q=ZANZIBAR"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        types = sorted(result["type"] for result in res.json().get("results"))
+        self.assertEqual(
+            types,
+            ["comment", "post"],
+            wrong_value_error(req_type, route, types, ["comment", "post"], "result types"),
+        )
+
+        route = "/api/search/?q=zanzibar+again"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        results = res.json().get("results")
+        self.assertEqual(
+            len(results),
+            1,
+            wrong_value_error(req_type, route, len(results), 1, "number of results"),
+        )
+
+        route = "/api/search/?q=+"
+        res = requests.get(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 400)
+
     def test_post_invalid_comment(self):
         req_type = "POST"
         route = gen_comments_route(10000)
@@ -485,6 +945,243 @@ class TestRoutes(unittest.TestCase):
             ),
         )
 
+    # -- DURABILITY ------------------------------------------
+
+    def test_wal_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            post_store = reopen_store(directory)
+            post_ids = [post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"] for _ in range(3)]
+            post_store.upvote_post(post_ids[0], 2)
+            comment = post_store.create_comment(post_ids[1], "First comment", "appdev")
+            post_store.edit_comment(post_ids[1], comment["id"], "Edited comment")
+            post_store.delete_post(post_ids[2])
+            post_store.snapshot()
+            # mutations after the snapshot are only in the log.
+            post_store.vote_post(post_ids[1], "voter")
+            post_store.create_comment(post_ids[0], "Second comment", "appdev")
+            post_store.delete_post(post_ids[0])
+            expected = list(post_store.export_lines())
+            post_store.close()
+
+            post_store = reopen_store(directory)
+            self.assertEqual(list(post_store.export_lines()), expected)
+            self.assertIsNone(post_store.get_post(post_ids[2]))
+            self.assertEqual(post_store.get_comments(post_ids[1])[0]["text"], "Edited comment")
+            # ids keep counting from where they stopped.
+            self.assertEqual(post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"], 3)
+            post_store.close()
+
+    def test_wal_torn_final_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            post_store = reopen_store(directory)
+            post_id = post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"]
+            post_store.upvote_post(post_id)
+            expected = list(post_store.export_lines())
+            post_store.close()
+            # a crash in the middle of a write leaves half a line.
+            segment = sorted(name for name in os.listdir(directory) if name.startswith(wal.SEGMENT_PREFIX))[-1]
+            with open(os.path.join(directory, segment), "a", encoding="utf-8") as log:
+                log.write('{"op": "upvote_post", "post_id": ')
+
+            post_store = reopen_store(directory)
+            self.assertEqual(list(post_store.export_lines()), expected)
+            post_store.upvote_post(post_id)
+            post_store.close()
+            post_store = reopen_store(directory)
+            self.assertEqual(post_store.get_post(post_id)["upvotes"], 3)
+            post_store.close()
+
+    def test_sharded_upvotes_concurrent(self):
+        post_store = store.PostStore(upvote_shards=8, flush_interval=60)
+        post_ids = [post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"] for _ in range(2)]
+
+        def vote():
+            for i in range(2000):
+                post_store.upvote_post(post_ids[i % 2])
+
+        threads = [Thread(target=vote) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        post_store.flush_upvotes()
+        # 1 upvote at creation, plus 8 threads * 1000 upvotes per post.
+        self.assertEqual([post_store.get_post(post_id)["upvotes"] for post_id in post_ids], [8001, 8001])
+        self.assertEqual(list(post_store.upvote_keys()), [(8001, post_ids[0]), (8001, post_ids[1])])
+        post_store.close()
+
+    def test_pagination_under_writes(self):
+        post_store = store.PostStore()
+        stable = [post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"] for _ in range(500)]
+        for i, post_id in enumerate(stable):
+            post_store.upvote_post(post_id, i % 50)
+        done = Event()
+
+        # insert and delete other posts, at upvotes among the stable ones.
+        def write():
+            i = 0
+            while not done.is_set():
+                post_id = post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"]
+                post_store.upvote_post(post_id, i % 50)
+                post_store.delete_post(post_id)
+                i += 1
+                sleep(0)
+
+        writer = Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(20):
+                for reverse in (False, True):
+                    keys, cursor = [], None
+                    while True:
+                        page = list(islice(post_store.upvote_keys(cursor, reverse=reverse), 20))
+                        if not page:
+                            break
+                        keys += page
+                        cursor = page[-1]
+                        # let the writer run between pages, like between requests.
+                        sleep(0)
+                    # cursors only move forward: every key is listed once, in order, and no stable post is missed.
+                    self.assertEqual(keys, sorted(set(keys), reverse=reverse))
+                    listed = [post_id for _, post_id in keys if post_id in stable]
+                    self.assertEqual(sorted(listed), stable)
+        finally:
+            done.set()
+            writer.join()
+        post_store.close()
+
+    def test_pagination_waits_for_lower_ids(self):
+        post_store = store.PostStore()
+        first = post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"]
+        # a post whose id was allocated, but which isn't indexed yet.
+        slow = post_store._allocate_post_id()
+        fast = post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"]
+        # the later post isn't listed before the slow one, so a cursor can't pass the slow one.
+        self.assertEqual(list(post_store.post_keys()), [first])
+        self.assertEqual(list(post_store.user_post_keys("appdev")), [first])
+        post_store._insert_post(store.Post(slow, 1, "Hello, World!", "cornellappdev.com", "appdev"))
+        post_store._publish_post_id(slow)
+        self.assertEqual(list(post_store.post_keys(first)), [slow, fast])
+        post_store.close()
+
+    def test_sharded_upvotes_delete_then_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            post_store = store.PostStore(wal=wal.WriteAheadLog(directory), upvote_shards=4, flush_interval=60)
+            post_ids = [post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"] for _ in range(2)]
+            post_store.upvote_post(post_ids[0], 5)
+            post_store.upvote_post(post_ids[1], 2)
+            post_store.flush_upvotes()
+            # buffered upvotes of a deleted post are dropped with it, also on replay.
+            post_store.upvote_post(post_ids[0], 3)
+            post_store.delete_post(post_ids[0])
+            post_store.close()
+
+            post_store = store.PostStore(wal=wal.WriteAheadLog(directory), upvote_shards=4, flush_interval=60)
+            self.assertIsNone(post_store.get_post(post_ids[0]))
+            self.assertEqual(post_store.get_post(post_ids[1])["upvotes"], 3)
+            post_store.close()
+
+    def test_voter_ids_released(self):
+        with tempfile.TemporaryDirectory() as directory:
+            post_store = store.PostStore(wal=wal.WriteAheadLog(directory))
+            post_ids = [post_store.create_post("Hello, World!", "cornellappdev.com", "appdev")["id"] for _ in range(2)]
+            for voter in ("alice", "bob", "carol"):
+                post_store.vote_post(post_ids[0], voter)
+            post_store.vote_post(post_ids[1], "bob")
+            # a voter's id is released with its last vote, by an unvote or a delete.
+            post_store.unvote_post(post_ids[0], "alice")
+            post_store.delete_post(post_ids[0])
+            self.assertEqual(len(post_store.voter_registry), 1)
+            # released ids are reused.
+            post_store.vote_post(post_ids[1], "dave")
+            self.assertEqual(post_store.voter_registry.get("dave"), 0)
+            post_store.snapshot()
+            post_store.unvote_post(post_ids[1], "bob")
+            post_store.close()
+
+            post_store = reopen_store(directory)
+            self.assertEqual(len(post_store.voter_registry), 1)
+            post, recorded = post_store.vote_post(post_ids[1], "dave")
+            self.assertFalse(recorded)
+            self.assertEqual(post["upvotes"], 2)
+            post_store.close()
+
+    def test_failed_import_then_restart(self):
+        source = store.PostStore()
+        source.create_post("Hello, World!", "cornellappdev.com", "appdev")
+        lines = list(source.export_lines()) + [{"unknown": 0}]
+        source.close()
+        with tempfile.TemporaryDirectory() as directory:
+            post_store = store.PostStore(wal=wal.WriteAheadLog(directory))
+            # a bad line rejects its whole batch.
+            with self.assertRaises(ValueError):
+                post_store.import_lines(lines)
+            self.assertIsNone(post_store.get_post(0))
+            # the imported post survives a restart with its upvotes.
+            post_store.import_lines(lines[:-1])
+            post_store.upvote_post(0, 2)
+            post_store.close()
+
+            post_store = reopen_store(directory)
+            self.assertEqual(post_store.get_post(0)["upvotes"], 3)
+            post_store.close()
+
+    def test_rejected_import_stores_nothing(self):
+        post = {"id": 10, "upvotes": 1, "title": "Hello", "link": "cornellappdev.com", "username": "appdev"}
+        comment = {"id": 20, "upvotes": 1, "text": "Hi", "username": "appdev", "parent_id": None}
+        good = [{"post": post}, {"post_id": 10, "comment": comment}, {"post_id": 10, "voters": ["dave"]}]
+        bad_lines = [
+            {"post": dict(post, id=11, created="yesterday")},
+            {"post": dict(post, id=11, expires=[])},
+            {"post_id": 10, "comment": dict(comment, id=21, parent_id="20")},
+            {"post_id": 10, "comment": dict(comment, id=21, parent_id=[20])},
+            # a parent that comes later in the batch.
+            {"post_id": 10, "comment": dict(comment, id=21, parent_id=22)},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            post_store = store.PostStore(wal=wal.WriteAheadLog(directory))
+            for bad in bad_lines:
+                with self.assertRaises((TypeError, ValueError)):
+                    post_store.import_lines(good + [bad])
+                self.assertIsNone(post_store.get_post(10))
+                self.assertFalse(post_store.has_comments(10))
+            # a batch that can't be logged is removed again.
+            log = post_store._log
+            post_store._log = lambda entry: 1 / 0
+            with self.assertRaises(ZeroDivisionError):
+                post_store.import_lines(good)
+            post_store._log = log
+            self.assertIsNone(post_store.get_post(10))
+            self.assertEqual(list(post_store.search_keys("hello")), [])
+            self.assertEqual(len(post_store.voter_registry), 0)
+
+            counts = post_store.import_lines(good + [{"post_id": 10, "comment": dict(comment, id=21, parent_id=20)}])
+            self.assertEqual(counts, {"posts": 1, "comments": 2, "voters": 1})
+            post_store.close()
+
+            post_store = reopen_store(directory)
+            self.assertEqual(post_store.get_comment(10, 21)["parent_id"], 20)
+            self.assertIsNotNone(post_store.delete_post(10))
+            post_store.close()
+
+    def test_sqlite_expiry_reads_first(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pa1.db")
+            post_store = sqlite_store.SqliteStore(path, expiry_interval=3600)
+            post_store.create_post("Hello, World!", "cornellappdev.com", "appdev", ttl=60)
+            # another writer holds the write lock, and the store doesn't wait for it.
+            writer = sqlite3.connect(path, isolation_level=None)
+            writer.execute("BEGIN IMMEDIATE;")
+            post_store.conn.execute("PRAGMA busy_timeout = 0;")
+            # nothing expired: no write transaction is needed.
+            self.assertEqual(post_store.expire_posts(), 0)
+            with self.assertRaises(sqlite3.OperationalError):
+                post_store.expire_posts(time.time() + 120)
+            writer.execute("ROLLBACK;")
+            writer.close()
+            self.assertEqual(post_store.expire_posts(time.time() + 120), 1)
+            post_store.close()
+
     # -- EXTRA CREDIT ------------------------------------------
 
     def test_extra_create_post(self):
@@ -611,6 +1308,18 @@ class TestRoutes(unittest.TestCase):
             ),
         )
 
+    def test_extra_create_post_invalid_link(self):
+        if not EXTRA_CREDIT:
+            return
+        req_type = "POST"
+        route = gen_posts_route(extra=True)
+        for link in ["cornellappdev", "a." + "c" * 10000 + "!"]:
+            body = dict(SAMPLE_POST, link=link)
+            res = requests.post(
+                gen_posts_path(extra=True), data=json.dumps(body)
+            )
+            self.jsonable_test(res, req_type, route, 400, body)
+
     def test_extra_post_comment(self):
         if not EXTRA_CREDIT:
             return
@@ -960,6 +1669,102 @@ class TestRoutes(unittest.TestCase):
         )
 
 
+    def test_extra_sorting_posts_limit(self):
+        if not EXTRA_CREDIT:
+            return
+        req_type = "GET"
+        for _ in range(3):
+            requests.post(
+                gen_posts_path(extra=True), data=json.dumps(SAMPLE_POST)
+            )
+        params = {"sort": "decreasing", "limit": 2}
+        route = gen_posts_route(extra=True, params=params)
+        res = requests.get(gen_posts_path(extra=True, params=params))
+        self.jsonable_test(res, req_type, route, 200)
+        posts = res.json().get("posts")
+        self.assertEqual(
+            len(posts),
+            2,
+            wrong_value_error(
+                req_type, route, len(posts), 2, "number of posts"
+            ),
+        )
+        all_posts = requests.get(
+            gen_posts_path(extra=True, params={"sort": "decreasing"})
+        ).json().get("posts")
+        self.assertEqual(
+            posts,
+            all_posts[:2],
+            wrong_value_error(
+                req_type, route, posts, all_posts[:2], "posts"
+            ),
+        )
+
+        params = {"sort": "decreasing", "limit": -1}
+        route = gen_posts_route(extra=True, params=params)
+        res = requests.get(gen_posts_path(extra=True, params=params))
+        self.jsonable_test(res, req_type, route, 400)
+
+    def test_extra_vote_once_per_voter(self):
+        if not EXTRA_CREDIT:
+            return
+        res = requests.post(
+            gen_posts_path(extra=True), data=json.dumps(SAMPLE_POST)
+        )
+        post_id = res.json().get("id")
+        req_type = "POST"
+        route = gen_posts_route(post_id, extra=True)
+        body = {"voter": "alice"}
+        res = requests.post(gen_posts_path(post_id, extra=True), data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 200, body)
+        upvotes = res.json().get("upvotes")
+        self.assertEqual(
+            upvotes, 2, wrong_value_error(req_type, route, upvotes, 2, "upvotes", body)
+        )
+        res = requests.post(gen_posts_path(post_id, extra=True), data=json.dumps(body))
+        self.jsonable_test(res, req_type, route, 409, body)
+
+        req_type = "DELETE"
+        route = f"/api/extra/posts/{post_id}/votes/alice/"
+        res = requests.delete(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 200)
+        upvotes = res.json().get("upvotes")
+        self.assertEqual(
+            upvotes, 1, wrong_value_error(req_type, route, upvotes, 1, "upvotes")
+        )
+        res = requests.delete(LOCAL_URL + route)
+        self.jsonable_test(res, req_type, route, 404)
+
+    def test_extra_sorting_posts_hot(self):
+        if not EXTRA_CREDIT:
+            return
+        req_type = "GET"
+        res = requests.post(
+            gen_posts_path(extra=True), data=json.dumps(SAMPLE_POST)
+        )
+        post_id = res.json().get("id")
+        requests.post(
+            gen_posts_path(post_id, extra=True), data=json.dumps({"upvotes": 10000})
+        )
+        params = {"sort": "hot", "limit": 1}
+        route = gen_posts_route(extra=True, params=params)
+        res = requests.get(gen_posts_path(extra=True, params=params))
+        self.jsonable_test(res, req_type, route, 200)
+        hottest = res.json().get("posts")[0].get("id")
+        self.assertEqual(
+            hottest,
+            post_id,
+            wrong_value_error(
+                req_type, route, hottest, post_id, "hottest post id"
+            ),
+        )
+
+
+# Open a memory store logging to "directory", recovering what is there.
+def reopen_store(directory):
+    return store.PostStore(wal=wal.WriteAheadLog(directory))
+
+
 def run_tests():
     sleep(1.5)
     sys.argv = sys.argv[:1]
@@ -0,0 +1,24 @@
+"""
+Ranking scores shared by the stores.
+"""
+import math
+
+# origin of the creation times used by hot scores, 2020-09-13 UTC.
+HOT_EPOCH = 1_600_000_000
+# age, in seconds, that weighs as much as a tenfold increase of the upvotes.
+HOT_DECAY_SECONDS = 45_000
+
+
+"""
+Score a post for the "hot" feed from its upvotes and creation time.
+
+Scores decay with age: a post needs ten times the upvotes of a post created
+HOT_DECAY_SECONDS later to rank the same. Instead of lowering every score
+as time passes, newer posts get a higher base score, which gives exactly the
+same order. A score then only changes when the post is upvoted, so it can be
+kept in a sorted index that is updated incrementally.
+"""
+def hot_score(upvotes, created):
+    order = math.log10(max(abs(upvotes), 1))
+    sign = 1 if upvotes > 0 else -1 if upvotes < 0 else 0
+    return round(sign * order + (created - HOT_EPOCH) / HOT_DECAY_SECONDS, 7)
@@ -0,0 +1,98 @@
+import sys
+import time
+
+
+class Post(object):
+    """
+    Compact, immutable record of a post.
+    Uses __slots__ instead of a per-instance dict, and interns usernames
+    so that every post of the same user shares one string.
+    Since a post never changes, its JSON encoding can be cached on it;
+    replace() returns a new post with an empty cache.
+    """
+
+    __slots__ = ("id", "upvotes", "title", "link", "username", "created", "expires", "encoded")
+
+    # Constructor.
+    # created -- creation time in seconds since the epoch, now if None.
+    # expires -- time the post expires at in seconds since the epoch, None to keep it.
+    def __init__(self, id, upvotes, title, link, username, created=None, expires=None):
+        # cached JSON encoding of the post, filled in by the store on first read.
+        self.encoded = None
+        self.id = id
+        self.upvotes = upvotes
+        self.title = title
+        self.link = link
+        self.username = sys.intern(username)
+        self.created = time.time() if created is None else created
+        self.expires = expires
+
+    # Build a post from its dict representation.
+    # Posts stored before creation times were recorded are created now,
+    # and posts stored before expiry was supported never expire.
+    @classmethod
+    def from_dict(cls, post):
+        return cls(
+            post["id"], post["upvotes"], post["title"], post["link"], post["username"], post.get("created"),
+            post.get("expires")
+        )
+
+    # Return a copy of the post with some fields changed.
+    def replace(self, **changes):
+        fields = {name: getattr(self, name) for name in self.__slots__ if name != "encoded"}
+        fields.update(changes)
+        return Post(**fields)
+
+    # Return the dict representation of the post, as sent to clients.
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "upvotes": self.upvotes,
+            "title": self.title,
+            "link": self.link,
+            "username": self.username,
+            "created": self.created,
+            "expires": self.expires
+        }
+
+
+class Comment(object):
+    """
+    Compact, immutable record of a comment.
+    Uses __slots__ instead of a per-instance dict, and interns usernames.
+    """
+
+    __slots__ = ("id", "upvotes", "text", "username", "parent_id", "encoded")
+
+    # Constructor.
+    # parent_id -- id of the comment this one replies to, None for a top-level comment.
+    def __init__(self, id, upvotes, text, username, parent_id=None):
+        # cached JSON encoding of the comment, filled in by the store on first read.
+        self.encoded = None
+        self.id = id
+        self.upvotes = upvotes
+        self.text = text
+        self.username = sys.intern(username)
+        self.parent_id = parent_id
+
+    # Build a comment from its dict representation.
+    # Comments stored before replies were supported are top-level comments.
+    @classmethod
+    def from_dict(cls, comment):
+        return cls(comment["id"], comment["upvotes"], comment["text"], comment["username"], comment.get("parent_id"))
+
+    # Return a copy of the comment with some fields changed.
+    def replace(self, **changes):
+        fields = {name: getattr(self, name) for name in self.__slots__ if name != "encoded"}
+        fields.update(changes)
+        return Comment(**fields)
+
+    # Return the dict representation of the comment, as sent to clients.
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "upvotes": self.upvotes,
+            "text": self.text,
+            "username": self.username,
+            "parent_id": self.parent_id
+        }
@@ -0,0 +1,245 @@
+import heapq
+import math
+import re
+import sys
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import islice
+
+# a token is a run of letters, digits or underscores.
+TOKEN_PATTERN = re.compile(r"\w+")
+# BM25 parameters: term frequency saturation and document length normalisation.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# number of posting lists sampled to estimate the size of the index.
+SIZE_SAMPLE = 100
+# number of queries whose ranking is kept for the following pages.
+RANKING_CACHE_SIZE = 8
+
+
+# Split a text into lowercase tokens.
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+# Document ids shared by the stores: even for posts, odd for comments.
+def post_doc(post_id):
+    return 2 * post_id
+
+
+def comment_doc(comment_id):
+    return 2 * comment_id + 1
+
+
+# Whether a document id is a post's, its post or comment id is then doc // 2.
+def is_post_doc(doc):
+    return doc % 2 == 0
+
+
+class SearchIndex(object):
+    """
+    In-memory inverted index for full-text search.
+
+    Every document is identified by an integer and indexed by its tokens:
+    each token maps to a posting list {doc: number of occurrences}. A query
+    matches the documents containing all of its tokens, found by walking the
+    shortest posting list and probing the others, and ranks them by BM25.
+
+    Documents can be added, replaced and removed at any time; the index is
+    guarded by its own lock, since documents of different posts are written
+    under different striped locks. Searches only hold it to copy the shortest
+    posting list: scoring and ranking run outside of it, so a search of a
+    common word doesn't stall the writers.
+
+    The ranking of the last few queries is cached until the index changes,
+    so the following pages of a query continue it instead of scoring every
+    match again.
+    """
+
+    # Constructor.
+    def __init__(self):
+        self._lock = threading.Lock()
+        # token -> {doc -> occurrences of the token in the doc}.
+        self._postings = {}
+        # doc -> distinct tokens of the doc, to remove it again.
+        self._docs = {}
+        # doc -> number of tokens of the doc.
+        self._lengths = {}
+        # total number of tokens of all documents, for the average length.
+        self._total_length = 0
+        # incremented on every change, rankings of an older version are stale.
+        self._version = 0
+        # sorted query tokens -> Ranking, least recently used first.
+        self._rankings = OrderedDict()
+        self._rankings_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    # Approximate bytes of the index: the containers are measured, and the
+    # posting lists and token tuples are estimated from the first ones.
+    def __sizeof__(self):
+        size = object.__sizeof__(self)
+        with self._lock:
+            size += sys.getsizeof(self._postings) + sys.getsizeof(self._docs) + sys.getsizeof(self._lengths)
+            for container in (self._postings, self._docs):
+                sample = list(islice(container.values(), SIZE_SAMPLE))
+                if sample:
+                    size += len(container) * sum(map(sys.getsizeof, sample)) // len(sample)
+        return size
+
+    # Number of distinct tokens.
+    def vocabulary_size(self):
+        return len(self._postings)
+
+    # Index a document, replacing its previous text if any.
+    def add(self, doc, text):
+        tokens = tokenize(text)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        with self._lock:
+            self._remove(doc)
+            for token, count in counts.items():
+                # intern tokens so that every posting list shares one key string.
+                self._postings.setdefault(sys.intern(token), {})[doc] = count
+            self._docs[doc] = tuple(counts)
+            self._lengths[doc] = len(tokens)
+            self._total_length += len(tokens)
+            self._version += 1
+
+    # Remove a document from the index, if it is indexed.
+    def remove(self, doc):
+        with self._lock:
+            self._remove(doc)
+
+    # Requires: the index lock is held.
+    def _remove(self, doc):
+        tokens = self._docs.pop(doc, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            postings = self._postings[token]
+            del postings[doc]
+            if not postings:
+                del self._postings[token]
+        self._total_length -= self._lengths.pop(doc)
+        self._version += 1
+
+    # Score every document matching all "tokens".
+    # Returns (version of the index, list of (-score, -doc) keys, unordered).
+    # Only the shortest posting list is copied under the lock; the others are
+    # probed afterwards, so a doc changed meanwhile may be scored with its new
+    # text, and one removed meanwhile is skipped.
+    def _match(self, tokens):
+        with self._lock:
+            version = self._version
+            postings = []
+            for token in tokens:
+                posting = self._postings.get(token)
+                if posting is None:
+                    return version, []
+                postings.append((len(posting), posting))
+            if not postings:
+                return version, []
+            postings.sort(key=lambda entry: entry[0])
+            sizes = [size for size, _ in postings]
+            shortest = dict(postings[0][1])
+            others = [posting for _, posting in postings[1:]]
+            count = len(self._docs)
+            total_length = self._total_length
+        lengths = self._lengths
+        # the BM25 length normalisation of a doc is base + slope * length.
+        base = BM25_K1 * (1 - BM25_B)
+        slope = BM25_K1 * BM25_B * count / total_length
+        # inverse document frequency of each token, times the numerator constant.
+        weights = [(BM25_K1 + 1) * math.log(1 + (count - size + 0.5) / (size + 0.5)) for size in sizes]
+        matches = []
+        # single-word queries are the common case, scored in one pass.
+        if not others:
+            weight = weights[0]
+            for doc, tf in shortest.items():
+                length = lengths.get(doc)
+                if length is not None:
+                    matches.append((-weight * tf / (tf + base + slope * length), -doc))
+            return version, matches
+        for doc, tf in shortest.items():
+            tfs = [posting.get(doc) for posting in others]
+            length = lengths.get(doc)
+            if length is None or None in tfs:
+                continue
+            norm = base + slope * length
+            score = weights[0] * tf / (tf + norm)
+            for tf, weight in zip(tfs, weights[1:]):
+                score += weight * tf / (tf + norm)
+            matches.append((-score, -doc))
+        return version, matches
+
+    # The ranking of the documents matching all tokens of "query", from the
+    # cache if the index didn't change since it was computed.
+    def _ranking(self, query):
+        tokens = tuple(sorted(set(tokenize(query))))
+        with self._rankings_lock:
+            ranking = self._rankings.get(tokens)
+            if ranking is not None and ranking.version == self._version:
+                self._rankings.move_to_end(tokens)
+                return ranking
+        version, matches = self._match(tokens)
+        ranking = Ranking(version, matches)
+        with self._rankings_lock:
+            self._rankings[tokens] = ranking
+            self._rankings.move_to_end(tokens)
+            while len(self._rankings) > RANKING_CACHE_SIZE:
+                self._rankings.popitem(last=False)
+        return ranking
+
+    # Yield the (score, doc) keys of the documents matching all tokens of
+    # "query", best first, starting after the key "after" if given.
+    # Only the yielded keys are sorted: the first page of k results out of
+    # m matches costs O(m + k log m), and the next pages continue the same
+    # ranking while the index doesn't change.
+    # Scores depend on the whole index, so a cursor resumes at the same
+    # score rather than at the same rank if documents changed in between.
+    def search(self, query, after=None):
+        ranking = self._ranking(query)
+        if after is not None:
+            after = (-after[0], -after[1])
+        for score, doc in ranking.iter_after(after):
+            yield -score, -doc
+
+
+class Ranking(object):
+    """
+    Matches of a query, sorted lazily: the keys sorted so far, and a heap of
+    the others, from which more are popped when a page needs them.
+
+    Keys are (-score, -doc), so that the best match is the smallest.
+    Thread-safe: pages of the same query can be read concurrently.
+    """
+
+    # Constructor.
+    # version -- version of the index the matches were scored at.
+    # matches -- list of keys, unordered; it is heapified in place.
+    def __init__(self, version, matches):
+        self.version = version
+        heapq.heapify(matches)
+        self._heap = matches
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    # Yield the keys greater than "after", or all of them, in order.
+    def iter_after(self, after=None):
+        index = 0 if after is None else bisect_right(self._sorted, after)
+        while True:
+            if index == len(self._sorted):
+                with self._lock:
+                    # another reader may have sorted more keys meanwhile.
+                    if index == len(self._sorted):
+                        if not self._heap:
+                            return
+                        self._sorted.append(heapq.heappop(self._heap))
+            key = self._sorted[index]
+            index += 1
+            if after is None or key > after:
+                yield key
@@ -0,0 +1,231 @@
+import sys
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+
+# number of keys sampled to estimate the size of the keys.
+SIZE_SAMPLE = 100
+# target number of chunks per segment.
+FANOUT = 32
+
+
+# Approximate bytes of a key and of the values of a tuple key.
+def key_bytes(key):
+    size = sys.getsizeof(key)
+    if type(key) is tuple:
+        size += sum(map(sys.getsizeof, key))
+    return size
+
+
+class SortedIndex(object):
+    """
+    Sorted container of comparable keys, e.g. (upvotes, post_id) tuples.
+    Keys are kept in sorted chunks, grouped in segments of up to 2 * FANOUT
+    chunks, so that adding or removing a key costs O(log n) comparisons plus
+    copies bounded by the chunk and segment sizes, instead of re-sorting the
+    whole collection on every read.
+
+    The index is copy-on-write: a published chunk or segment is never
+    changed. Every write copies the chunk and the segment it changes, and
+    the short list of segments, then publishes them with a single assignment
+    of the state. A reader takes the state once and iterates over that
+    version, without any lock, while writers go on: it never sees a half-done
+    write, and a key moved by replace() is seen exactly once.
+
+    Writers must be serialised by the caller; readers need no lock.
+    """
+
+    # Constructor.
+    # load -- target number of keys per chunk.
+    def __init__(self, keys=(), load=128):
+        self._load = load
+        # current version: (list of segments, the largest key of every
+        # segment to locate segments by bisection, number of keys).
+        # A segment is a tuple (list of sorted chunks, the largest key of
+        # every chunk, number of keys).
+        self._state = ([], [], 0)
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return self._state[2]
+
+    def __iter__(self):
+        for chunks, _, _ in self._state[0]:
+            for chunk in chunks:
+                yield from chunk
+
+    def __reversed__(self):
+        for chunks, _, _ in reversed(self._state[0]):
+            for chunk in reversed(chunks):
+                yield from reversed(chunk)
+
+    # Approximate bytes of the index, its chunks and its keys,
+    # the size of the keys being estimated from the first ones.
+    def __sizeof__(self):
+        segments, seg_maxes, length = self._state
+        size = object.__sizeof__(self) + sys.getsizeof(segments) + sys.getsizeof(seg_maxes)
+        for segment in segments:
+            chunks, maxes, _ = segment
+            size += sys.getsizeof(segment) + sys.getsizeof(chunks) + sys.getsizeof(maxes)
+            size += sum(map(sys.getsizeof, chunks))
+        if segments:
+            sample = segments[0][0][0][:SIZE_SAMPLE]
+            size += length * sum(map(key_bytes, sample)) // len(sample)
+        return size
+
+    def __contains__(self, key):
+        segments, seg_maxes, _ = self._state
+        pos = bisect_left(seg_maxes, key)
+        if pos == len(seg_maxes):
+            return False
+        chunks, maxes, _ = segments[pos]
+        chunk = chunks[bisect_left(maxes, key)]
+        return chunk[bisect_left(chunk, key)] == key
+
+    # Insert a key, keeping the index sorted.
+    def add(self, key):
+        segments, seg_maxes, length = self._state
+        segments, seg_maxes = segments[:], seg_maxes[:]
+        self._insert(segments, seg_maxes, key)
+        self._state = (segments, seg_maxes, length + 1)
+
+    # Remove a key.
+    # Raises KeyError if the key is not stored.
+    def remove(self, key):
+        segments, seg_maxes, length = self._state
+        segments, seg_maxes = segments[:], seg_maxes[:]
+        self._delete(segments, seg_maxes, key)
+        self._state = (segments, seg_maxes, length - 1)
+
+    # Remove a key if it is stored.
+    def discard(self, key):
+        try:
+            self.remove(key)
+        except KeyError:
+            pass
+
+    # Replace the key "old" by "new" in one version, e.g. when the upvotes
+    # of a post change: readers see either key, never both or neither.
+    # Raises KeyError if "old" is not stored.
+    def replace(self, old, new):
+        segments, seg_maxes, length = self._state
+        segments, seg_maxes = segments[:], seg_maxes[:]
+        self._delete(segments, seg_maxes, old)
+        self._insert(segments, seg_maxes, new)
+        self._state = (segments, seg_maxes, length)
+
+    # Insert a key into new lists of segments, copying the segment and the chunk it goes to.
+    def _insert(self, segments, seg_maxes, key):
+        if not segments:
+            segments.append(([[key]], [key], 1))
+            seg_maxes.append(key)
+            return
+        # a key larger than every stored key goes to the last segment and chunk.
+        pos = min(bisect_right(seg_maxes, key), len(seg_maxes) - 1)
+        chunks, maxes, count = segments[pos]
+        chunks, maxes = chunks[:], maxes[:]
+        at = min(bisect_right(maxes, key), len(maxes) - 1)
+        chunk = chunks[at][:]
+        insort(chunk, key)
+        # split chunks that grew too large, then segments that did.
+        if len(chunk) > 2 * self._load:
+            chunks[at:at + 1] = [chunk[:self._load], chunk[self._load:]]
+            maxes[at:at + 1] = [chunk[self._load - 1], chunk[-1]]
+        else:
+            chunks[at] = chunk
+            maxes[at] = chunk[-1]
+        if len(chunks) > 2 * FANOUT:
+            head = sum(map(len, chunks[:FANOUT]))
+            segments[pos:pos + 1] = [
+                (chunks[:FANOUT], maxes[:FANOUT], head),
+                (chunks[FANOUT:], maxes[FANOUT:], count + 1 - head),
+            ]
+            seg_maxes[pos:pos + 1] = [maxes[FANOUT - 1], maxes[-1]]
+        else:
+            segments[pos] = (chunks, maxes, count + 1)
+            seg_maxes[pos] = maxes[-1]
+
+    # Remove a key from new lists of segments, copying the segment and the chunk it was in.
+    def _delete(self, segments, seg_maxes, key):
+        pos = bisect_left(seg_maxes, key)
+        if pos == len(seg_maxes):
+            raise KeyError(key)
+        chunks, maxes, count = segments[pos]
+        at = bisect_left(maxes, key)
+        chunk = chunks[at]
+        idx = bisect_left(chunk, key)
+        if chunk[idx] != key:
+            raise KeyError(key)
+        # drop empty chunks and segments, otherwise refresh their max.
+        chunks, maxes = chunks[:], maxes[:]
+        if len(chunk) == 1:
+            del chunks[at]
+            del maxes[at]
+        else:
+            chunk = chunk[:idx] + chunk[idx + 1:]
+            chunks[at] = chunk
+            maxes[at] = chunk[-1]
+        if not chunks:
+            del segments[pos]
+            del seg_maxes[pos]
+        else:
+            segments[pos] = (chunks, maxes, count - 1)
+            seg_maxes[pos] = maxes[-1]
+
+    # Yield keys in order, skipping the first "start" keys.
+    # At most "limit" keys are yielded (all of them if limit is None).
+    # If reverse is True, keys are yielded from the largest to the smallest.
+    def islice(self, start=0, limit=None, reverse=False):
+        segments, _, length = self._state
+        remaining = length if limit is None else limit
+        for chunks, _, count in (reversed(segments) if reverse else segments):
+            # skip whole segments, then whole chunks, before the start position.
+            if start >= count:
+                start -= count
+                continue
+            for chunk in (reversed(chunks) if reverse else chunks):
+                if remaining <= 0:
+                    return
+                if start >= len(chunk):
+                    start -= len(chunk)
+                    continue
+                if reverse:
+                    end = len(chunk) - start
+                    keys = chunk[max(end - remaining, 0):end][::-1]
+                else:
+                    keys = chunk[start:start + remaining]
+                start = 0
+                remaining -= len(keys)
+                yield from keys
+
+    # Yield keys strictly greater than "key" in increasing order,
+    # or strictly smaller than "key" in decreasing order if reverse is True.
+    def iter_from(self, key, reverse=False):
+        segments, seg_maxes, _ = self._state
+        if not segments:
+            return
+        if reverse:
+            pos = min(bisect_left(seg_maxes, key), len(seg_maxes) - 1)
+            chunks, maxes, _ = segments[pos]
+            at = min(bisect_left(maxes, key), len(maxes) - 1)
+            chunk = chunks[at]
+            yield from reversed(chunk[:bisect_left(chunk, key)])
+            for i in range(at - 1, -1, -1):
+                yield from reversed(chunks[i])
+            for i in range(pos - 1, -1, -1):
+                for chunk in reversed(segments[i][0]):
+                    yield from reversed(chunk)
+        else:
+            pos = bisect_right(seg_maxes, key)
+            if pos == len(seg_maxes):
+                return
+            chunks, maxes, _ = segments[pos]
+            at = bisect_right(maxes, key)
+            chunk = chunks[at]
+            yield from chunk[bisect_right(chunk, key):]
+            for i in range(at + 1, len(chunks)):
+                yield from chunks[i]
+            for i in range(pos + 1, len(segments)):
+                for chunk in segments[i][0]:
+                    yield from chunk
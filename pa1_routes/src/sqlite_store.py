@@ -0,0 +1,703 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from itertools import islice
+
+from links import normalize_link
+from ranking import hot_score
+from search import comment_doc
+from search import is_post_doc
+from search import post_doc
+from search import tokenize
+from store import IMPORT_BATCH_SIZE
+from store import Store
+
+# number of keys fetched per query while iterating over posts.
+KEY_BATCH_SIZE = 500
+
+
+class SqliteStore(Store):
+    """
+    Store backed by a SQLite database in WAL mode.
+    Every worker process (and every thread) opens its own connection to the
+    same file, so all workers share the same posts and comments. WAL mode
+    lets readers run concurrently with the single writer, and every write
+    runs in a BEGIN IMMEDIATE transaction so that read-modify-write
+    sequences are atomic across processes.
+
+    Expired posts are found through the indexes on the expiry and creation
+    times by a background thread of every worker, every expiry_interval
+    seconds; a post is archived and deleted in one transaction, so only one
+    worker archives it.
+
+    Every write transaction bumps the version of the store in the meta table,
+    and records the new value in the version column of the post it changed.
+    Versions are prefixed by a random epoch drawn when the database is created.
+    """
+
+    # Constructor.
+    # path -- database file shared by the workers.
+    # posts -- initial post dicts, inserted once when the database is created.
+    # retention -- seconds after their creation at which all posts expire, None to keep them.
+    # archive -- sink the expired posts are handed to, e.g. archive.NdjsonArchive, None to drop them.
+    # expiry_interval -- seconds between two looks for expired posts.
+    def __init__(self, path, posts=(), retention=None, archive=None, expiry_interval=1.0):
+        self.path = path
+        self.retention = retention
+        self._archive = archive
+        self._local = threading.local()
+        self.create_tables(posts)
+        self._closed = threading.Event()
+        self._expiry_interval = expiry_interval
+        threading.Thread(target=self._expiry_loop, daemon=True).start()
+
+    # Get the connection of the current thread, opened on first use.
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE.
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            self._local.conn = conn
+        return conn
+
+    # Run "work(conn)" in a write transaction and return its result.
+    def _write(self, work):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        conn.execute("COMMIT;")
+        return result
+
+    # Bump the version of the store, and set the version of a post to the same value.
+    # Requires: a write transaction is open.
+    def _bump_version(self, conn, post_id=None):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version';")
+        if post_id is not None:
+            conn.execute(
+                "UPDATE post SET version = (SELECT value FROM meta WHERE key = 'version') WHERE id = ?;", (post_id, )
+            )
+
+    # Create the tables if needed, and insert the initial posts exactly once,
+    # even if several workers start at the same time.
+    def create_tables(self, posts):
+        def create(conn):
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS post (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    upvotes INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    link TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    created REAL NOT NULL DEFAULT 0,
+                    hot REAL NOT NULL DEFAULT 0,
+                    link_key TEXT,
+                    expires REAL,
+                    version INTEGER NOT NULL DEFAULT 0
+                );
+                """
+            )
+            # databases created before hot scores were kept lack the last two columns.
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(post);")}
+            if "created" not in columns:
+                now = time.time()
+                conn.execute("ALTER TABLE post ADD COLUMN created REAL NOT NULL DEFAULT 0;")
+                conn.execute("ALTER TABLE post ADD COLUMN hot REAL NOT NULL DEFAULT 0;")
+                for post_id, upvotes in conn.execute("SELECT id, upvotes FROM post;").fetchall():
+                    conn.execute(
+                        "UPDATE post SET created = ?, hot = ? WHERE id = ?;",
+                        (now, hot_score(upvotes, now), post_id)
+                    )
+            # the normalised link of every post, see links.normalize_link.
+            if "link_key" not in columns:
+                conn.execute("ALTER TABLE post ADD COLUMN link_key TEXT;")
+                for post_id, link in conn.execute("SELECT id, link FROM post;").fetchall():
+                    conn.execute("UPDATE post SET link_key = ? WHERE id = ?;", (normalize_link(link), post_id))
+            conn.execute("CREATE INDEX IF NOT EXISTS post_upvotes ON post (upvotes, id);")
+            conn.execute("CREATE INDEX IF NOT EXISTS post_hot ON post (hot, id);")
+            # posts of databases created before expiry was supported never expire.
+            if "expires" not in columns:
+                conn.execute("ALTER TABLE post ADD COLUMN expires REAL;")
+            if "version" not in columns:
+                conn.execute("ALTER TABLE post ADD COLUMN version INTEGER NOT NULL DEFAULT 0;")
+            conn.execute("CREATE INDEX IF NOT EXISTS post_link ON post (link_key, id);")
+            conn.execute("CREATE INDEX IF NOT EXISTS post_expires ON post (expires) WHERE expires IS NOT NULL;")
+            conn.execute("CREATE INDEX IF NOT EXISTS post_created ON post (created);")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS comment (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    post_id INTEGER NOT NULL,
+                    upvotes INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    parent_id INTEGER
+                );
+                """
+            )
+            # comments of databases created before replies were supported are top-level comments.
+            if "parent_id" not in {row[1] for row in conn.execute("PRAGMA table_info(comment);")}:
+                conn.execute("ALTER TABLE comment ADD COLUMN parent_id INTEGER;")
+            conn.execute("CREATE INDEX IF NOT EXISTS comment_post ON comment (post_id, id);")
+            conn.execute("CREATE INDEX IF NOT EXISTS comment_upvotes ON comment (post_id, upvotes, id);")
+            # adjacency index of the comment threads: the replies to a comment, by upvotes.
+            conn.execute("CREATE INDEX IF NOT EXISTS comment_parent ON comment (post_id, parent_id, upvotes, id);")
+            conn.execute("CREATE INDEX IF NOT EXISTS post_username ON post (username, id);")
+            conn.execute("CREATE INDEX IF NOT EXISTS comment_username ON comment (username, id);")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);")
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?), ('version', 0);",
+                (secrets.token_hex(4), )
+            )
+            # one row per vote, the primary key rejects duplicate votes.
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS vote (
+                    post_id INTEGER NOT NULL,
+                    voter TEXT NOT NULL,
+                    PRIMARY KEY (post_id, voter)
+                ) WITHOUT ROWID;
+                """
+            )
+            # full-text index of post titles and comment texts, by search document id.
+            # databases created before search was added are indexed once here.
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search';").fetchone() is None:
+                conn.execute("CREATE VIRTUAL TABLE search USING fts5 (text, tokenize = \"unicode61 tokenchars '_'\");")
+                conn.execute("INSERT INTO search (rowid, text) SELECT 2 * id, title FROM post;")
+                conn.execute("INSERT INTO search (rowid, text) SELECT 2 * id + 1, text FROM comment;")
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'seeded';").fetchone() is not None:
+                return
+            for post in posts:
+                created = post.get("created", time.time())
+                conn.execute(
+                    "INSERT INTO post (id, upvotes, title, link, username, created, hot, link_key, expires) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                    (
+                        post["id"], post["upvotes"], post["title"], post["link"], post["username"],
+                        created, hot_score(post["upvotes"], created), normalize_link(post["link"]),
+                        post.get("expires")
+                    )
+                )
+                conn.execute("INSERT INTO search (rowid, text) VALUES (?, ?);", (post_doc(post["id"]), post["title"]))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('seeded', '1');")
+        self._write(create)
+
+    # Convert a post row to a dict.
+    @staticmethod
+    def _post(row):
+        return {
+            "id": row[0], "upvotes": row[1], "title": row[2], "link": row[3], "username": row[4], "created": row[5],
+            "expires": row[6]
+        }
+
+    # Convert a comment row to a dict.
+    @staticmethod
+    def _comment(row):
+        return {"id": row[0], "upvotes": row[1], "text": row[2], "username": row[3], "parent_id": row[4]}
+
+    def post_keys(self, after=None):
+        after = -1 if after is None else after
+        while True:
+            rows = self.conn.execute(
+                "SELECT id FROM post WHERE id > ? ORDER BY id LIMIT ?;",
+                (after, KEY_BATCH_SIZE)
+            ).fetchall()
+            for row in rows:
+                yield row[0]
+            if len(rows) < KEY_BATCH_SIZE:
+                return
+            after = rows[-1][0]
+
+    def upvote_keys(self, after=None, reverse=False):
+        if reverse:
+            query = "SELECT upvotes, id FROM post WHERE (upvotes, id) < (?, ?) ORDER BY upvotes DESC, id DESC LIMIT ?;"
+            after = (float("inf"), 0) if after is None else after
+        else:
+            query = "SELECT upvotes, id FROM post WHERE (upvotes, id) > (?, ?) ORDER BY upvotes, id LIMIT ?;"
+            after = (float("-inf"), 0) if after is None else after
+        while True:
+            rows = self.conn.execute(query, (after[0], after[1], KEY_BATCH_SIZE)).fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < KEY_BATCH_SIZE:
+                return
+            after = rows[-1]
+
+    def hot_keys(self, after=None):
+        query = "SELECT hot, id FROM post WHERE (hot, id) < (?, ?) ORDER BY hot DESC, id DESC LIMIT ?;"
+        after = (float("inf"), 0) if after is None else after
+        while True:
+            rows = self.conn.execute(query, (after[0], after[1], KEY_BATCH_SIZE)).fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < KEY_BATCH_SIZE:
+                return
+            after = rows[-1]
+
+    # One row of the meta table, or of the primary key index of the posts.
+    def version(self):
+        rows = dict(self.conn.execute("SELECT key, value FROM meta WHERE key IN ('epoch', 'version');").fetchall())
+        return f"{rows['epoch']}.{rows['version']}"
+
+    def post_version(self, post_id):
+        conn = self.conn
+        row = conn.execute("SELECT version FROM post WHERE id = ?;", (post_id, )).fetchone()
+        if row is None:
+            return None
+        epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch';").fetchone()[0]
+        return f"{epoch}.{row[0]}"
+
+    def get_post(self, post_id):
+        row = self.conn.execute(
+            "SELECT id, upvotes, title, link, username, created, expires FROM post WHERE id = ?;",
+            (post_id, )
+        ).fetchone()
+        return None if row is None else self._post(row)
+
+    def get_post_json(self, post_id):
+        post = self.get_post(post_id)
+        return None if post is None else json.dumps(post)
+
+    def create_post(self, title, link, username, reject_repost=False, ttl=None):
+        link_key = normalize_link(link)
+
+        def create(conn):
+            # the check and the insert are in the same write transaction.
+            if reject_repost and link_key is not None and conn.execute(
+                "SELECT 1 FROM post WHERE link_key = ? LIMIT 1;", (link_key, )
+            ).fetchone() is not None:
+                return None
+            created = time.time()
+            expires = None if ttl is None else created + ttl
+            cursor = conn.execute(
+                "INSERT INTO post (upvotes, title, link, username, created, hot, link_key, expires) "
+                "VALUES (1, ?, ?, ?, ?, ?, ?, ?);",
+                (title, link, username, created, hot_score(1, created), link_key, expires)
+            )
+            conn.execute("INSERT INTO search (rowid, text) VALUES (?, ?);", (post_doc(cursor.lastrowid), title))
+            self._bump_version(conn, cursor.lastrowid)
+            return {
+                "id": cursor.lastrowid, "upvotes": 1, "title": title, "link": link, "username": username,
+                "created": created, "expires": expires
+            }
+        return self._write(create)
+
+    def link_post_ids(self, link):
+        link_key = normalize_link(link)
+        if link_key is None:
+            return []
+        rows = self.conn.execute("SELECT id FROM post WHERE link_key = ? ORDER BY id;", (link_key, )).fetchall()
+        return [row[0] for row in rows]
+
+    def delete_post(self, post_id):
+        return self._write(lambda conn: self._delete_post(conn, post_id))
+
+    # Delete a post with its comments, search rows and votes.
+    # Returns the deleted post, None if it doesn't exist.
+    # Requires: a write transaction is open.
+    def _delete_post(self, conn, post_id):
+        row = conn.execute(
+            "SELECT id, upvotes, title, link, username, created, expires FROM post WHERE id = ?;",
+            (post_id, )
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM post WHERE id = ?;", (post_id, ))
+        conn.execute("DELETE FROM search WHERE rowid = ?;", (post_doc(post_id), ))
+        # delete the comments of the post with it.
+        conn.execute("DELETE FROM search WHERE rowid IN (SELECT 2 * id + 1 FROM comment WHERE post_id = ?);", (post_id, ))
+        conn.execute("DELETE FROM comment WHERE post_id = ?;", (post_id, ))
+        conn.execute("DELETE FROM vote WHERE post_id = ?;", (post_id, ))
+        self._bump_version(conn)
+        return self._post(row)
+
+    # Look for expired posts every expiry interval until the store is closed.
+    def _expiry_loop(self):
+        while not self._closed.wait(self._expiry_interval):
+            self.expire_posts()
+
+    # Only the expired posts are read, through the post_expires and post_created indexes.
+    # They are first looked for outside of any transaction, so that the expiry
+    # loop only takes the write lock when some post did expire.
+    def expire_posts(self, now=None):
+        now = time.time() if now is None else now
+        if not self._expired_ids(self.conn, now):
+            return 0
+
+        def expire(conn):
+            expired = 0
+            # read them again: another worker may have expired them meanwhile.
+            for post_id in self._expired_ids(conn, now):
+                if self._archive is not None:
+                    rows = conn.execute(
+                        "SELECT id, upvotes, text, username, parent_id FROM comment WHERE post_id = ? ORDER BY id;",
+                        (post_id, )
+                    ).fetchall()
+                    self._archive.archive(self.get_post(post_id), [self._comment(row) for row in rows])
+                self._delete_post(conn, post_id)
+                expired += 1
+            return expired
+        return self._write(expire)
+
+    # Ids of the posts past their deadline or out of the retention window at "now", sorted.
+    def _expired_ids(self, conn, now):
+        post_ids = [row[0] for row in conn.execute("SELECT id FROM post WHERE expires <= ?;", (now, ))]
+        if self.retention is not None:
+            post_ids += [
+                row[0] for row in conn.execute("SELECT id FROM post WHERE created <= ?;", (now - self.retention, ))
+            ]
+        # a post can be both past its own deadline and out of the retention window.
+        return sorted(set(post_ids))
+
+    def upvote_post(self, post_id, increment=1):
+        def upvote(conn):
+            conn.execute("UPDATE post SET upvotes = upvotes + ? WHERE id = ?;", (increment, post_id))
+            row = conn.execute(
+                "SELECT id, upvotes, title, link, username, created, expires FROM post WHERE id = ?;",
+                (post_id, )
+            ).fetchone()
+            if row is None:
+                return None
+            # keep the hot index up to date, in the same transaction.
+            conn.execute("UPDATE post SET hot = ? WHERE id = ?;", (hot_score(row[1], row[5]), post_id))
+            self._bump_version(conn, post_id)
+            return self._post(row)
+        return self._write(upvote)
+
+    def vote_post(self, post_id, voter):
+        def vote(conn):
+            if conn.execute("SELECT 1 FROM post WHERE id = ?;", (post_id, )).fetchone() is None:
+                return None
+            cursor = conn.execute("INSERT OR IGNORE INTO vote (post_id, voter) VALUES (?, ?);", (post_id, voter))
+            return self._add_vote(conn, post_id, cursor.rowcount)
+        return self._write(vote)
+
+    def unvote_post(self, post_id, voter):
+        def unvote(conn):
+            if conn.execute("SELECT 1 FROM post WHERE id = ?;", (post_id, )).fetchone() is None:
+                return None
+            cursor = conn.execute("DELETE FROM vote WHERE post_id = ? AND voter = ?;", (post_id, voter))
+            return self._add_vote(conn, post_id, -cursor.rowcount)
+        return self._write(unvote)
+
+    # Add "delta" upvotes to a post after a vote changed, and return (post, whether it changed).
+    # Requires: a write transaction is open.
+    def _add_vote(self, conn, post_id, delta):
+        if delta:
+            conn.execute("UPDATE post SET upvotes = upvotes + ? WHERE id = ?;", (delta, post_id))
+        row = conn.execute(
+            "SELECT id, upvotes, title, link, username, created, expires FROM post WHERE id = ?;",
+            (post_id, )
+        ).fetchone()
+        if delta:
+            conn.execute("UPDATE post SET hot = ? WHERE id = ?;", (hot_score(row[1], row[5]), post_id))
+            self._bump_version(conn, post_id)
+        return self._post(row), bool(delta)
+
+    def has_comments(self, post_id):
+        row = self.conn.execute("SELECT 1 FROM comment WHERE post_id = ? LIMIT 1;", (post_id, )).fetchone()
+        return row is not None
+
+    def get_comments(self, post_id):
+        rows = self.conn.execute(
+            "SELECT id, upvotes, text, username, parent_id FROM comment WHERE post_id = ? ORDER BY id;",
+            (post_id, )
+        ).fetchall()
+        if not rows:
+            return None
+        return [self._comment(row) for row in rows]
+
+    def get_comments_json(self, post_id):
+        comments = self.get_comments(post_id)
+        return None if comments is None else [json.dumps(comment) for comment in comments]
+
+    def comment_keys(self, post_id, after=None, sort=None):
+        if sort == "top":
+            query = (
+                "SELECT upvotes, id FROM comment WHERE post_id = ? AND (upvotes, id) < (?, ?) "
+                "ORDER BY upvotes DESC, id DESC LIMIT ?;"
+            )
+            after = (float("inf"), 0) if after is None else after
+        elif sort == "new":
+            query = "SELECT id FROM comment WHERE post_id = ? AND id < ? ORDER BY id DESC LIMIT ?;"
+            after = (float("inf"), ) if after is None else (after, )
+        else:
+            query = "SELECT id FROM comment WHERE post_id = ? AND id > ? ORDER BY id LIMIT ?;"
+            after = (-1, ) if after is None else (after, )
+        while True:
+            rows = self.conn.execute(query, (post_id, ) + tuple(after) + (KEY_BATCH_SIZE, )).fetchall()
+            for row in rows:
+                yield row if sort == "top" else row[0]
+            if len(rows) < KEY_BATCH_SIZE:
+                return
+            after = rows[-1]
+
+    def reply_keys(self, post_id, parent_id=None, limit=None):
+        rows = self.conn.execute(
+            "SELECT upvotes, id FROM comment WHERE post_id = ? AND parent_id IS ? "
+            "ORDER BY upvotes DESC, id DESC LIMIT ?;",
+            # a negative limit is no limit.
+            (post_id, parent_id, -1 if limit is None else limit)
+        ).fetchall()
+        return iter(rows)
+
+    def get_comment(self, post_id, comment_id):
+        row = self.conn.execute(
+            "SELECT id, upvotes, text, username, parent_id FROM comment WHERE post_id = ? AND id = ?;",
+            (post_id, comment_id)
+        ).fetchone()
+        return None if row is None else self._comment(row)
+
+    def get_comment_json(self, post_id, comment_id):
+        comment = self.get_comment(post_id, comment_id)
+        return None if comment is None else json.dumps(comment)
+
+    def create_comment(self, post_id, text, username, parent_id=None):
+        def create(conn):
+            if conn.execute("SELECT 1 FROM post WHERE id = ?;", (post_id, )).fetchone() is None:
+                return None
+            if parent_id is not None and conn.execute(
+                "SELECT 1 FROM comment WHERE post_id = ? AND id = ?;", (post_id, parent_id)
+            ).fetchone() is None:
+                return None
+            cursor = conn.execute(
+                "INSERT INTO comment (post_id, upvotes, text, username, parent_id) VALUES (?, 1, ?, ?, ?);",
+                (post_id, text, username, parent_id)
+            )
+            conn.execute("INSERT INTO search (rowid, text) VALUES (?, ?);", (comment_doc(cursor.lastrowid), text))
+            self._bump_version(conn, post_id)
+            return {"id": cursor.lastrowid, "upvotes": 1, "text": text, "username": username, "parent_id": parent_id}
+        return self._write(create)
+
+    def edit_comment(self, post_id, comment_id, text):
+        def edit(conn):
+            cursor = conn.execute(
+                "UPDATE comment SET text = ? WHERE post_id = ? AND id = ?;",
+                (text, post_id, comment_id)
+            )
+            if cursor.rowcount == 0:
+                return None
+            conn.execute("UPDATE search SET text = ? WHERE rowid = ?;", (text, comment_doc(comment_id)))
+            self._bump_version(conn, post_id)
+            row = conn.execute(
+                "SELECT id, upvotes, text, username, parent_id FROM comment WHERE id = ?;",
+                (comment_id, )
+            ).fetchone()
+            return self._comment(row)
+        return self._write(edit)
+
+    def user_post_keys(self, username, after=None):
+        return self._user_keys("post", username, after)
+
+    def user_comment_keys(self, username, after=None):
+        return self._user_keys("comment", username, after)
+
+    # Yield the ids of the rows of "table" created by "username", in batches.
+    def _user_keys(self, table, username, after):
+        query = f"SELECT id FROM {table} WHERE username = ? AND id > ? ORDER BY id LIMIT ?;"
+        after = -1 if after is None else after
+        while True:
+            rows = self.conn.execute(query, (username, after, KEY_BATCH_SIZE)).fetchall()
+            for row in rows:
+                yield row[0]
+            if len(rows) < KEY_BATCH_SIZE:
+                return
+            after = rows[-1][0]
+
+    def get_comment_post_id(self, comment_id):
+        row = self.conn.execute("SELECT post_id FROM comment WHERE id = ?;", (comment_id, )).fetchone()
+        return None if row is None else row[0]
+
+    def get_comment_with_post_json(self, comment_id):
+        row = self.conn.execute(
+            "SELECT post_id, id, upvotes, text, username, parent_id FROM comment WHERE id = ?;",
+            (comment_id, )
+        ).fetchone()
+        return None if row is None else json.dumps({"post_id": row[0], **self._comment(row[1:])})
+
+    # Ranked by the bm25() function of FTS5, which scores lower for better
+    # matches, so scores are negated to sort like those of the in-memory index.
+    def search_keys(self, query, after=None):
+        # quote every word so that the query can't use the FTS5 syntax, words are ANDed.
+        match = " ".join('"' + token + '"' for token in tokenize(query))
+        sql = (
+            "SELECT score, doc FROM "
+            "(SELECT round(-bm25(search), 7) AS score, rowid AS doc FROM search WHERE search MATCH ?) "
+            "WHERE (score, doc) < (?, ?) ORDER BY score DESC, doc DESC LIMIT ?;"
+        )
+        after = (float("inf"), 0) if after is None else after
+        while True:
+            rows = self.conn.execute(sql, (match, after[0], after[1], KEY_BATCH_SIZE)).fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < KEY_BATCH_SIZE:
+                return
+            after = rows[-1]
+
+    def get_search_result_json(self, score, doc):
+        if is_post_doc(doc):
+            post = self.get_post(doc // 2)
+            return None if post is None else json.dumps({"type": "post", "score": score, "post": post})
+        row = self.conn.execute(
+            "SELECT post_id, id, upvotes, text, username, parent_id FROM comment WHERE id = ?;",
+            (doc // 2, )
+        ).fetchone()
+        if row is None:
+            return None
+        return json.dumps({"type": "comment", "score": score, "post_id": row[0], "comment": self._comment(row[1:])})
+
+    # The export runs in one read transaction, so it is a consistent snapshot
+    # of the database, while posts, comments and votes are read in batches of
+    # KEY_BATCH_SIZE posts.
+    def export_lines(self):
+        conn = self.conn
+        conn.execute("BEGIN;")
+        try:
+            sequences = dict(conn.execute("SELECT name, seq FROM sqlite_sequence;").fetchall())
+            yield {"counters": {
+                "next_post_id": sequences.get("post", -1) + 1, "next_comment_id": sequences.get("comment", -1) + 1
+            }}
+            after = -1
+            while True:
+                posts = [self._post(row) for row in conn.execute(
+                    "SELECT id, upvotes, title, link, username, created, expires FROM post WHERE id > ? ORDER BY id LIMIT ?;",
+                    (after, KEY_BATCH_SIZE)
+                )]
+                if not posts:
+                    return
+                first, after = posts[0]["id"], posts[-1]["id"]
+                # the comments and voters of the whole batch, grouped by post.
+                comments, voters = {}, {}
+                for row in conn.execute(
+                    "SELECT post_id, id, upvotes, text, username, parent_id FROM comment "
+                    "WHERE post_id BETWEEN ? AND ? ORDER BY post_id, id;",
+                    (first, after)
+                ):
+                    comments.setdefault(row[0], []).append(self._comment(row[1:]))
+                for post_id, voter in conn.execute(
+                    "SELECT post_id, voter FROM vote WHERE post_id BETWEEN ? AND ? ORDER BY post_id, voter;",
+                    (first, after)
+                ):
+                    voters.setdefault(post_id, []).append(voter)
+                for post in posts:
+                    yield {"post": post}
+                    for comment in comments.get(post["id"], ()):
+                        yield {"post_id": post["id"], "comment": comment}
+                    if post["id"] in voters:
+                        yield {"post_id": post["id"], "voters": voters[post["id"]]}
+        finally:
+            conn.execute("COMMIT;")
+
+    # Each batch is imported in its own write transaction, so the write lock
+    # isn't held while the next lines are read.
+    def import_lines(self, lines):
+        counts = {"posts": 0, "comments": 0, "voters": 0}
+        lines = iter(lines)
+        while True:
+            batch = list(islice(lines, IMPORT_BATCH_SIZE))
+            if not batch:
+                return counts
+            imported = self._write(lambda conn: self._import_batch(conn, batch))
+            for key, count in imported.items():
+                counts[key] += count
+
+    # Import a batch of export lines.
+    # Returns the number of imported records.
+    # Requires: a write transaction is open.
+    def _import_batch(self, conn, lines):
+        counts = {"posts": 0, "comments": 0, "voters": 0}
+        counters = {}
+        # every post imported by the batch gets the version of the batch.
+        self._bump_version(conn)
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version';").fetchone()[0]
+        for line in lines:
+            if type(line) is not dict:
+                raise ValueError(f"not an export line: {line!r}")
+            try:
+                if "counters" in line:
+                    counters = line["counters"]
+                elif "comment" in line:
+                    comment, post_id = line["comment"], line["post_id"]
+                    if conn.execute("SELECT 1 FROM post WHERE id = ?;", (post_id, )).fetchone() is None:
+                        raise ValueError(f"comment {comment['id']}: post {post_id} doesn't exist")
+                    # a reply comes after its parent, which is a comment of the same post.
+                    parent_id = comment.get("parent_id")
+                    if parent_id is not None and (
+                        type(parent_id) is not int or conn.execute(
+                            "SELECT 1 FROM comment WHERE id = ? AND post_id = ?;", (parent_id, post_id)
+                        ).fetchone() is None
+                    ):
+                        raise ValueError(f"comment {comment['id']}: parent {parent_id!r} isn't a comment of post {post_id}")
+                    conn.execute(
+                        "INSERT INTO comment (id, post_id, upvotes, text, username, parent_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?);",
+                        (
+                            comment["id"], post_id, comment["upvotes"], comment["text"], comment["username"],
+                            comment.get("parent_id")
+                        )
+                    )
+                    conn.execute(
+                        "INSERT INTO search (rowid, text) VALUES (?, ?);", (comment_doc(comment["id"]), comment["text"])
+                    )
+                    conn.execute("UPDATE post SET version = ? WHERE id = ?;", (version, post_id))
+                    counts["comments"] += 1
+                elif "voters" in line:
+                    post_id = line["post_id"]
+                    if conn.execute("SELECT 1 FROM post WHERE id = ?;", (post_id, )).fetchone() is None:
+                        raise ValueError(f"voters: post {post_id} doesn't exist")
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO vote (post_id, voter) VALUES (?, ?);",
+                        [(post_id, voter) for voter in line["voters"]]
+                    )
+                    counts["voters"] += len(line["voters"])
+                elif "post" in line:
+                    post = line["post"]
+                    for name in ("created", "expires"):
+                        if post.get(name) is not None and type(post[name]) not in (int, float):
+                            raise TypeError(f"{name} must be a number")
+                    created = post.get("created")
+                    if created is None:
+                        created = time.time()
+                    conn.execute(
+                        "INSERT INTO post (id, upvotes, title, link, username, created, hot, link_key, expires, version) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                        (
+                            post["id"], post["upvotes"], post["title"], post["link"], post["username"], created,
+                            hot_score(post["upvotes"], created), normalize_link(post["link"]), post.get("expires"),
+                            version
+                        )
+                    )
+                    conn.execute("INSERT INTO search (rowid, text) VALUES (?, ?);", (post_doc(post["id"]), post["title"]))
+                    counts["posts"] += 1
+                else:
+                    raise ValueError(f"unknown export line: {sorted(line)}")
+            except sqlite3.IntegrityError as error:
+                raise ValueError(f"id is taken: {error}")
+        # the next ids are past the imported counters; inserting ids moved them past the imported ids already.
+        for table, key in (("post", "next_post_id"), ("comment", "next_comment_id")):
+            if key not in counters:
+                continue
+            last_id = counters[key] - 1
+            cursor = conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?;", (last_id, table))
+            if cursor.rowcount == 0:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?);", (table, last_id))
+        return counts
+
+    # Stop looking for expired posts, close the archive, if any, and the connection of the current thread.
+    def close(self):
+        self._closed.set()
+        if self._archive is not None:
+            self._archive.close()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
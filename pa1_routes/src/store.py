@@ -0,0 +1,1376 @@
+import contextlib
+import json
+import queue
+import secrets
+import sys
+import threading
+import time
+from itertools import islice
+from itertools import takewhile
+
+from counters import ShardedCounter
+from links import normalize_link
+from ranking import hot_score
+from records import Comment
+from records import Post
+from search import SearchIndex
+from search import comment_doc
+from search import is_post_doc
+from search import post_doc
+from sorted_index import SortedIndex
+from timing_wheel import TimingWheel
+from voters import VoterRegistry
+from voters import VoterSet
+
+# deleted posts with more comments than this release them in the background.
+BACKGROUND_CLEANUP_THRESHOLD = 1_000
+# number of comments released at a time by the background cleanup.
+CLEANUP_BATCH_SIZE = 1_000
+# number of items sampled to estimate the size of a large container.
+MEMORY_SAMPLE_SIZE = 100
+# number of post ids read at a time by an export.
+EXPORT_BATCH_SIZE = 500
+# number of export lines read, checked and stored at a time by an import.
+IMPORT_BATCH_SIZE = 1_000
+
+
+# Raise TypeError unless the "ints" fields of a record are int and its "strs" fields str.
+def check_types(record, ints, strs):
+    for names, kind in ((ints, int), (strs, str)):
+        for name in names:
+            if type(getattr(record, name)) is not kind:
+                raise TypeError(f"{name} must be {kind.__name__}, not {type(getattr(record, name)).__name__}")
+
+
+# Approximate bytes of a record and of the values it holds.
+def record_bytes(record):
+    return sys.getsizeof(record) + sum(sys.getsizeof(getattr(record, name)) for name in record.__slots__)
+
+
+# Approximate bytes of a (normalised link, [post_id]) entry.
+def link_entry_bytes(entry):
+    return sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+
+
+# Average of item_bytes over a sample of "items", 0 if there are none.
+def average_bytes(items, item_bytes):
+    sample = list(islice(items, MEMORY_SAMPLE_SIZE))
+    return sum(map(item_bytes, sample)) / len(sample) if sample else 0
+
+
+class CacheStats(object):
+    """
+    Counters of the JSON fragment cache.
+    Updated without locking, so counts are approximate under heavy concurrency.
+    """
+
+    # Constructor.
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # total time spent encoding records on cache misses.
+        self.encode_seconds = 0.0
+
+    # Return the counters, the hit rate and the estimated encoding time
+    # saved by the hits (at the average cost of a miss).
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        average = self.encode_seconds / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "encode_seconds": self.encode_seconds,
+            "saved_seconds": self.hits * average
+        }
+
+
+class Store(object):
+    """
+    Storage interface behind the routes.
+    Posts and comments are passed in and out as plain dicts, or as their
+    JSON encodings for the read paths that only forward them to clients.
+
+    Backends:
+        PostStore -- in-memory, fastest, private to one process.
+        sqlite_store.SqliteStore -- SQLite in WAL mode, shared by every
+                                    worker process using the same file.
+    """
+
+    # counters of the JSON fragment cache, None if the backend has no cache.
+    cache_stats = None
+
+    # Yield the ids of all posts in increasing order, starting after "after" if given.
+    def post_keys(self, after=None):
+        raise NotImplementedError
+
+    # Yield the (upvotes, post_id) keys of all posts in increasing order,
+    # or decreasing order if reverse is True, starting after "after" if given.
+    def upvote_keys(self, after=None, reverse=False):
+        raise NotImplementedError
+
+    # Yield the (hot score, post_id) keys of all posts, hottest first,
+    # starting after "after" if given. See ranking.hot_score.
+    def hot_keys(self, after=None):
+        raise NotImplementedError
+
+    # Get a post by id, None if it doesn't exist.
+    def get_post(self, post_id):
+        raise NotImplementedError
+
+    # Get the JSON encoding of a post by id, None if it doesn't exist.
+    def get_post_json(self, post_id):
+        raise NotImplementedError
+
+    # Create a new post with one upvote and return it.
+    # If reject_repost is True, returns None instead when a post with the
+    # same normalised link exists (see links.normalize_link).
+    # ttl -- seconds after which the post expires, None to keep it.
+    def create_post(self, title, link, username, reject_repost=False, ttl=None):
+        raise NotImplementedError
+
+    # Get the ids of the posts whose link normalises like "link", in creation order.
+    def link_post_ids(self, link):
+        raise NotImplementedError
+
+    # Delete a post by id.
+    # Returns the deleted post, None if it doesn't exist.
+    def delete_post(self, post_id):
+        raise NotImplementedError
+
+    # Add "increment" upvotes to a post.
+    # Returns the updated post, None if it doesn't exist.
+    def upvote_post(self, post_id, increment=1):
+        raise NotImplementedError
+
+    # Record the vote of "voter" on a post, adding one upvote, at most once per voter.
+    # Returns (post, True) if the vote was recorded, (post, False) if the voter
+    # had voted already, None if the post doesn't exist.
+    def vote_post(self, post_id, voter):
+        raise NotImplementedError
+
+    # Undo the vote of "voter" on a post, removing its upvote.
+    # Returns (post, True) if the vote was removed, (post, False) if the voter
+    # hadn't voted, None if the post doesn't exist.
+    def unvote_post(self, post_id, voter):
+        raise NotImplementedError
+
+    # Whether any comment was ever created on a post.
+    def has_comments(self, post_id):
+        raise NotImplementedError
+
+    # Get all comments of a post in creation order.
+    # Returns None if the post has no comments yet.
+    def get_comments(self, post_id):
+        raise NotImplementedError
+
+    # Get the JSON encodings of all comments of a post in creation order.
+    # Returns None if the post has no comments yet.
+    def get_comments_json(self, post_id):
+        raise NotImplementedError
+
+    # Yield the keys of the comments of a post in the order given by "sort",
+    # starting after "after" if given:
+    #     None -- comment ids in creation order.
+    #     "new" -- comment ids, newest first.
+    #     "top" -- (upvotes, comment_id) keys, most upvoted first.
+    def comment_keys(self, post_id, after=None, sort=None):
+        raise NotImplementedError
+
+    # Yield the (upvotes, comment_id) keys of the replies to a comment of a
+    # post, or of its top-level comments if parent_id is None, most upvoted
+    # first. At most "limit" keys are yielded (all of them if limit is None).
+    def reply_keys(self, post_id, parent_id=None, limit=None):
+        raise NotImplementedError
+
+    # Get a comment of a post, None if it doesn't exist.
+    def get_comment(self, post_id, comment_id):
+        raise NotImplementedError
+
+    # Get the JSON encoding of a comment of a post, None if it doesn't exist.
+    def get_comment_json(self, post_id, comment_id):
+        raise NotImplementedError
+
+    # Create a new comment with one upvote on a post and return it.
+    # parent_id -- id of the comment of the same post it replies to, None for a top-level comment.
+    # Returns None if the post, or the parent comment, doesn't exist.
+    def create_comment(self, post_id, text, username, parent_id=None):
+        raise NotImplementedError
+
+    # Replace the text of a comment.
+    # Returns the updated comment, None if it doesn't exist.
+    def edit_comment(self, post_id, comment_id, text):
+        raise NotImplementedError
+
+    # Yield the ids of the posts created by "username" in increasing order,
+    # starting after "after" if given.
+    def user_post_keys(self, username, after=None):
+        raise NotImplementedError
+
+    # Yield the ids of the comments created by "username" in increasing order,
+    # starting after "after" if given.
+    def user_comment_keys(self, username, after=None):
+        raise NotImplementedError
+
+    # Get the id of the post a comment belongs to, None if the comment doesn't exist.
+    def get_comment_post_id(self, comment_id):
+        raise NotImplementedError
+
+    # Get the JSON encoding of a comment by id alone, with a "post_id" field
+    # added first. Returns None if it doesn't exist.
+    def get_comment_with_post_json(self, comment_id):
+        raise NotImplementedError
+
+    # Yield the (score, doc) keys of the posts and comments containing every
+    # word of "query", best match first, starting after "after" if given.
+    def search_keys(self, query, after=None):
+        raise NotImplementedError
+
+    # Get the JSON encoding of a search result by its key, None if it was deleted:
+    # {"type": "post", "score": ..., "post": {...}} or
+    # {"type": "comment", "score": ..., "post_id": ..., "comment": {...}}.
+    def get_search_result_json(self, score, doc):
+        raise NotImplementedError
+
+    # Expire the posts whose time to live, or the retention window of the
+    # store, ran out by "now" (the current time if None): each post and its
+    # comments are handed to the archive, then deleted.
+    # Returns the number of expired posts.
+    def expire_posts(self, now=None):
+        raise NotImplementedError
+
+    # Yield the whole store as export lines, in the format of the snapshot lines:
+    #     {"counters": {"next_post_id": ..., "next_comment_id": ...}} first,
+    #     then every post {"post": {...}} in id order, followed by its comments
+    #     {"post_id": ..., "comment": {...}} and its voters {"post_id": ..., "voters": [name, ...]}.
+    # Records are read in batches, never all at once.
+    def export_lines(self):
+        raise NotImplementedError
+
+    # Load the lines of an export in one pass, keeping the ids of the records.
+    # The next allocated ids are past both the imported counters and the imported ids.
+    # Lines are read in batches of IMPORT_BATCH_SIZE, outside of the store's locks,
+    # and each batch is stored at once: a bad line rejects its whole batch, while
+    # the batches before it are kept.
+    # Returns the number of imported records, {"posts": ..., "comments": ..., "voters": ...}.
+    # Raises ValueError for a malformed line, a record whose id is taken,
+    # or a record of a post that doesn't exist.
+    def import_lines(self, lines):
+        raise NotImplementedError
+
+    # Get the version of the whole store: an opaque str that changes whenever
+    # any post or comment does, and never comes back to an earlier value.
+    def version(self):
+        raise NotImplementedError
+
+    # Get the version of a post and its comments, like version() but only
+    # changed by writes to that post. Returns None if the post doesn't exist.
+    def post_version(self, post_id):
+        raise NotImplementedError
+
+    # Fold buffered upvotes into the posts, for backends that buffer them.
+    def flush_upvotes(self):
+        pass
+
+    # Report the live count and approximate bytes of every in-memory structure,
+    # {name: {"count": ..., "bytes": ...}}, None if the backend keeps its data elsewhere.
+    def memory_stats(self):
+        return None
+
+    # Release the resources held by the store.
+    def close(self):
+        pass
+
+
+class PostStore(Store):
+    """
+    Thread-safe in-memory store for posts and comments.
+
+    Records are stored as compact, immutable Post / Comment objects and are
+    never modified in place: every write builds a new record and swaps it
+    into the store, so readers get a consistent snapshot of a record without
+    taking any lock. Records are returned to callers as plain dicts, or as
+    JSON fragments that are encoded once per record version and cached.
+    Writes to a post and its comments are serialised by one of a fixed set
+    of striped locks (chosen by post id), so writes to different posts
+    rarely contend. The shared sorted indexes are guarded by their own lock,
+    held only by writers for the index update. The indexes are copy-on-write
+    and swap in a new version on every write, so a feed listing iterates one
+    version of its index without any lock, never blocks writers and never
+    sees a post twice or misses one that was only moved by a vote.
+
+    With a write-ahead log, every mutation is logged before it is
+    acknowledged, and the store is rebuilt from the latest snapshot and the
+    log on startup.
+
+    With sharded upvotes, votes on a post are added to a ShardedCounter
+    instead of rebuilding the post under its lock, so a vote storm on one
+    post doesn't serialise its voters. Reads of the post include the buffered
+    votes at once; the posts, the upvotes index and the log catch up when a
+    background thread flushes the counters every flush_interval seconds.
+    Buffered votes are not durable until they are flushed.
+
+    Deleting a post deletes its comments and every index entry pointing to
+    them. The post and its comments disappear from reads at once; for posts
+    with many comments, the global index entries are released afterwards by
+    a background thread, in batches, so the delete doesn't hold the post's
+    lock for the whole cleanup.
+
+    Every write bumps a version counter of the store, and records the new
+    value as the version of the post it changed, so readers can tell in O(1)
+    whether anything changed since an earlier read. Versions are prefixed by
+    a random epoch drawn at startup, since they restart after a recovery.
+    With sharded upvotes, versions catch up with buffered votes when they
+    are flushed.
+
+    Posts expire after their own time to live, or after the retention window
+    of the store. Deadlines are kept in a hierarchical timing wheel, turned
+    by a background thread every expiry_tick seconds, so expiring a post
+    costs O(1) and the store is never scanned. Expired posts are handed with
+    their comments to the archive, then deleted like any other post.
+    """
+
+    # Constructor.
+    # posts -- initial post dicts, each with its own "id".
+    #          ignored if the write-ahead log holds a snapshot.
+    # stripes -- number of striped locks shared by all posts.
+    # wal -- optional wal.WriteAheadLog to recover from and log mutations to.
+    # upvote_shards -- number of cells of each upvote counter, 0 to apply votes at once.
+    # flush_interval -- seconds between two flushes of the upvote counters.
+    # retention -- seconds after their creation at which all posts expire, None to keep them.
+    # archive -- sink the expired posts are handed to, e.g. archive.NdjsonArchive, None to drop them.
+    # expiry_tick -- seconds between two turns of the expiry wheel, the precision of the deadlines.
+    def __init__(
+        self, posts=(), stripes=64, wal=None, upvote_shards=0, flush_interval=0.05, retention=None, archive=None,
+        expiry_tick=1.0
+    ):
+        # all stored posts, post_id -> Post.
+        self._posts = {}
+        # all stored comments, post_id -> {comment_id -> Comment}.
+        self._comments = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._index_lock = threading.Lock()
+        # next ids to allocate, guarded by their own lock.
+        self._id_lock = threading.Lock()
+        self._next_post_id = 0
+        self._next_comment_id = 0
+        # ids allocated but not yet in the indexes, guarded by the id lock.
+        self._unpublished_post_ids = set()
+        self._unpublished_comment_ids = set()
+        # version of the store, and of every post, post_id -> version, guarded by the id lock.
+        self._epoch = secrets.token_hex(4)
+        self._version = 0
+        self._post_versions = {}
+        # counters of the JSON fragment cache.
+        self.cache_stats = CacheStats()
+        # index of all stored post ids, used to resume paginated reads.
+        self.post_ids = SortedIndex()
+        # index of all stored posts ordered by (upvotes, post_id).
+        self.posts_by_upvotes = SortedIndex()
+        # index of all stored posts ordered by (hot score, post_id).
+        self.posts_by_hot = SortedIndex()
+        # per-post indexes of the comments, post_id -> SortedIndex of comment ids,
+        # and post_id -> SortedIndex of (upvotes, comment_id).
+        self._comment_ids = {}
+        self._comments_by_upvotes = {}
+        # per-post adjacency index of the comment threads,
+        # post_id -> {parent_id (None for top-level) -> SortedIndex of (upvotes, comment_id)}.
+        self._replies = {}
+        # post of every comment, comment_id -> post_id.
+        self._comment_posts = {}
+        # per-user indexes, username -> SortedIndex of post ids / of comment ids.
+        self._user_posts = {}
+        self._user_comments = {}
+        # full-text index of post titles and comment texts, see search.post_doc / search.comment_doc.
+        self.search_index = SearchIndex()
+        # thread releasing the comments of deleted posts, started after recovery.
+        self._cleaner = None
+        # posts by normalised link, normalised link -> {post_id -> None} in creation
+        # order (a dict, so that deletes are O(1)), and the lock serialising the
+        # creations that reject reposts.
+        self._link_posts = {}
+        self._repost_lock = threading.Lock()
+        # ids of the voters, and voters of every post, post_id -> VoterSet.
+        self.voter_registry = VoterRegistry()
+        self._voters = {}
+        # deadlines of the posts that expire, post ids in a timing wheel guarded by the index lock.
+        self.retention = retention
+        self._archive = archive
+        self._expiry = TimingWheel(time.time(), expiry_tick)
+        # buffered upvotes, post_id -> ShardedCounter, set before recovery since deletes drop them.
+        self._pending = {}
+
+        snapshot = None if wal is None else wal.read_snapshot()
+        lsn = 0
+        if snapshot is None:
+            for post in posts:
+                self._insert_post(Post.from_dict(post))
+        else:
+            lsn, lines = snapshot
+            for line in lines:
+                self._load(line)
+        if wal is not None:
+            for entry in wal.replay(after_lsn=lsn):
+                self._apply(entry)
+            # snapshots taken before ids were released may list voters without votes.
+            self.voter_registry.release_unused()
+        # set the log last, so that recovery isn't logged again.
+        self._wal = wal
+        self._snapshot_lock = threading.Lock()
+        self._upvote_shards = upvote_shards
+        self._closed = threading.Event()
+        # comments of deleted posts waiting to be released, lists of Comment.
+        self._cleanup = queue.Queue()
+        # number of comments queued for cleanup, guarded by the index lock.
+        self._cleanup_backlog = 0
+        # start the background threads last, once all the state they use is set.
+        self._cleaner = threading.Thread(target=self._cleanup_loop, daemon=True)
+        self._cleaner.start()
+        if upvote_shards:
+            self._flush_interval = flush_interval
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+        threading.Thread(target=self._expiry_loop, daemon=True).start()
+
+    # Get the striped lock guarding a post and its comments.
+    def _lock(self, post_id):
+        return self._locks[post_id % len(self._locks)]
+
+    # Allocate a new post id, never shared by concurrent requests.
+    # It is unpublished until _publish_post_id is called.
+    def _allocate_post_id(self):
+        with self._id_lock:
+            post_id = self._next_post_id
+            self._next_post_id += 1
+            self._unpublished_post_ids.add(post_id)
+            return post_id
+
+    # Allocate a new comment id, never shared by concurrent requests.
+    # It is unpublished until _publish_comment_id is called.
+    def _allocate_comment_id(self):
+        with self._id_lock:
+            comment_id = self._next_comment_id
+            self._next_comment_id += 1
+            self._unpublished_comment_ids.add(comment_id)
+            return comment_id
+
+    # Mark an allocated id as added to the indexes, or as abandoned.
+    def _publish_post_id(self, post_id):
+        with self._id_lock:
+            self._unpublished_post_ids.discard(post_id)
+
+    def _publish_comment_id(self, comment_id):
+        with self._id_lock:
+            self._unpublished_comment_ids.discard(comment_id)
+
+    # Lowest id that may still be published: every smaller id is in the
+    # indexes already, or never will be.
+    def _post_id_horizon(self):
+        with self._id_lock:
+            return min(self._unpublished_post_ids, default=self._next_post_id)
+
+    def _comment_id_horizon(self):
+        with self._id_lock:
+            return min(self._unpublished_comment_ids, default=self._next_comment_id)
+
+    """
+    Mutations of the stored data and every index.
+    Requires: the striped lock of the post is held (or the store isn't shared yet).
+    These are the only functions that change the store, used both by the
+    public methods and to replay the write-ahead log.
+    """
+
+    # Bump the version of the store, and set the version of a post to the same value.
+    # Called last by every mutation, once every index is up to date.
+    # A deleted post has no version any more.
+    def _bump_version(self, post_id, deleted=False):
+        with self._id_lock:
+            self._version += 1
+            if deleted:
+                self._post_versions.pop(post_id, None)
+            else:
+                self._post_versions[post_id] = self._version
+
+    # Add a post to the store and the indexes.
+    # Its index keys are computed first, so a bad field fails before anything is stored.
+    def _insert_post(self, post):
+        hot_key = (hot_score(post.upvotes, post.created), post.id)
+        link_key = normalize_link(post.link)
+        deadline = self._deadline(post)
+        self._posts[post.id] = post
+        with self._id_lock:
+            self._next_post_id = max(self._next_post_id, post.id + 1)
+        with self._index_lock:
+            self.post_ids.add(post.id)
+            self.posts_by_upvotes.add((post.upvotes, post.id))
+            self.posts_by_hot.add(hot_key)
+            self._user_posts.setdefault(post.username, SortedIndex()).add(post.id)
+            if link_key is not None:
+                self._link_posts.setdefault(link_key, {})[post.id] = None
+            if deadline is not None:
+                self._expiry.schedule(post.id, deadline)
+        self.search_index.add(post_doc(post.id), post.title)
+        self._bump_version(post.id)
+
+    # Remove a post and its comments from the store and the indexes.
+    # Returns the removed post, None if it doesn't exist.
+    def _remove_post(self, post_id):
+        post = self._posts.pop(post_id, None)
+        if post is None:
+            return None
+        # buffered upvotes and voters of a deleted post are dropped with it.
+        self._pending.pop(post_id, None)
+        for voter_id in self._voters.pop(post_id, ()):
+            self.voter_registry.release(voter_id)
+        with self._index_lock:
+            self.post_ids.remove(post_id)
+            self.posts_by_upvotes.remove((post.upvotes, post_id))
+            self.posts_by_hot.remove((hot_score(post.upvotes, post.created), post_id))
+            self._discard_user_key(self._user_posts, post.username, post_id)
+            link_key = normalize_link(post.link)
+            if link_key is not None:
+                link_posts = self._link_posts[link_key]
+                del link_posts[post_id]
+                if not link_posts:
+                    del self._link_posts[link_key]
+            self._expiry.cancel(post_id)
+        self.search_index.remove(post_doc(post_id))
+        # detach the comments and their per-post indexes, so they can't be read any more.
+        comments_onepost = self._comments.pop(post_id, None)
+        self._comment_ids.pop(post_id, None)
+        self._comments_by_upvotes.pop(post_id, None)
+        self._replies.pop(post_id, None)
+        if comments_onepost:
+            comments = list(comments_onepost.values())
+            # the cleanup thread isn't running yet while the log is replayed.
+            if len(comments) <= BACKGROUND_CLEANUP_THRESHOLD or self._cleaner is None:
+                self._release_comments(comments)
+            else:
+                with self._index_lock:
+                    self._cleanup_backlog += len(comments)
+                self._cleanup.put(comments)
+        self._bump_version(post_id, deleted=True)
+        return post
+
+    # Time a post expires at: its own deadline, or the end of the retention
+    # window if that comes first. None if it never expires.
+    def _deadline(self, post):
+        deadlines = [post.expires]
+        if self.retention is not None:
+            deadlines.append(post.created + self.retention)
+        return min((deadline for deadline in deadlines if deadline is not None), default=None)
+
+    # Remove "key" from the index of "username" in "indexes", dropping the index once empty.
+    # Requires: the index lock is held.
+    @staticmethod
+    def _discard_user_key(indexes, username, key):
+        index = indexes.get(username)
+        if index is None:
+            return
+        index.discard(key)
+        if not index:
+            del indexes[username]
+
+    # Remove detached comments from the global indexes.
+    # Comments are only reachable from these indexes once their post is gone,
+    # and readers skip entries whose comment can't be found, so this may run
+    # without the post's lock.
+    # Returns the number of comments released.
+    def _release_comments(self, comments):
+        for comment in comments:
+            self._comment_posts.pop(comment.id, None)
+            self.search_index.remove(comment_doc(comment.id))
+        with self._index_lock:
+            for comment in comments:
+                self._discard_user_key(self._user_comments, comment.username, comment.id)
+        return len(comments)
+
+    # Swap a post for its updated version.
+    def _replace_post(self, post, updated):
+        self._posts[post.id] = updated
+        with self._index_lock:
+            self.posts_by_upvotes.replace((post.upvotes, post.id), (updated.upvotes, updated.id))
+            self.posts_by_hot.replace(
+                (hot_score(post.upvotes, post.created), post.id),
+                (hot_score(updated.upvotes, updated.created), updated.id),
+            )
+        self._bump_version(post.id)
+
+    # Add (delta = 1) or remove (delta = -1) the vote of a voter on a post.
+    # Returns the updated post, None if the voter already had (or hadn't) voted.
+    def _vote(self, post, voter, delta):
+        if not self._change_voters(post.id, voter, delta):
+            return None
+        updated = post.replace(upvotes=post.upvotes + delta)
+        self._replace_post(post, updated)
+        return updated
+
+    # Add (delta = 1) or remove (delta = -1) a voter of a post.
+    # Returns False if the voter already had (or hadn't) voted.
+    # Requires: the post's lock is held, so that the voter's id isn't released meanwhile.
+    def _change_voters(self, post_id, voter, delta):
+        voters = self._voters.get(post_id)
+        if voters is None:
+            voters = self._voters[post_id] = VoterSet()
+        if delta > 0:
+            voter_id = self.voter_registry.acquire(voter)
+            if not voters.add(voter_id):
+                self.voter_registry.release(voter_id)
+                return False
+            return True
+        voter_id = self.voter_registry.get(voter)
+        if voter_id is None or not voters.discard(voter_id):
+            return False
+        self.voter_registry.release(voter_id)
+        return True
+
+    # Add a comment to a post and its indexes.
+    def _insert_comment(self, post_id, comment):
+        self._comments.setdefault(post_id, {})[comment.id] = comment
+        self._comment_ids.setdefault(post_id, SortedIndex()).add(comment.id)
+        self._comments_by_upvotes.setdefault(post_id, SortedIndex()).add((comment.upvotes, comment.id))
+        replies = self._replies.setdefault(post_id, {})
+        replies.setdefault(comment.parent_id, SortedIndex()).add((comment.upvotes, comment.id))
+        self._comment_posts[comment.id] = post_id
+        self.search_index.add(comment_doc(comment.id), comment.text)
+        with self._index_lock:
+            self._user_comments.setdefault(comment.username, SortedIndex()).add(comment.id)
+        with self._id_lock:
+            self._next_comment_id = max(self._next_comment_id, comment.id + 1)
+        self._bump_version(post_id)
+
+    # Remove a comment from its post and the indexes, undoing _insert_comment.
+    def _remove_comment(self, post_id, comment):
+        key = (comment.upvotes, comment.id)
+        del self._comments[post_id][comment.id]
+        self._comment_ids[post_id].remove(comment.id)
+        self._comments_by_upvotes[post_id].remove(key)
+        self._replies[post_id][comment.parent_id].remove(key)
+        if not self._replies[post_id][comment.parent_id]:
+            del self._replies[post_id][comment.parent_id]
+        # a post without comments has none of their containers, see has_comments.
+        if not self._comments[post_id]:
+            for container in (self._comments, self._comment_ids, self._comments_by_upvotes, self._replies):
+                del container[post_id]
+        self._release_comments([comment])
+        self._bump_version(post_id)
+
+    # Swap a comment of a post for its updated version.
+    def _replace_comment(self, post_id, comment, updated):
+        self._comments[post_id][comment.id] = updated
+        if updated.upvotes != comment.upvotes:
+            old_key, new_key = (comment.upvotes, comment.id), (updated.upvotes, updated.id)
+            self._comments_by_upvotes[post_id].replace(old_key, new_key)
+            self._replies[post_id][comment.parent_id].replace(old_key, new_key)
+        if updated.text != comment.text:
+            self.search_index.add(comment_doc(comment.id), updated.text)
+        self._bump_version(post_id)
+
+    """
+    Durability.
+    """
+
+    # Log a mutation if the store has a write-ahead log.
+    # Requires: the striped lock of the post is held, so that mutations
+    # of the same post are logged in the order they are applied.
+    def _log(self, entry):
+        if self._wal is not None and self._wal.append(entry):
+            self._start_snapshot()
+
+    # Apply a logged mutation during recovery.
+    def _apply(self, entry):
+        op = entry["op"]
+        if op == "create_post":
+            self._insert_post(Post.from_dict(entry["post"]))
+        elif op == "delete_post":
+            self._remove_post(entry["post_id"])
+        elif op == "upvote_post":
+            post = self._posts[entry["post_id"]]
+            self._replace_post(post, post.replace(upvotes=entry["upvotes"]))
+        elif op == "vote_post" or op == "unvote_post":
+            self._change_voters(entry["post_id"], entry["voter"], 1 if op == "vote_post" else -1)
+            post = self._posts[entry["post_id"]]
+            self._replace_post(post, post.replace(upvotes=entry["upvotes"]))
+        elif op == "create_comment":
+            self._insert_comment(entry["post_id"], Comment.from_dict(entry["comment"]))
+        elif op == "edit_comment":
+            comment = self._get_comment(entry["post_id"], entry["comment_id"])
+            self._replace_comment(entry["post_id"], comment, comment.replace(text=entry["text"]))
+        elif op == "import":
+            self._import(self._check_import(entry["lines"]), [])
+        else:
+            raise ValueError(f"unknown log entry: {op}")
+
+    # Load one line of a snapshot written by snapshot().
+    def _load(self, line):
+        if "counters" in line:
+            self._next_post_id = max(self._next_post_id, line["counters"]["next_post_id"])
+            self._next_comment_id = max(self._next_comment_id, line["counters"]["next_comment_id"])
+        elif "comment" in line:
+            self._insert_comment(line["post_id"], Comment.from_dict(line["comment"]))
+        elif "voter_names" in line:
+            self.voter_registry = VoterRegistry(line["voter_names"])
+        elif "voter_ids" in line:
+            self._voters[line["post_id"]] = VoterSet(line["voter_ids"])
+            for voter_id in line["voter_ids"]:
+                self.voter_registry.retain(voter_id)
+        else:
+            self._insert_post(Post.from_dict(line["post"]))
+
+    # Take a snapshot in a background thread, unless one is running already.
+    def _start_snapshot(self):
+        if self._snapshot_lock.acquire(blocking=False):
+            def run():
+                try:
+                    self.snapshot()
+                finally:
+                    self._snapshot_lock.release()
+            threading.Thread(target=run, daemon=True).start()
+
+    # Write a snapshot of the whole store to the write-ahead log's directory.
+    # Writes are paused only while the records are collected (records are
+    # immutable, so copying the containers is enough), not while they are written.
+    def snapshot(self):
+        self.flush_upvotes()
+        with self._lock_all():
+            lsn, lines = self._collect_snapshot()
+        self._wal.write_snapshot(lsn, lines)
+
+    # Hold every striped lock, pausing all writes.
+    def _lock_all(self):
+        stack = contextlib.ExitStack()
+        for lock in self._locks:
+            stack.enter_context(lock)
+        return stack
+
+    # Start a new log segment and collect the records of the store.
+    # Returns the lsn of the snapshot and a generator of its lines.
+    # Requires: every striped lock is held.
+    def _collect_snapshot(self):
+        lsn = self._wal.rotate()
+        counters = {"next_post_id": self._next_post_id, "next_comment_id": self._next_comment_id}
+        posts = list(self._posts.values())
+        comments = [(post_id, list(c.values())) for post_id, c in self._comments.items()]
+        # voter sets are changed in place, copy them.
+        voter_names = self.voter_registry.names()
+        voters = [(post_id, v.copy()) for post_id, v in self._voters.items()]
+
+        def lines():
+            yield {"counters": counters}
+            yield {"voter_names": voter_names}
+            for post in posts:
+                yield {"post": post.to_dict()}
+            for post_id, comments_onepost in comments:
+                for comment in comments_onepost:
+                    yield {"post_id": post_id, "comment": comment.to_dict()}
+            for post_id, voters_onepost in voters:
+                yield {"post_id": post_id, "voter_ids": list(voters_onepost)}
+        return lsn, lines()
+
+    # Posts are read by id in batches, like paginated reads, and each post is
+    # read with its comments and voters under its lock: every post is exported
+    # consistently, without pausing writes to the rest of the store.
+    def export_lines(self):
+        with self._id_lock:
+            counters = {"next_post_id": self._next_post_id, "next_comment_id": self._next_comment_id}
+        yield {"counters": counters}
+        after = None
+        while True:
+            post_ids = list(islice(self.post_keys(after), EXPORT_BATCH_SIZE))
+            if not post_ids:
+                return
+            after = post_ids[-1]
+            for post_id in post_ids:
+                with self._lock(post_id):
+                    post = self._posts.get(post_id)
+                    # skip posts deleted since their id was read.
+                    if post is None:
+                        continue
+                    post = self._visible(post)
+                    comments = list(self._comments.get(post_id, {}).values())
+                    voters = self._voters.get(post_id, ())
+                    voters = [self.voter_registry.name(voter_id) for voter_id in voters]
+                yield {"post": post.to_dict()}
+                for comment in comments:
+                    yield {"post_id": post_id, "comment": comment.to_dict()}
+                if voters:
+                    yield {"post_id": post_id, "voters": voters}
+
+    # Writes are only paused while a batch is checked and stored, and each
+    # batch is logged as one entry. A batch is stored all or nothing: if a
+    # record can't be stored or the batch can't be logged, the records stored
+    # before are removed again, so the store never holds records the log lacks.
+    def import_lines(self, lines):
+        counts = {"posts": 0, "comments": 0, "voters": 0}
+        lines = iter(lines)
+        while True:
+            batch = list(islice(lines, IMPORT_BATCH_SIZE))
+            if not batch:
+                return counts
+            with self._lock_all():
+                records = self._check_import(batch)
+                undo = []
+                try:
+                    self._import(records, undo)
+                    self._log({"op": "import", "lines": batch})
+                except BaseException:
+                    self._undo_import(undo)
+                    raise
+            for record in records:
+                if record[0] == "voters":
+                    counts["voters"] += len(record[2])
+                elif record[0] != "counters":
+                    counts[record[0] + "s"] += 1
+
+    # Check a batch of export lines against the store and against each other.
+    # Returns the records to store, in order: ("counters", line), ("post", Post),
+    # ("comment", post_id, Comment) and ("voters", post_id, [name, ...]).
+    # Raises ValueError, KeyError or TypeError for a bad line, before anything is stored.
+    # Requires: every striped lock is held.
+    def _check_import(self, lines):
+        records = []
+        # ids of the batch, and post of every comment of the batch.
+        post_ids, comment_posts = set(), {}
+        for line in lines:
+            if type(line) is not dict:
+                raise ValueError(f"not an export line: {line!r}")
+            if "counters" in line:
+                counters = line["counters"]
+                if type(counters) is not dict or any(
+                    type(counters.get(key)) is not int for key in ("next_post_id", "next_comment_id")
+                ):
+                    raise ValueError(f"invalid counters: {counters!r}")
+                records.append(("counters", line))
+            elif "comment" in line:
+                post_id = line["post_id"]
+                comment = Comment.from_dict(line["comment"])
+                check_types(comment, ("id", "upvotes"), ("text", "username"))
+                if post_id not in self._posts and post_id not in post_ids:
+                    raise ValueError(f"comment {comment.id}: post {post_id} doesn't exist")
+                if comment.id in self._comment_posts or comment.id in comment_posts:
+                    raise ValueError(f"comment id {comment.id} is taken")
+                # a reply comes after its parent, which is a comment of the same post.
+                parent_id = comment.parent_id
+                if parent_id is not None and (
+                    type(parent_id) is not int
+                    or post_id not in (self._comment_posts.get(parent_id), comment_posts.get(parent_id))
+                ):
+                    raise ValueError(f"comment {comment.id}: parent {parent_id!r} isn't a comment of post {post_id}")
+                comment_posts[comment.id] = post_id
+                records.append(("comment", post_id, comment))
+            elif "voters" in line:
+                post_id, voters = line["post_id"], line["voters"]
+                if post_id not in self._posts and post_id not in post_ids:
+                    raise ValueError(f"voters: post {post_id} doesn't exist")
+                if type(voters) is not list or any(type(voter) is not str for voter in voters):
+                    raise TypeError(f"voters of post {post_id} must be a list of str")
+                records.append(("voters", post_id, voters))
+            elif "post" in line:
+                post = Post.from_dict(line["post"])
+                check_types(post, ("id", "upvotes"), ("title", "link", "username"))
+                for name in ("created", "expires"):
+                    if getattr(post, name) is not None and type(getattr(post, name)) not in (int, float):
+                        raise TypeError(f"{name} must be a number")
+                if post.id in self._posts or post.id in post_ids:
+                    raise ValueError(f"post id {post.id} is taken")
+                post_ids.add(post.id)
+                records.append(("post", post))
+            else:
+                raise ValueError(f"unknown export line: {sorted(line)}")
+        return records
+
+    # Store the records of a checked batch, appending what undoes each stored
+    # record to "undo": ("post", post_id), ("comment", post_id, Comment) or
+    # ("voter", post_id, name). Imported counters are kept: ids past them are
+    # merely skipped.
+    # Requires: every striped lock is held.
+    def _import(self, records, undo):
+        for record in records:
+            kind = record[0]
+            if kind == "counters":
+                with self._id_lock:
+                    self._load(record[1])
+            elif kind == "post":
+                self._insert_post(record[1])
+                undo.append(("post", record[1].id))
+            elif kind == "comment":
+                self._insert_comment(record[1], record[2])
+                undo.append(record)
+            else:
+                for voter in record[2]:
+                    if self._change_voters(record[1], voter, 1):
+                        undo.append(("voter", record[1], voter))
+
+    # Remove the records stored by _import, latest first.
+    # Requires: every striped lock is held.
+    def _undo_import(self, undo):
+        for record in reversed(undo):
+            if record[0] == "post":
+                self._remove_post(record[1])
+            elif record[0] == "comment":
+                self._remove_comment(record[1], record[2])
+            else:
+                self._change_voters(record[1], record[2], -1)
+
+    # Stop flushing upvotes and expiring posts, flush the last upvotes, finish
+    # the pending cleanups, and close the write-ahead log and the archive, if any.
+    def close(self):
+        self._closed.set()
+        self.flush_upvotes()
+        self._cleanup.put(None)
+        self._cleaner.join()
+        if self._wal is not None:
+            self._wal.close()
+        if self._archive is not None:
+            self._archive.close()
+
+    """
+    Background cleanup and memory accounting.
+    """
+
+    # Release the comments of deleted posts in batches until the store is closed.
+    def _cleanup_loop(self):
+        while True:
+            comments = self._cleanup.get()
+            if comments is None:
+                self._cleanup.task_done()
+                return
+            for start in range(0, len(comments), CLEANUP_BATCH_SIZE):
+                released = self._release_comments(comments[start:start + CLEANUP_BATCH_SIZE])
+                with self._index_lock:
+                    self._cleanup_backlog -= released
+            self._cleanup.task_done()
+
+    # Wait until the comments of every deleted post are released.
+    def wait_for_cleanup(self):
+        self._cleanup.join()
+
+    # Turn the expiry wheel every expiry tick until the store is closed.
+    def _expiry_loop(self):
+        while not self._closed.wait(self._expiry.tick):
+            self.expire_posts()
+
+    # The wheel hands over the expired post ids in O(1) each. A post is
+    # archived before it is deleted, so a crash in between archives it twice
+    # rather than losing it.
+    def expire_posts(self, now=None):
+        now = time.time() if now is None else now
+        with self._index_lock:
+            post_ids = self._expiry.advance(now)
+        expired = 0
+        for post_id in post_ids:
+            with self._lock(post_id):
+                post = self._posts.get(post_id)
+                # the post may have been deleted since the wheel handed it over.
+                if post is None:
+                    continue
+                if self._archive is not None:
+                    comments = self._comments.get(post_id, {})
+                    self._archive.archive(
+                        self._visible(post).to_dict(), [comment.to_dict() for comment in comments.values()]
+                    )
+                self._remove_post(post_id)
+                self._log({"op": "delete_post", "post_id": post_id})
+            expired += 1
+        return expired
+
+    # Sizes of records are estimated from a sample, those of the containers
+    # holding them are measured, so this costs O(number of posts and users).
+    def memory_stats(self):
+        comment_dicts = list(self._comments.values())
+        comment_count = sum(map(len, comment_dicts))
+        comments = (comment for comments_onepost in comment_dicts for comment in comments_onepost.copy().values())
+        comment_bytes = average_bytes(comments, record_bytes)
+        comment_indexes = list(self._comment_ids.values()) + list(self._comments_by_upvotes.values())
+        reply_indexes = list(self._replies.values())
+        user_indexes = list(self._user_posts.values()) + list(self._user_comments.values())
+        voter_sets = list(self._voters.values())
+        return {
+            "posts": {
+                "count": len(self._posts),
+                "bytes": sys.getsizeof(self._posts)
+                + int(len(self._posts) * average_bytes(self._posts.copy().values(), record_bytes)),
+            },
+            "comments": {
+                "count": comment_count,
+                "bytes": sys.getsizeof(self._comments) + sum(map(sys.getsizeof, comment_dicts))
+                + int(comment_count * comment_bytes),
+            },
+            "post_indexes": {
+                "count": len(self.post_ids),
+                "bytes": sum(map(sys.getsizeof, (self.post_ids, self.posts_by_upvotes, self.posts_by_hot))),
+            },
+            "comment_indexes": {
+                "count": len(self._comment_ids),
+                "bytes": sys.getsizeof(self._comment_ids) + sys.getsizeof(self._comments_by_upvotes)
+                + sum(map(sys.getsizeof, comment_indexes)),
+            },
+            "reply_indexes": {
+                "count": sum(map(len, reply_indexes)),
+                "bytes": sys.getsizeof(self._replies) + sum(map(sys.getsizeof, reply_indexes))
+                + sum(sys.getsizeof(index) for replies in reply_indexes for index in replies.copy().values()),
+            },
+            "comment_posts": {
+                "count": len(self._comment_posts),
+                "bytes": sys.getsizeof(self._comment_posts),
+            },
+            "user_indexes": {
+                "count": len(user_indexes),
+                "bytes": sys.getsizeof(self._user_posts) + sys.getsizeof(self._user_comments)
+                + sum(map(sys.getsizeof, user_indexes)),
+            },
+            "search_index": {
+                "count": len(self.search_index),
+                "bytes": sys.getsizeof(self.search_index),
+            },
+            "link_index": {
+                "count": len(self._link_posts),
+                "bytes": sys.getsizeof(self._link_posts)
+                + int(len(self._link_posts) * average_bytes(self._link_posts.copy().items(), link_entry_bytes)),
+            },
+            "post_versions": {
+                "count": len(self._post_versions),
+                "bytes": sys.getsizeof(self._post_versions),
+            },
+            "expiry_wheel": {
+                "count": len(self._expiry),
+                "bytes": sys.getsizeof(self._expiry),
+            },
+            "voters": {
+                "count": sum(map(len, voter_sets)),
+                "bytes": sys.getsizeof(self._voters) + sum(map(sys.getsizeof, voter_sets))
+                + sys.getsizeof(self.voter_registry),
+            },
+            # comments of deleted posts still held by the cleanup queue.
+            "pending_cleanup": {
+                "count": self._cleanup_backlog,
+                "bytes": int(self._cleanup_backlog * comment_bytes),
+            },
+        }
+
+    """
+    Sharded upvotes.
+    """
+
+    # Flush the upvote counters every flush_interval seconds until the store is closed.
+    def _flush_loop(self):
+        while not self._closed.wait(self._flush_interval):
+            self.flush_upvotes()
+
+    # Fold the buffered upvotes into the posts, the upvotes index and the log.
+    # A counter that stayed idle since the previous flush is closed and dropped,
+    # so only posts that are being voted on keep a counter.
+    def flush_upvotes(self):
+        for post_id in list(self._pending):
+            with self._lock(post_id):
+                counter = self._pending.get(post_id)
+                if counter is None:
+                    continue
+                votes = counter.drain()
+                if not votes:
+                    votes = counter.close()
+                    del self._pending[post_id]
+                post = self._posts.get(post_id)
+                if votes and post is not None:
+                    updated = post.replace(upvotes=post.upvotes + votes)
+                    self._replace_post(post, updated)
+                    self._log({"op": "upvote_post", "post_id": post_id, "upvotes": updated.upvotes})
+
+    # Return the post as readers should see it, with its buffered upvotes.
+    def _visible(self, post):
+        counter = self._pending.get(post.id)
+        if counter is None:
+            return post
+        votes = counter.value()
+        return post.replace(upvotes=post.upvotes + votes) if votes else post
+
+    # Buffer "increment" upvotes of a post in its sharded counter.
+    # Returns the post with its buffered upvotes, None if it doesn't exist.
+    def _buffer_upvotes(self, post_id, increment):
+        while True:
+            counter = self._pending.get(post_id)
+            if counter is None:
+                with self._lock(post_id):
+                    if post_id not in self._posts:
+                        return None
+                    counter = self._pending.get(post_id)
+                    if counter is None:
+                        counter = self._pending[post_id] = ShardedCounter(self._upvote_shards)
+            # retry with a new counter if this one was closed in the meantime.
+            if counter.add(increment):
+                break
+        post = self._posts.get(post_id)
+        return None if post is None else self._visible(post)
+
+    """
+    Reads.
+    """
+
+    # Return the JSON encoding of a record, cached on the record itself.
+    # The cache never goes stale: writes replace records instead of changing them.
+    def _encode(self, record):
+        encoded = record.encoded
+        if encoded is not None:
+            self.cache_stats.hits += 1
+            return encoded
+        start = time.perf_counter()
+        encoded = json.dumps(record.to_dict())
+        self.cache_stats.encode_seconds += time.perf_counter() - start
+        self.cache_stats.misses += 1
+        record.encoded = encoded
+        return encoded
+
+    # Ids are allocated before the post's lock is taken, so a post may be
+    # indexed after one with a higher id. Listings by id stop before the
+    # lowest id not indexed yet, so that no cursor ever passes it.
+    def post_keys(self, after=None):
+        horizon = self._post_id_horizon()
+        keys = self.post_ids.islice() if after is None else self.post_ids.iter_from(after)
+        return takewhile(horizon.__gt__, keys)
+
+    def upvote_keys(self, after=None, reverse=False):
+        if after is None:
+            return self.posts_by_upvotes.islice(reverse=reverse)
+        return self.posts_by_upvotes.iter_from(after, reverse=reverse)
+
+    def hot_keys(self, after=None):
+        if after is None:
+            return self.posts_by_hot.islice(reverse=True)
+        return self.posts_by_hot.iter_from(after, reverse=True)
+
+    # Versions are read without any lock, in O(1).
+    def version(self):
+        return f"{self._epoch}.{self._version}"
+
+    def post_version(self, post_id):
+        version = self._post_versions.get(post_id)
+        return None if version is None else f"{self._epoch}.{version}"
+
+    # Get the JSON encoding of a post by id, None if it doesn't exist.
+    def get_post_json(self, post_id):
+        post = self._posts.get(post_id)
+        if post is None:
+            return None
+        # a post with buffered upvotes is a temporary record, encoding it is a cache miss.
+        return self._encode(self._visible(post))
+
+    # Get a post by id, None if it doesn't exist.
+    def get_post(self, post_id):
+        post = self._posts.get(post_id)
+        return None if post is None else self._visible(post).to_dict()
+
+    def has_comments(self, post_id):
+        return post_id in self._comments
+
+    # Get all comments of a post in creation order.
+    # Returns None if the post has no comments yet.
+    def get_comments(self, post_id):
+        comments_onepost = self._comments.get(post_id)
+        if comments_onepost is None:
+            return None
+        # copy the values so that concurrent writes can't change the dict while reading.
+        return [comment.to_dict() for comment in comments_onepost.copy().values()]
+
+    # Get the JSON encodings of all comments of a post in creation order.
+    # Returns None if the post has no comments yet.
+    def get_comments_json(self, post_id):
+        comments_onepost = self._comments.get(post_id)
+        if comments_onepost is None:
+            return None
+        return [self._encode(comment) for comment in comments_onepost.copy().values()]
+
+    # Only the requested page is read: the first k keys cost O(k), and
+    # resuming from a cursor costs an extra O(log n) bisection.
+    def comment_keys(self, post_id, after=None, sort=None):
+        if sort == "top":
+            index = self._comments_by_upvotes.get(post_id)
+        else:
+            index = self._comment_ids.get(post_id)
+        if index is None:
+            return iter(())
+        reverse = sort is not None
+        if after is None:
+            return index.islice(reverse=reverse)
+        return index.iter_from(after, reverse=reverse)
+
+    # O(limit) from the SortedIndex of the siblings, whatever the size of the thread.
+    def reply_keys(self, post_id, parent_id=None, limit=None):
+        index = self._replies.get(post_id, {}).get(parent_id)
+        if index is None:
+            return iter(())
+        return index.islice(limit=limit, reverse=True)
+
+    # Get a comment of a post, None if it doesn't exist.
+    def get_comment(self, post_id, comment_id):
+        comment = self._get_comment(post_id, comment_id)
+        return None if comment is None else comment.to_dict()
+
+    def user_post_keys(self, username, after=None):
+        return self._user_keys(self._user_posts, username, after, self._post_id_horizon())
+
+    # The comments of different posts are created under different locks,
+    # so a user's comments may be indexed out of id order, like posts.
+    def user_comment_keys(self, username, after=None):
+        return self._user_keys(self._user_comments, username, after, self._comment_id_horizon())
+
+    # Yield the ids of a user's index below "horizon", in O(log n) plus O(1) per id.
+    def _user_keys(self, indexes, username, after, horizon):
+        index = indexes.get(username)
+        if index is None:
+            return iter(())
+        keys = index.islice() if after is None else index.iter_from(after)
+        return takewhile(horizon.__gt__, keys)
+
+    # O(1) through the comment_id -> post_id reverse index.
+    def get_comment_post_id(self, comment_id):
+        post_id = self._comment_posts.get(comment_id)
+        # the index may still list comments of a deleted post until they are released.
+        if post_id is None or self._get_comment(post_id, comment_id) is None:
+            return None
+        return post_id
+
+    # The post id is spliced into the cached encoding of the comment.
+    def get_comment_with_post_json(self, comment_id):
+        post_id = self._comment_posts.get(comment_id)
+        comment = None if post_id is None else self._get_comment(post_id, comment_id)
+        if comment is None:
+            return None
+        return '{"post_id": ' + json.dumps(post_id) + ", " + self._encode(comment)[1:]
+
+    def search_keys(self, query, after=None):
+        return self.search_index.search(query, after)
+
+    # Results are built from the cached encodings of the records.
+    def get_search_result_json(self, score, doc):
+        if is_post_doc(doc):
+            post_json = self.get_post_json(doc // 2)
+            if post_json is None:
+                return None
+            return '{"type": "post", "score": ' + json.dumps(score) + ', "post": ' + post_json + "}"
+        comment_id = doc // 2
+        post_id = self._comment_posts.get(comment_id)
+        comment = None if post_id is None else self._get_comment(post_id, comment_id)
+        if comment is None:
+            return None
+        return (
+            '{"type": "comment", "score": ' + json.dumps(score) + ', "post_id": ' + json.dumps(post_id)
+            + ', "comment": ' + self._encode(comment) + "}"
+        )
+
+    # Get the JSON encoding of a comment of a post, None if it doesn't exist.
+    def get_comment_json(self, post_id, comment_id):
+        comment = self._get_comment(post_id, comment_id)
+        return None if comment is None else self._encode(comment)
+
+    # Get the Comment record of a post, None if it doesn't exist.
+    def _get_comment(self, post_id, comment_id):
+        comments_onepost = self._comments.get(post_id)
+        if comments_onepost is None:
+            return None
+        return comments_onepost.get(comment_id)
+
+    """
+    Writes.
+    """
+
+    # Creations that reject reposts are serialised, so that two of them
+    # can't both find no repost and create the same link twice.
+    def create_post(self, title, link, username, reject_repost=False, ttl=None):
+        if not reject_repost:
+            return self._create_post(title, link, username, ttl)
+        with self._repost_lock:
+            if self.link_post_ids(link):
+                return None
+            return self._create_post(title, link, username, ttl)
+
+    # O(1) lookup in the normalised link index.
+    def link_post_ids(self, link):
+        return list(self._link_posts.get(normalize_link(link), ()))
+
+    # Create a new post with one upvote and return it.
+    def _create_post(self, title, link, username, ttl):
+        created = time.time()
+        expires = None if ttl is None else created + ttl
+        # default the upvotes of the new post to 1.
+        post = Post(self._allocate_post_id(), 1, title, link, username, created, expires)
+        try:
+            with self._lock(post.id):
+                self._insert_post(post)
+                self._log({"op": "create_post", "post": post.to_dict()})
+        finally:
+            self._publish_post_id(post.id)
+        return post.to_dict()
+
+    # Delete a post by id.
+    # Returns the deleted post, None if it doesn't exist.
+    def delete_post(self, post_id):
+        with self._lock(post_id):
+            post = self._remove_post(post_id)
+            if post is None:
+                return None
+            self._log({"op": "delete_post", "post_id": post_id})
+        return post.to_dict()
+
+    # Add "increment" upvotes to a post.
+    # Returns the updated post, None if it doesn't exist.
+    def upvote_post(self, post_id, increment=1):
+        if self._upvote_shards:
+            post = self._buffer_upvotes(post_id, increment)
+            return None if post is None else post.to_dict()
+        with self._lock(post_id):
+            post = self._posts.get(post_id)
+            if post is None:
+                return None
+            updated = post.replace(upvotes=post.upvotes + increment)
+            self._replace_post(post, updated)
+            # log the new total rather than the increment, so replaying is idempotent.
+            self._log({"op": "upvote_post", "post_id": post_id, "upvotes": updated.upvotes})
+        return updated.to_dict()
+
+    # Duplicate votes are rejected in O(1) by the post's VoterSet, and aren't logged.
+    def vote_post(self, post_id, voter):
+        return self._change_vote(post_id, voter, 1)
+
+    def unvote_post(self, post_id, voter):
+        return self._change_vote(post_id, voter, -1)
+
+    # Add (delta = 1) or remove (delta = -1) the vote of a voter on a post.
+    def _change_vote(self, post_id, voter, delta):
+        with self._lock(post_id):
+            post = self._posts.get(post_id)
+            if post is None:
+                return None
+            updated = self._vote(post, voter, delta)
+            if updated is None:
+                return self._visible(post).to_dict(), False
+            op = "vote_post" if delta > 0 else "unvote_post"
+            self._log({"op": op, "post_id": post_id, "voter": voter, "upvotes": updated.upvotes})
+        return self._visible(updated).to_dict(), True
+
+    # Create a new comment with one upvote on a post and return it.
+    # Returns None if the post, or the parent comment, doesn't exist.
+    def create_comment(self, post_id, text, username, parent_id=None):
+        with self._lock(post_id):
+            if post_id not in self._posts:
+                return None
+            if parent_id is not None and self._get_comment(post_id, parent_id) is None:
+                return None
+            # default the upvotes of new comments to 1.
+            comment = Comment(self._allocate_comment_id(), 1, text, username, parent_id)
+            try:
+                self._insert_comment(post_id, comment)
+                self._log({"op": "create_comment", "post_id": post_id, "comment": comment.to_dict()})
+            finally:
+                self._publish_comment_id(comment.id)
+        return comment.to_dict()
+
+    # Replace the text of a comment.
+    # Returns the updated comment, None if it doesn't exist.
+    def edit_comment(self, post_id, comment_id, text):
+        with self._lock(post_id):
+            comment = self._get_comment(post_id, comment_id)
+            if comment is None:
+                return None
+            updated = comment.replace(text=text)
+            self._replace_comment(post_id, comment, updated)
+            self._log({"op": "edit_comment", "post_id": post_id, "comment_id": comment_id, "text": text})
+        return updated.to_dict()
@@ -0,0 +1,119 @@
+import math
+import sys
+
+# slots per level, as a power of two: 64 slots.
+SLOT_BITS = 6
+
+
+class TimingWheel(object):
+    """
+    Hierarchical timing wheel: schedules keys to expire at a deadline.
+
+    Time is cut into ticks. Level 0 has one slot per tick for the next 64
+    ticks, level 1 one slot per 64 ticks for the next 64 * 64 ticks, and so
+    on; keys further away than the last level wait in an overflow slot.
+    A key is put in the lowest level whose slots are fine enough for its
+    deadline. When the wheel turns into a new slot of a higher level, the
+    keys of that slot cascade to the lower levels, and the keys of the
+    level-0 slot of the current tick expire.
+
+    Scheduling and cancelling a key cost O(1), and a key cascades at most
+    once per level, so expiring it costs O(levels) = O(1). Nothing is ever
+    scanned to find what expired.
+
+    Not thread-safe: the caller guards the wheel with its own lock.
+    """
+
+    # Constructor.
+    # start -- time of the first tick, in seconds.
+    # tick -- seconds per tick, the precision of the deadlines.
+    # levels -- number of levels, the wheel spans 64 ** levels ticks.
+    def __init__(self, start, tick=1.0, levels=4):
+        self.tick = tick
+        self._slots = 1 << SLOT_BITS
+        self._mask = self._slots - 1
+        self._levels = levels
+        # levels of slots, each slot a dict key -> deadline tick.
+        self._wheels = [[{} for _ in range(self._slots)] for _ in range(levels)]
+        # keys beyond the last level, key -> deadline tick.
+        self._overflow = {}
+        # slot of every scheduled key, to cancel it in O(1).
+        self._where = {}
+        # last tick processed: deadlines up to this tick have expired.
+        self._now = math.floor(start / tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    # Approximate bytes of the wheel and its scheduled keys.
+    def __sizeof__(self):
+        slots = [slot for wheel in self._wheels for slot in wheel]
+        return (
+            object.__sizeof__(self) + sum(map(sys.getsizeof, self._wheels)) + sum(map(sys.getsizeof, slots))
+            + sys.getsizeof(self._overflow) + sys.getsizeof(self._where)
+        )
+
+    # Schedule "key" to expire at "deadline" seconds, replacing its previous deadline.
+    # A deadline in the past expires at the next tick.
+    def schedule(self, key, deadline):
+        self.cancel(key)
+        self._place(key, max(math.ceil(deadline / self.tick), self._now + 1))
+
+    # Unschedule "key". Returns False if it wasn't scheduled.
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        return True
+
+    # Put a key in the slot of its deadline tick.
+    def _place(self, key, deadline_tick):
+        for level in range(self._levels):
+            # the lowest level in whose current span the deadline falls.
+            shift = SLOT_BITS * (level + 1)
+            if deadline_tick >> shift == self._now >> shift:
+                slot = self._wheels[level][(deadline_tick >> (SLOT_BITS * level)) & self._mask]
+                break
+        else:
+            slot = self._overflow
+        slot[key] = deadline_tick
+        self._where[key] = slot
+
+    # Turn the wheel up to the time "now", in seconds.
+    # Returns the keys whose deadline passed, in deadline order.
+    def advance(self, now):
+        target = math.floor(now / self.tick)
+        expired = []
+        while self._now < target:
+            # an empty wheel jumps straight to the target.
+            if not self._where:
+                self._now = target
+                break
+            self._now += 1
+            self._cascade()
+            slot = self._wheels[0][self._now & self._mask]
+            if slot:
+                for key in slot:
+                    del self._where[key]
+                expired.extend(slot)
+                slot.clear()
+        return expired
+
+    # Move the keys of the slots the wheel just turned into down to the lower levels.
+    # Higher levels go first, so that their keys land in lower slots not yet cascaded.
+    def _cascade(self):
+        for level in range(self._levels, 0, -1):
+            if self._now & ((1 << (SLOT_BITS * level)) - 1):
+                continue
+            if level == self._levels:
+                slot = self._overflow
+            else:
+                slot = self._wheels[level][(self._now >> (SLOT_BITS * level)) & self._mask]
+            keys = list(slot.items())
+            slot.clear()
+            for key, deadline_tick in keys:
+                self._place(key, deadline_tick)
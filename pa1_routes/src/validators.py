@@ -0,0 +1,82 @@
+"""
+Input validators shared by the routes.
+"""
+
+# characters allowed at the end of a host by the original link pattern.
+HOST_SUFFIX_CHARS = frozenset(".com")
+# characters allowed in a path after its leading "/".
+PATH_CHARS = frozenset("/?%&=")
+
+
+# Whether "c" matches [\w-] in a str pattern.
+def is_word_char(c):
+    return c.isalnum() or c == "_" or c == "-"
+
+
+r"""
+Check a link against the pattern
+    (http(s)?://)?([\w-]+\.)+?[\w-]+[.com]+(/[/?%&=]*)?
+in a single pass, O(len(link)) whatever the input.
+
+The regular expression backtracks on crafted hosts such as "a.aaaa...!",
+this validator accepts and rejects exactly the same links without
+backtracking.
+"""
+def is_valid_link(link):
+    # the scheme is optional. ":" can't appear anywhere else,
+    # so if the link starts with a scheme it must be the scheme.
+    if link.startswith("https://"):
+        link = link[8:]
+    elif link.startswith("http://"):
+        link = link[7:]
+    # the host can't contain "/", so the path starts at the first "/".
+    slash = link.find("/")
+    if slash == -1:
+        host = link
+    else:
+        host = link[:slash]
+        if any(c not in PATH_CHARS for c in link[slash + 1:]):
+            return False
+    return is_valid_host(host)
+
+
+r"""
+Check a host against ([\w-]+\.)+[\w-]+[.com]+ in O(len(host)).
+
+The host must split into a head of two or more non-empty, dot-separated
+labels and a non-empty tail of ".com" characters. The head is valid for
+a whole range of split points, so it is enough to look for one split
+point inside that range that ends the head on a word character.
+"""
+def is_valid_host(host):
+    n = len(host)
+    # the tail can only start inside the longest suffix of ".com" characters.
+    tail_start = n
+    while tail_start > 0 and host[tail_start - 1] in HOST_SUFFIX_CHARS:
+        tail_start -= 1
+    # the head can only end inside the longest prefix that starts with a word
+    # character and contains only word characters and single dots.
+    head_end = 0
+    first_dot = -1
+    while head_end < n:
+        c = host[head_end]
+        if c == ".":
+            if head_end == 0 or host[head_end - 1] == ".":
+                break
+            if first_dot == -1:
+                first_dot = head_end
+        elif not is_word_char(c):
+            break
+        head_end += 1
+    # the head needs at least one dot.
+    if first_dot == -1:
+        return False
+    # look for a split point k: host[:k] is the head, host[k:] is the tail.
+    # the head must end with a word character after its first dot,
+    # and the tail must not be empty.
+    lowest = max(tail_start, first_dot + 2)
+    highest = min(head_end, n - 1)
+    for k in range(lowest, highest + 1):
+        if is_word_char(host[k - 1]):
+            return True
+    return False
@@ -0,0 +1,209 @@
+import heapq
+import sys
+import threading
+
+# bytes a voter id costs in a set: the hash table slot and the int object.
+SET_BYTES_PER_VOTER = 64
+
+
+class VoterRegistry(object):
+    """
+    Dense integer ids for voter names, shared by every post.
+    Each id counts the votes it holds: an id is released when the last vote of
+    its voter is gone, and released ids are reused, smallest first. The
+    registry, and the bitmaps of the VoterSets, thus stay proportional to the
+    number of voters with a vote, not to every voter that ever voted.
+
+    An id must only be looked up and used under the lock of the post whose
+    votes it changes: a post holding a vote of the id keeps it from being
+    released meanwhile.
+    """
+
+    # Constructor.
+    # names -- names of the ids 0, 1, ..., None for a released id, e.g. from a
+    # snapshot. Their votes are then counted by retain().
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        # id -> name (None once released), name -> id, and id -> number of votes.
+        self._names = []
+        self._ids = {}
+        self._votes = []
+        # released ids, a min-heap.
+        self._free = []
+        for voter_id, name in enumerate(names):
+            self._names.append(None if name is None else sys.intern(name))
+            self._votes.append(0)
+            if name is None:
+                self._free.append(voter_id)
+            else:
+                self._ids[self._names[-1]] = voter_id
+        heapq.heapify(self._free)
+
+    # Number of registered voters.
+    def __len__(self):
+        return len(self._ids)
+
+    # Get the id of a voter, None if it has no vote.
+    def get(self, name):
+        return self._ids.get(name)
+
+    # Get the id of a voter for a new vote, allocating one if it has no vote.
+    # The vote is counted: release() it if the vote isn't recorded after all.
+    def acquire(self, name):
+        with self._lock:
+            voter_id = self._ids.get(name)
+            if voter_id is None:
+                name = sys.intern(name)
+                if self._free:
+                    voter_id = heapq.heappop(self._free)
+                    self._names[voter_id] = name
+                else:
+                    voter_id = len(self._names)
+                    self._names.append(name)
+                    self._votes.append(0)
+                self._ids[name] = voter_id
+            self._votes[voter_id] += 1
+            return voter_id
+
+    # Count one more vote of a registered id, e.g. loaded from a snapshot.
+    def retain(self, voter_id):
+        with self._lock:
+            self._votes[voter_id] += 1
+
+    # Uncount one vote of an id, releasing the id with its last vote.
+    def release(self, voter_id):
+        with self._lock:
+            self._votes[voter_id] -= 1
+            if not self._votes[voter_id]:
+                self._free_id(voter_id)
+
+    # Release every id without votes, e.g. of an older snapshot.
+    def release_unused(self):
+        with self._lock:
+            for voter_id, name in enumerate(self._names):
+                if name is not None and not self._votes[voter_id]:
+                    self._free_id(voter_id)
+
+    # Requires: the registry lock is held.
+    def _free_id(self, voter_id):
+        del self._ids[self._names[voter_id]]
+        self._names[voter_id] = None
+        heapq.heappush(self._free, voter_id)
+
+    # Get the name of an id.
+    def name(self, voter_id):
+        return self._names[voter_id]
+
+    # Names of all ids, in id order, None for the released ones.
+    def names(self):
+        with self._lock:
+            return self._names[:]
+
+    # Approximate bytes of the registry, names included.
+    def __sizeof__(self):
+        with self._lock:
+            names = [name for name in self._names if name is not None]
+            return (
+                object.__sizeof__(self) + sys.getsizeof(self._names) + sys.getsizeof(self._ids)
+                + sys.getsizeof(self._votes) + sys.getsizeof(self._free) + sum(map(sys.getsizeof, names))
+            )
+
+
+class VoterSet(object):
+    """
+    Set of the voter ids of one post, in the most compact of two forms:
+        a set of ids, while few users voted,
+        a bitmap with one bit per registered id, once a set would be larger.
+    Both answer membership in O(1). The bitmap takes max_id / 8 bytes, so
+    1M voters fit in 125 KiB instead of tens of MiB for a set of ints.
+
+    Not thread-safe: a post's voters are guarded by the post's lock.
+    """
+
+    __slots__ = ("_ids", "_bits", "_len", "_max")
+
+    # Constructor.
+    def __init__(self, ids=()):
+        self._ids = set()
+        # bitmap of the ids, None while the ids are kept as a set.
+        self._bits = None
+        self._len = 0
+        # largest id ever added to the set of ids.
+        self._max = 0
+        for voter_id in ids:
+            self.add(voter_id)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, voter_id):
+        if self._bits is None:
+            return voter_id in self._ids
+        byte = voter_id >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (voter_id & 7)))
+
+    def __iter__(self):
+        if self._bits is None:
+            yield from sorted(self._ids)
+            return
+        for byte, value in enumerate(self._bits):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield (byte << 3) | bit
+
+    # Add a voter id.
+    # Returns False if it was already in the set.
+    def add(self, voter_id):
+        if voter_id in self:
+            return False
+        if self._bits is None:
+            self._ids.add(voter_id)
+            self._max = max(self._max, voter_id)
+            # switch to a bitmap once it is smaller than the set.
+            if len(self._ids) * SET_BYTES_PER_VOTER > self._max // 8 + 1:
+                self._to_bitmap()
+        else:
+            byte = voter_id >> 3
+            if byte >= len(self._bits):
+                # grow geometrically so that increasing ids append in amortised O(1).
+                self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits) // 2)))
+            self._bits[byte] |= 1 << (voter_id & 7)
+        self._len += 1
+        return True
+
+    # Remove a voter id.
+    # Returns False if it wasn't in the set.
+    def discard(self, voter_id):
+        if voter_id not in self:
+            return False
+        if self._bits is None:
+            self._ids.discard(voter_id)
+        else:
+            self._bits[voter_id >> 3] &= ~(1 << (voter_id & 7)) & 0xFF
+        self._len -= 1
+        return True
+
+    # Return an independent copy of the set.
+    def copy(self):
+        other = VoterSet()
+        other._ids = set(self._ids)
+        other._bits = None if self._bits is None else bytearray(self._bits)
+        other._len = self._len
+        other._max = self._max
+        return other
+
+    # Replace the set of ids by a bitmap.
+    def _to_bitmap(self):
+        bits = bytearray(self._max // 8 + 1)
+        for voter_id in self._ids:
+            bits[voter_id >> 3] |= 1 << (voter_id & 7)
+        self._bits = bits
+        self._ids = set()
+
+    # Approximate bytes of the set of ids or of the bitmap.
+    def __sizeof__(self):
+        size = object.__sizeof__(self) + sys.getsizeof(self._ids)
+        if self._bits is None:
+            return size + len(self._ids) * sys.getsizeof(0)
+        return size + sys.getsizeof(self._bits)
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+
+# prefix and suffix of log segment file names, e.g. wal-00000000000000000001.log
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".log"
+SNAPSHOT_NAME = "snapshot.ndjson"
+
+
+class WriteAheadLog(object):
+    """
+    Append-only log of store mutations, one JSON object per line, plus
+    periodic snapshots of the whole store.
+
+    Every entry gets a log sequence number ("lsn"). The log is split into
+    segments: taking a snapshot starts a new segment, and once the snapshot
+    is safely on disk the older segments are deleted. Recovery loads the
+    snapshot and replays the entries logged after it.
+
+    Durability is a trade-off with write throughput, chosen by sync_every:
+        1 -- fsync after every entry, nothing acknowledged is ever lost.
+        n -- fsync once per group of n entries, a crash loses at most n - 1 entries.
+        0 -- never fsync, leave flushing to the operating system.
+    """
+
+    # Constructor.
+    # directory -- where segments and snapshots are kept, created if needed.
+    # sync_every -- fsync policy, see above.
+    # snapshot_every -- number of entries after which a snapshot is due, 0 to disable.
+    def __init__(self, directory, sync_every=1, snapshot_every=100_000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sync_every = sync_every
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        # lsn of the last entry on disk.
+        self.last_lsn, last_segment = self._recover_last_segment()
+        self._unsynced = 0
+        self._since_snapshot = 0
+        # keep appending to the newest segment, if any.
+        self._file = None
+        if last_segment is None:
+            self._open_segment()
+        else:
+            self._file = open(last_segment, "a", encoding="utf-8")
+
+    # Path of the segment whose first entry is "first_lsn".
+    def _segment_path(self, first_lsn):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{first_lsn:020d}{SEGMENT_SUFFIX}")
+
+    # Paths of all segments, oldest first.
+    def _segments(self):
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    # Find the lsn of the last entry on disk, by reading only the newest segment.
+    # A torn last line, left by a crash in the middle of a write, is cut off
+    # so that new entries start on a fresh line.
+    # Returns (lsn, path of the newest segment or None).
+    def _recover_last_segment(self):
+        segments = self._segments()
+        if not segments:
+            return 0, None
+        path = segments[-1]
+        # an empty segment still tells which lsn comes next.
+        name = os.path.basename(path)
+        last_lsn = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) - 1
+        good_size = 0
+        with open(path, "rb") as segment:
+            for line in segment:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    last_lsn = json.loads(line)["lsn"]
+                except ValueError:
+                    break
+                good_size += len(line)
+        if good_size != os.path.getsize(path):
+            os.truncate(path, good_size)
+        return last_lsn, path
+
+    # Start a new segment for the entries after last_lsn.
+    # Requires: the log lock is held, or the log isn't shared yet.
+    def _open_segment(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        self._file = open(self._segment_path(self.last_lsn + 1), "a", encoding="utf-8")
+
+    # Flush and fsync the current segment.
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    # Yield every entry of every segment in lsn order.
+    # A torn last line, left by a crash in the middle of a write, is ignored.
+    def _read_segments(self):
+        for path in self._segments():
+            with open(path, encoding="utf-8") as segment:
+                for line in segment:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        break
+
+    # Append an entry to the log and give it the next lsn.
+    # Returns True when enough entries were logged that a snapshot is due.
+    def append(self, entry):
+        with self._lock:
+            self.last_lsn += 1
+            entry["lsn"] = self.last_lsn
+            self._file.write(json.dumps(entry) + "\n")
+            self._unsynced += 1
+            if self.sync_every and self._unsynced >= self.sync_every:
+                self._sync()
+            elif not self.sync_every:
+                self._file.flush()
+            self._since_snapshot += 1
+            return bool(self.snapshot_every) and self._since_snapshot >= self.snapshot_every
+
+    # Yield the logged entries with an lsn greater than "after_lsn", in order.
+    def replay(self, after_lsn=0):
+        for entry in self._read_segments():
+            if entry["lsn"] > after_lsn:
+                yield entry
+
+    # Start a new segment and return the lsn of the last entry of the old ones.
+    # Called while the store is paused, so that the snapshot taken at the same
+    # time contains exactly the entries up to this lsn.
+    def rotate(self):
+        with self._lock:
+            self._open_segment()
+            self._since_snapshot = 0
+            return self.last_lsn
+
+    # Write a snapshot covering every entry up to "lsn".
+    # "lines" yields the JSON-serialisable lines of the snapshot body.
+    # The snapshot replaces the previous one atomically, then the segments
+    # it covers are deleted.
+    def write_snapshot(self, lsn, lines):
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as snapshot:
+            snapshot.write(json.dumps({"lsn": lsn}) + "\n")
+            for line in lines:
+                snapshot.write(json.dumps(line) + "\n")
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_path, path)
+        # every segment older than the one starting after "lsn" is covered.
+        first_kept = self._segment_path(lsn + 1)
+        for segment in self._segments():
+            if segment < first_kept:
+                os.remove(segment)
+
+    # Read the latest snapshot.
+    # Returns (lsn, iterator over the body lines), or None if there is none.
+    def read_snapshot(self):
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if not os.path.exists(path):
+            return None
+        snapshot = open(path, encoding="utf-8")
+        lsn = json.loads(snapshot.readline())["lsn"]
+
+        def lines():
+            with snapshot:
+                for line in snapshot:
+                    yield json.loads(line)
+        return lsn, lines()
+
+    # Flush everything to disk and close the log.
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
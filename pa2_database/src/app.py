@@ -1,11 +1,24 @@
 import json
 from flask import Flask, request
 import db
-import hashlib
 import os
+import passwords
 
 # Initialize database connection.
 DB = db.DatabaseDriver()
+# Password hashing pool.
+HASHER = passwords.Hasher(
+    iterations=int(os.environ.get("PBKDF2_ITERATIONS", passwords.DEFAULT_ITERATIONS)),
+    workers=int(os.environ.get("HASH_WORKERS", passwords.DEFAULT_WORKERS)),
+    queue=int(os.environ.get("HASH_QUEUE", passwords.DEFAULT_QUEUE)),
+)
+# Cache of verified credentials, if CREDENTIAL_CACHE_TTL is set (in seconds).
+CREDENTIALS = None
+if float(os.environ.get("CREDENTIAL_CACHE_TTL", 0)) > 0:
+    CREDENTIALS = passwords.CredentialCache(
+        float(os.environ["CREDENTIAL_CACHE_TTL"]),
+        int(os.environ.get("CREDENTIAL_CACHE_SIZE", passwords.DEFAULT_CACHE_SIZE)),
+    )
 
 app = Flask(__name__)
 
@@ -38,6 +51,63 @@ Returns:
 def failure_response(message, code=404):
     return json.dumps({"error": message}), code
 
+"""
+Support function:
+Check a password against the stored hash of a user, in the hashing pool.
+If the stored hash is in an outdated format, it is replaced by a current one.
+With a credential cache, passwords verified recently are accepted at once.
+Requires:
+    user -- dict object with the user's info and stored password hash
+    password -- string object with the password sent
+Returns:
+    True if the password is correct, False otherwise
+"""
+def check_password(user, password):
+    if CREDENTIALS is not None and CREDENTIALS.get(user["id"], password, user["password"]):
+        return True
+    matches, upgraded = HASHER.verify(password, user["password"])
+    if upgraded is not None:
+        DB.update_user_password(user["id"], upgraded, user["password"])
+    if matches and CREDENTIALS is not None:
+        CREDENTIALS.put(user["id"], password, upgraded or user["password"])
+    return matches
+
+"""
+Support function:
+Report 503 when too many passwords are already being hashed.
+"""
+@app.errorhandler(passwords.HasherBusy)
+def hasher_busy(error):
+    return failure_response("Server busy, try again later!", 503)
+
+"""
+Support function:
+Move money between two users in one database transaction, debiting the
+sender only if its balance covers the amount.
+Requires:
+    body -- dict object with the request info, returned on success
+    sender_id, receiver_id -- integers with the ids of existing users
+    amount -- integer, if negative the receiver sends money to the sender
+Returns:
+    body contents or error -- json file
+    code -- integer
+"""
+def execute_transfer(body, sender_id, receiver_id, amount):
+    # If amount is negative, it is same as receiver send money to sender.
+    if amount >= 0:
+        done = DB.transfer(sender_id, receiver_id, amount)
+        overdraw = "Sender overdraw balance!"
+    else:
+        done = DB.transfer(receiver_id, sender_id, -amount)
+        overdraw = "Receiver overdraw balance!"
+    # A user may have been deleted since it was read.
+    if done is None:
+        return failure_response("User not found!")
+    # If amount exceeds the balance of who pays, return 400 bad request error.
+    if not done:
+        return failure_response(overdraw, 400)
+    return success_response(body)
+
 """
 Support functions end here.
 """
@@ -105,6 +175,8 @@ def delete_user(user_id):
     # If user exists, delete it.
     if user is not None:
         DB.delete_user(user_id)
+        if CREDENTIALS is not None:
+            CREDENTIALS.invalidate(user_id)
         return success_response(user, 200)
     # If not found, return 404 not found error.
     return failure_response("User not found!")
@@ -133,23 +205,8 @@ def transfer_money():
     # If any user doesn't exist, return 404 not found error.
     if sender is None or receiver is None:
         return failure_response("User not found!")
-    # Check the amount is not larger than sender's balance. If amount exceeds sender's balance, return 400 bad request error.
-    sender_balance = sender["balance"]
-    receiver_balance = receiver["balance"]
-    if amount > sender_balance:
-        return failure_response("Sender overdraw balance!", 400)
-    # Extra check:
-    # If amount is negative, it is same as receiver send money to sender.
-    if amount < -receiver_balance:
-        return failure_response("Receiver overdraw balance!", 400)
-    # If every check is passed, execute the transfer process.
-    # Calculate new balance of sender and receiver.
-    sender_balance_after = sender_balance - amount
-    receiver_balance_after = receiver_balance + amount
-    # Update user's balance in database.
-    DB.update_user_balance(sender_id, sender_balance_after)
-    DB.update_user_balance(receiver_id, receiver_balance_after)
-    return success_response(body)
+    # Execute the transfer in one transaction.
+    return execute_transfer(body, sender_id, receiver_id, amount)
 
 """
 Routes end here.
@@ -184,18 +241,11 @@ def create_user_with_auth():
     if len(password) < 1:
         return failure_response("Password can't be empty!", 400)
     
-    # Hash password.
-    sha512 = hashlib.sha512()
-    # Password salting.
-    salted_password = password + os.environ.get("PASSWORD_SALT")
-    # Iterative hashing.
-    iterations = os.environ.get("NUMBER_OF_ITERATIONS")
-    for i in range(int(iterations)):
-        sha512.update(salted_password.encode("utf-8"))
-        salted_password = sha512.hexdigest()
+    # Hash password, with a random salt, in the hashing pool.
+    password_hash = HASHER.hash(password)
 
     # Pass inputs into the database.
-    user_id = DB.create_user_withpassword(name, username, balance, sha512.hexdigest())
+    user_id = DB.create_user_withpassword(name, username, balance, password_hash)
     # If the creation fails, report 500 error.
     user = DB.get_user(user_id)
     if user is None:
@@ -240,15 +290,7 @@ def get_user_with_auth(user_id):
     if type(password) is not str:
         return failure_response("Incorrect password type! (string required)", 401)
     # Case 3: password sent is incorrect.
-    # Encode sent password.
-    sha512 = hashlib.sha512()
-    # Password salting.
-    salted_password = password + os.environ.get("PASSWORD_SALT") # string
-    iterations = os.environ.get("NUMBER_OF_ITERATIONS")
-    for i in range(int(iterations)):
-        sha512.update(salted_password.encode("utf-8"))
-        salted_password = sha512.hexdigest()
-    if sha512.hexdigest() != user_password:
+    if not check_password(user, password):
         return failure_response("Password incorrect!", 401)
     # If password is perfectly correct, return the requested user with password.
     user_with_original_password = {
@@ -298,35 +340,11 @@ def transfer_money_with_auth():
         if type(password) is not str:
             return failure_response("Incorrect password type! (string required)", 401)
         # Case 3: password sent is incorrect.
-        # Encode sent password
-        sha512 = hashlib.sha512()
-        # Password salting.
-        salted_password = password + os.environ.get("PASSWORD_SALT") # string
-        # Iterative hashing.
-        iterations = os.environ.get("NUMBER_OF_ITERATIONS")
-        for i in range(int(iterations)):
-            sha512.update(salted_password.encode("utf-8"))
-            salted_password = sha512.hexdigest()
-        if sha512.hexdigest() != user_password:
+        if not check_password(sender, password):
             return failure_response("Password incorrect!", 401)
     
-    # Check the amount is not larger than sender's balance. If amount exceeds sender's balance, return 400 bad request error.
-    sender_balance = sender["balance"]
-    receiver_balance = receiver["balance"]
-    if amount > sender_balance:
-        return failure_response("Sender overdraw balance!", 400)
-    # Extra check:
-    # If amount is negative, it is same as receiver send money to sender.
-    if amount < -receiver_balance:
-        return failure_response("Receiver overdraw balance!", 400)
-    # If every check is passed, execute the transfer process.
-    # Calculate new balance of sender and receiver.
-    sender_balance_after = sender_balance - amount
-    receiver_balance_after = receiver_balance + amount
-    # Update user's balance in database.
-    DB.update_user_balance(sender_id, sender_balance_after)
-    DB.update_user_balance(receiver_id, receiver_balance_after)
-    return success_response(body)
+    # Execute the transfer in one transaction.
+    return execute_transfer(body, sender_id, receiver_id, amount)
 
 """
 Extra routes end here.
@@ -0,0 +1,71 @@
+"""
+Benchmark: authenticated transfers (/api/extra/send/) of users sending
+SENDS payments each, with and without the credential cache. Reports the
+cache's hit rate and the p50 / p99 latency of a transfer: without the cache
+every transfer re-derives the sender's PBKDF2 hash, with it only the first
+transfer of each user does.
+
+Usage: python benchmarks/bench_auth_transfers.py [users]
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PASSWORD_SALT", "bench")
+os.environ.setdefault("NUMBER_OF_ITERATIONS", "1000")
+# the database file is created in the working directory.
+os.chdir(tempfile.mkdtemp())
+
+import app
+import passwords
+
+USERS = 5
+SENDS = 10
+TTL = 60.0
+PASSWORD = "abc123"
+
+
+# Create n users with a password and a receiver. Returns (user ids, receiver id).
+def populate(client, n):
+    ids = []
+    for i in range(n + 1):
+        body = {"name": f"User {i}", "username": f"user{i}", "balance": SENDS, "password": PASSWORD}
+        ids.append(json.loads(client.post("/api/extra/users/", data=json.dumps(body)).data)["id"])
+    return ids[:-1], ids[-1]
+
+
+# Every user sends SENDS payments of 1 to the receiver, in turn.
+# Returns the latency of every transfer, in seconds.
+def send_all(client, senders, receiver):
+    latencies = []
+    for _ in range(SENDS):
+        for sender in senders:
+            body = {"sender_id": sender, "receiver_id": receiver, "amount": 1, "password": PASSWORD}
+            start = time.perf_counter()
+            res = client.post("/api/extra/send/", data=json.dumps(body))
+            latencies.append(time.perf_counter() - start)
+            assert res.status_code == 200, res.data
+    return latencies
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+    client = app.app.test_client()
+    print(f"{'cache':>6} {'transfers':>10} {'hit rate':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode in ("off", "on"):
+        app.CREDENTIALS = passwords.CredentialCache(TTL) if mode == "on" else None
+        senders, receiver = populate(client, n)
+        latencies = send_all(client, senders, receiver)
+        hit_rate = app.CREDENTIALS.stats()["hit_rate"] if app.CREDENTIALS is not None else 0.0
+        p50 = statistics.median(latencies) * 1e3
+        p99 = statistics.quantiles(latencies, n=100)[98] * 1e3
+        print(f"{mode:>6} {len(latencies):>10} {hit_rate:>9.2f} {p50:>8.2f} {p99:>8.2f}")
+    app.HASHER.close()
+
+
+if __name__ == "__main__":
+    main()
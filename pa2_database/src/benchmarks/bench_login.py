@@ -0,0 +1,63 @@
+"""
+Benchmark: password verifications (logins) per second, and per core, of
+    legacy -- the old format, NUMBER_OF_ITERATIONS rounds of SHA-512 in a Python loop,
+    pbkdf2 -- the versioned format, PBKDF2-HMAC-SHA512 run in C by hashlib,
+with 1 and with CPU-count verifying threads. pbkdf2 is run both with the
+same number of iterations as legacy, to compare the cost of a round, and
+with the default number of iterations of new hashes. The legacy loop holds
+the GIL, so it doesn't scale with threads; PBKDF2 releases it.
+
+Usage: python benchmarks/bench_login.py [legacy iterations]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords
+
+ITERATIONS = 10_000
+PASSWORD = "abc123"
+DURATION = 2.0
+
+
+# Verify the password against "stored" in "threads" threads for DURATION seconds.
+# Returns verifications per second.
+def logins_per_second(stored, iterations, threads):
+    deadline = time.perf_counter() + DURATION
+
+    def worker():
+        count = 0
+        while time.perf_counter() < deadline:
+            matches, _ = passwords.verify_password(PASSWORD, stored, iterations)
+            assert matches
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        counts = list(pool.map(lambda _: worker(), range(threads)))
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else ITERATIONS
+    os.environ.setdefault("PASSWORD_SALT", "bench")
+    os.environ["NUMBER_OF_ITERATIONS"] = str(iterations)
+    cores = os.cpu_count() or 1
+    schemes = [
+        ("legacy", iterations, passwords.legacy_hash(PASSWORD)),
+        ("pbkdf2", iterations, passwords.hash_password(PASSWORD, iterations)),
+        ("pbkdf2", passwords.DEFAULT_ITERATIONS, passwords.hash_password(PASSWORD, passwords.DEFAULT_ITERATIONS)),
+    ]
+    print(f"{'scheme':>7} {'iterations':>11} {'threads':>8} {'logins/s':>9} {'logins/s/core':>14}")
+    for name, rounds, stored in schemes:
+        for threads in sorted({1, cores}):
+            rate = logins_per_second(stored, rounds, threads)
+            print(f"{name:>7} {rounds:>11} {threads:>8} {rate:>9.1f} {rate / min(threads, cores):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
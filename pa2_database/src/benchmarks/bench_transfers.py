@@ -0,0 +1,92 @@
+"""
+Benchmark: concurrent transfers between USERS users, from THREADS threads,
+for DURATION seconds. Compares
+    legacy -- read both users, check the balance in Python, then two separate
+              balance updates that each commit, what the routes used to do,
+    transfer -- DatabaseDriver.transfer, a conditional debit and a credit in
+                one BEGIN IMMEDIATE transaction.
+Reports transfers per second, whether the total balance is conserved and
+how many balances went negative. The transfer mode asserts conservation.
+
+Usage: python benchmarks/bench_transfers.py [threads]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+USERS = 20
+BALANCE = 100
+THREADS = 8
+DURATION = 3.0
+
+
+# The old route logic: two reads, a check, and two committed updates.
+def legacy_transfer(driver, sender_id, receiver_id, amount):
+    sender = driver.get_user(sender_id)
+    receiver = driver.get_user(receiver_id)
+    if amount > sender["balance"]:
+        return False
+    driver.update_user_balance(sender_id, sender["balance"] - amount)
+    driver.update_user_balance(receiver_id, receiver["balance"] + amount)
+    return True
+
+
+# Send random amounts between random users until "stop" is set.
+def worker(driver, transfer, ids, seed, stop, counts):
+    rng = random.Random(seed)
+    count = 0
+    while not stop.is_set():
+        sender_id, receiver_id = rng.sample(ids, 2)
+        if transfer(driver, sender_id, receiver_id, rng.randrange(1, BALANCE)):
+            count += 1
+    counts.append(count)
+
+
+def run(transfer, threads):
+    # the database file is created in the working directory.
+    os.chdir(tempfile.mkdtemp())
+    driver = db.DatabaseDriver()
+    ids = [driver.create_user(f"User {i}", f"user{i}", BALANCE) for i in range(USERS)]
+    stop = threading.Event()
+    counts = []
+    workers = [
+        threading.Thread(target=worker, args=(driver, transfer, ids, seed, stop, counts))
+        for seed in range(threads)
+    ]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+    balances = [driver.get_user(user_id)["balance"] for user_id in ids]
+    driver.conn.close()
+    return sum(counts) / seconds, sum(balances), sum(balance < 0 for balance in balances)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else THREADS
+    expected = USERS * BALANCE
+    print(f"{'mode':>9} {'threads':>8} {'transfers/s':>12} {'total':>7} {'expected':>9} {'negative':>9}")
+    modes = [
+        ("legacy", legacy_transfer),
+        ("transfer", lambda driver, *args: driver.transfer(*args)),
+    ]
+    for mode, transfer in modes:
+        rate, total, negative = run(transfer, threads)
+        print(f"{mode:>9} {threads:>8} {rate:>12.0f} {total:>7} {expected:>9} {negative:>9}")
+        if mode == "transfer":
+            assert total == expected and negative == 0, "transfers didn't conserve money"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
 import sqlite3
+import threading
 
 # From: https://goo.gl/YzypOI
 def singleton(cls):
@@ -22,6 +23,9 @@ class DatabaseDriver(object):
     def __init__(self):
         # Initialize the connection.
         self.conn = sqlite3.connect("venmo.db", check_same_thread=False)
+        # The connection is shared by every request thread: writes hold this lock
+        # so that a commit never lands in the middle of another thread's transaction.
+        self.lock = threading.Lock()
         # Initialize the user table.
         self.create_user_table()
         # self.preload_user()
@@ -73,16 +77,17 @@ class DatabaseDriver(object):
     
     # Create a new user with id (autoincremented), name, username and balance
     def create_user(self, name, username, balance):
-        cursor = self.conn.execute(
-            """
-            INSERT INTO user (name, username, balance)
-            VALUES (?, ?, ?);
-            """,
-            (name, username, balance)
-        )
-        self.conn.commit()
-        # Return the new user's id.
-        return cursor.lastrowid
+        with self.lock:
+            cursor = self.conn.execute(
+                """
+                INSERT INTO user (name, username, balance)
+                VALUES (?, ?, ?);
+                """,
+                (name, username, balance)
+            )
+            self.conn.commit()
+            # Return the new user's id.
+            return cursor.lastrowid
 
     # Get a specific user's id, name, username and balance by id.
     def get_user(self, user_id):
@@ -109,26 +114,65 @@ class DatabaseDriver(object):
     # Delete a specific user by id.
     # Requires: only call this function after checking user is in database.
     def delete_user(self, user_id):
-        # cursor object with specific user (maybe not found) from the database by id.
-        cursor = self.conn.execute(
-            """
-            DELETE FROM user WHERE id = ?;
-            """,
-            (user_id, )
-        )
-        self.conn.commit()
+        with self.lock:
+            # cursor object with specific user (maybe not found) from the database by id.
+            cursor = self.conn.execute(
+                """
+                DELETE FROM user WHERE id = ?;
+                """,
+                (user_id, )
+            )
+            self.conn.commit()
 
     # Update a specific user's balance.
     # Requires: only call this function after checking user is in database.
     def update_user_balance(self, user_id, balance):
-        self.conn.execute(
-            """
-            UPDATE user SET balance = ?
-            WHERE id = ?;
-            """,
-            (balance, user_id)
-        )
-        self.conn.commit()
+        with self.lock:
+            self.conn.execute(
+                """
+                UPDATE user SET balance = ?
+                WHERE id = ?;
+                """,
+                (balance, user_id)
+            )
+            self.conn.commit()
+
+    # Move "amount" from the sender's balance to the receiver's in one transaction.
+    # The debit only happens if the sender's balance covers it, so concurrent
+    # transfers can never overdraw.
+    # Requires: amount >= 0.
+    # Returns True if the transfer was made, False if the sender's balance is
+    # too low, None if the sender or the receiver doesn't exist.
+    def transfer(self, sender_id, receiver_id, amount):
+        with self.lock:
+            # take the write lock at once, so no other writer slips between the two updates.
+            self.conn.execute("BEGIN IMMEDIATE;")
+            try:
+                debit = self.conn.execute(
+                    """
+                    UPDATE user SET balance = balance - ?
+                    WHERE id = ? AND balance >= ?;
+                    """,
+                    (amount, sender_id, amount)
+                )
+                if debit.rowcount == 0:
+                    self.conn.rollback()
+                    return None if self.get_user(sender_id) is None else False
+                credit = self.conn.execute(
+                    """
+                    UPDATE user SET balance = balance + ?
+                    WHERE id = ?;
+                    """,
+                    (amount, receiver_id)
+                )
+                if credit.rowcount == 0:
+                    self.conn.rollback()
+                    return None
+                self.conn.commit()
+                return True
+            except Exception:
+                self.conn.rollback()
+                raise
 
     """
     Extra functions start here.
@@ -137,15 +181,16 @@ class DatabaseDriver(object):
 
     # Create a new user with password.
     def create_user_withpassword(self, name, username, balance, password):
-        cursor = self.conn.execute(
-            """
-            INSERT INTO user (name, username, balance, password)
-            VALUES (?, ?, ?, ?)
-            """,
-            (name, username, balance, password)
-        )
-        self.conn.commit()
-        return cursor.lastrowid
+        with self.lock:
+            cursor = self.conn.execute(
+                """
+                INSERT INTO user (name, username, balance, password)
+                VALUES (?, ?, ?, ?)
+                """,
+                (name, username, balance, password)
+            )
+            self.conn.commit()
+            return cursor.lastrowid
     
     # Get user by id with password.
     def get_user_withpassword(self, user_id):
@@ -170,6 +215,19 @@ class DatabaseDriver(object):
         # if no user is found, return None.
         return None
 
+    # Replace a user's password hash, if it is still "old_password".
+    # A concurrent change of the password is never overwritten by an upgraded hash.
+    def update_user_password(self, user_id, password, old_password):
+        with self.lock:
+            self.conn.execute(
+                """
+                UPDATE user SET password = ?
+                WHERE id = ? AND password = ?;
+                """,
+                (password, user_id, old_password)
+            )
+            self.conn.commit()
+
     """
     Extra functions end here.
     """
\ No newline at end of file
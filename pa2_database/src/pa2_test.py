@@ -5,6 +5,8 @@ from time import sleep
 import unittest
 
 from app import app
+import app as server
+import passwords
 import requests
 
 # NOTE: Make sure you run 'pip3 install requests' in your virtualenv
@@ -352,6 +354,43 @@ class TestRoutes(unittest.TestCase):
         self._get_user_and_assert_balance(user_id1, 4)
         self._get_user_and_assert_balance(user_id2, 16)
 
+    def test_send_money_checks(self):
+        user_id1 = self._create_user_and_assert_balance(10).get("id")
+        user_id2 = self._create_user_and_assert_balance(10).get("id")
+        # insufficient funds, in both directions.
+        self._send_money(user_id1, user_id2, 11, 400)
+        self._send_money(user_id1, user_id2, -11, 400)
+        # unknown receiver, also if it disappears after the route looked it up.
+        self._send_money(user_id1, 1000, 1, 404)
+        self.assertIsNone(server.DB.transfer(user_id1, 1000, 1))
+        self._get_user_and_assert_balance(user_id1, 10)
+        self._get_user_and_assert_balance(user_id2, 10)
+
+    def test_send_money_concurrent(self):
+        user_ids = [self._create_user_and_assert_balance(50).get("id") for _ in range(4)]
+        statuses = []
+
+        # each thread sends money around the users, sometimes more than the sender has.
+        def send(offset):
+            for i in range(25):
+                body = {
+                    "sender_id": user_ids[(offset + i) % 4],
+                    "receiver_id": user_ids[(offset + i + 1) % 4],
+                    "amount": 10 + 7 * ((offset + i) % 7),
+                }
+                statuses.append(requests.post(gen_send_path(), data=json.dumps(body)).status_code)
+
+        threads = [Thread(target=send, args=(offset, )) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(set(statuses) <= {200, 400}, statuses)
+        balances = [requests.get(gen_users_path(user_id)).json().get("balance") for user_id in user_ids]
+        # no transfer is lost or overdraws.
+        self.assertEqual(sum(balances), 200)
+        self.assertTrue(all(balance >= 0 for balance in balances), balances)
+
     def test_get_invalid_user(self):
         req_type = "GET"
         route = gen_users_path(1000)
@@ -415,6 +454,49 @@ class TestRoutes(unittest.TestCase):
         user_id1 = user1.get("id")
         user_id2 = self._create_user_and_assert_balance(10, extra=True).get("id")
         self._send_money(user_id1, user_id2, 6, 401, password="bad" + user1.get("password"), extra=True)
+
+    def test_extra_legacy_password_upgraded(self):
+        if not EXTRA_CREDIT:
+            return
+        # a user whose password was hashed in the old, unversioned format.
+        password = EXTRA_SAMPLE_USER["password"]
+        user_id = server.DB.create_user_withpassword("Legacy User", "legacy", 5, passwords.legacy_hash(password))
+        route = gen_users_route(user_id, extra=True)
+        res = requests.post(gen_users_path(user_id, extra=True), data=json.dumps({"password": "bad" + password}))
+        self.jsonable_test(res, "POST", route, 401)
+        self.assertFalse(server.DB.get_user_withpassword(user_id)["password"].startswith(passwords.ALGORITHM))
+        # a successful login replaces the stored hash with a versioned one.
+        res = requests.post(gen_users_path(user_id, extra=True), data=json.dumps({"password": password}))
+        self.jsonable_test(res, "POST", route, 200)
+        upgraded = server.DB.get_user_withpassword(user_id)["password"]
+        self.assertTrue(upgraded.startswith(passwords.ALGORITHM + passwords.SEPARATOR))
+        res = requests.post(gen_users_path(user_id, extra=True), data=json.dumps({"password": password}))
+        self.jsonable_test(res, "POST", route, 200)
+        self.assertEqual(server.DB.get_user_withpassword(user_id)["password"], upgraded)
+
+    def test_credential_cache_expires(self):
+        cache = passwords.CredentialCache(ttl=0.05)
+        cache.put(1, "abc123", "stored")
+        self.assertTrue(cache.get(1, "abc123", "stored"))
+        self.assertFalse(cache.get(1, "bad", "stored"))
+        sleep(0.1)
+        self.assertFalse(cache.get(1, "abc123", "stored"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_credential_cache_password_update(self):
+        old_hash = server.HASHER.hash("old")
+        user_id = server.DB.create_user_withpassword("Cached User", "cached", 5, old_hash)
+        credentials = server.CREDENTIALS
+        server.CREDENTIALS = passwords.CredentialCache(ttl=60)
+        try:
+            self.assertTrue(server.check_password(server.DB.get_user_withpassword(user_id), "old"))
+            server.DB.update_user_password(user_id, server.HASHER.hash("new"), old_hash)
+            # the cached credential doesn't match the new hash, so the old password is rejected at once.
+            user = server.DB.get_user_withpassword(user_id)
+            self.assertFalse(server.check_password(user, "old"))
+            self.assertTrue(server.check_password(user, "new"))
+        finally:
+            server.CREDENTIALS = credentials
         
 
     
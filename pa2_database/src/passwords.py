@@ -0,0 +1,188 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Name and separator of the versioned hash format:
+#     pbkdf2_sha512$<iterations>$<salt hex>$<hash hex>
+ALGORITHM = "pbkdf2_sha512"
+SEPARATOR = "$"
+# Default number of PBKDF2 iterations for new hashes.
+DEFAULT_ITERATIONS = 210_000
+# Default number of hashing threads, and of requests allowed to wait for one.
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_QUEUE = 64
+# Default number of verified credentials kept by a CredentialCache.
+DEFAULT_CACHE_SIZE = 1024
+
+
+class HasherBusy(Exception):
+    """
+    Raised when too many password hashes are already queued.
+    """
+
+
+class Hasher(object):
+    """
+    Password hashing and verification, run in a bounded pool of threads.
+
+    New hashes use PBKDF2-HMAC-SHA512 with a random salt per password, in the
+    versioned format pbkdf2_sha512$<iterations>$<salt>$<hash>. The iterations
+    run in C inside hashlib, which releases the GIL, so the pool's threads
+    hash in parallel while the request threads only wait for the result.
+
+    Hashes in the old format (iterative SHA-512 over PASSWORD_SALT, done in a
+    Python loop) are still accepted. When such a password, or one with fewer
+    iterations than the current setting, is verified, a new hash is returned
+    so the caller can store it in place of the old one.
+
+    At most "workers" passwords are hashed at once and at most "queue" wait
+    for a thread; beyond that HasherBusy is raised at once, so a burst of
+    logins can't hold every request thread.
+    """
+
+    # Constructor.
+    # iterations -- PBKDF2 iterations of new hashes.
+    # workers -- number of hashing threads.
+    # queue -- number of hashes allowed to be running or waiting.
+    def __init__(self, iterations=DEFAULT_ITERATIONS, workers=DEFAULT_WORKERS, queue=DEFAULT_QUEUE):
+        self.iterations = iterations
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hasher")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    # Hash a password in the pool. Returns the versioned hash.
+    # Raises HasherBusy if the pool is saturated.
+    def hash(self, password):
+        return self._run(hash_password, password, self.iterations)
+
+    # Verify a password against a stored hash in the pool.
+    # Returns (matches, new hash to store or None if the stored one is current).
+    # Raises HasherBusy if the pool is saturated.
+    def verify(self, password, stored):
+        return self._run(verify_password, password, stored, self.iterations)
+
+    # Run a function in the pool and wait for its result.
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self._pool.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    # Stop the hashing threads.
+    def close(self):
+        self._pool.shutdown()
+
+
+class CredentialCache(object):
+    """
+    Short-lived cache of verified credentials, so a user sending several
+    requests in a row doesn't pay for key stretching on each of them.
+
+    Entries are keyed by user id and an HMAC-SHA256 digest of the password,
+    under a random key drawn when the cache is created; no password is ever
+    stored. Each entry remembers the stored hash it was verified against and
+    only matches that hash, so it is invalidated as soon as the stored hash
+    changes. Entries expire after "ttl" seconds, and the least recently used
+    ones are evicted beyond "size" entries.
+
+    Thread-safe.
+    """
+
+    # Constructor.
+    # ttl -- seconds a verified credential is trusted for.
+    # size -- maximum number of entries.
+    def __init__(self, ttl, size=DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        # (user id, password digest) -> (expiry time, stored hash), least recently used first.
+        self._entries = OrderedDict()
+
+    # True if "password" was verified against "stored" for the user less than ttl seconds ago.
+    def get(self, user_id, password, stored):
+        key = (user_id, self._digest(password))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic() or entry[1] != stored:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+    # Remember that "password" matches the stored hash "stored" of the user.
+    def put(self, user_id, password, stored):
+        key = (user_id, self._digest(password))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    # Forget every credential of a user.
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    # Hits, misses, hit rate and number of entries.
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    # Keyed digest of a password.
+    def _digest(self, password):
+        return hmac.new(self._key, password.encode("utf-8"), hashlib.sha256).digest()
+
+
+# Hash a password with PBKDF2-HMAC-SHA512 and a new random salt.
+# Returns the versioned hash.
+def hash_password(password, iterations=DEFAULT_ITERATIONS):
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha512", password.encode("utf-8"), salt, iterations)
+    return SEPARATOR.join([ALGORITHM, str(iterations), salt.hex(), digest.hex()])
+
+
+# Verify a password against a stored hash, in either format.
+# Returns (matches, new hash or None): the new hash, with the current number
+# of iterations, is given when the password matches an outdated hash.
+def verify_password(password, stored, iterations=DEFAULT_ITERATIONS):
+    parts = stored.split(SEPARATOR)
+    if parts[0] != ALGORITHM:
+        # hashes without a version are in the old format.
+        matches = hmac.compare_digest(legacy_hash(password), stored)
+        return matches, hash_password(password, iterations) if matches else None
+    _, rounds, salt, digest = parts
+    candidate = hashlib.pbkdf2_hmac("sha512", password.encode("utf-8"), bytes.fromhex(salt), int(rounds))
+    matches = hmac.compare_digest(candidate.hex(), digest)
+    if matches and int(rounds) < iterations:
+        return True, hash_password(password, iterations)
+    return matches, None
+
+
+# Hash of a password in the old format: NUMBER_OF_ITERATIONS rounds of
+# SHA-512 over the password salted with PASSWORD_SALT.
+def legacy_hash(password):
+    sha512 = hashlib.sha512()
+    salted_password = password + os.environ.get("PASSWORD_SALT")
+    for i in range(int(os.environ.get("NUMBER_OF_ITERATIONS"))):
+        sha512.update(salted_password.encode("utf-8"))
+        salted_password = sha512.hexdigest()
+    return sha512.hexdigest()